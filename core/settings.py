@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'expenses.middleware.QueryStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -66,12 +68,95 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Профиль БД выбирается переменной DB_ENGINE: sqlite (по умолчанию, локально) или postgres.
+# Нагрузку на обоих профилях можно сравнить командой run_load_test.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'rental'),
+            'USER': os.environ.get('DB_USER', 'rental'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Соединение живёт между запросами воркера (секунды; 0 — новое на каждый запрос),
+            # перед повторным использованием проверяется, что оно не оборвалось
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if os.environ.get('DB_POOL', '0') == '1':
+        # Пул соединений внутри процесса (psycopg[pool] из requirements.txt).
+        # С пулом CONN_MAX_AGE должен быть 0 — соединения держит сам пул.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    if os.environ.get('DB_PGBOUNCER', '0') == '1':
+        # За pgbouncer в режиме transaction серверные курсоры iterator() не переживают транзакцию
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL: чтение не ждёт записи; при занятой БД писатель ждёт до timeout секунд
+                # вместо мгновенного «database is locked»
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 20)),
+                # Пишущие транзакции сразу берут блокировку записи — без взаимных
+                # блокировок при повышении уровня с чтения до записи
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+
+# Кэш контекста страниц (expenses.usercache) и графиков потребления.
+# Поколение данных пользователя живёт в кэше, поэтому при нескольких процессах
+# (gunicorn -w N) кэш должен быть общим для всех: redis, memcached или db
+# (таблица создаётся командой createcachetable). LocMem — память одного процесса,
+# только для runserver и тестов; manage.py check --deploy предупреждает о нём.
+# Профиль postgres рассчитан на несколько процессов и по умолчанию берёт redis.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis' if DB_ENGINE == 'postgres' else 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'memcached':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ.get('MEMCACHED_LOCATION', '127.0.0.1:11211'),
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'expenses_cache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
-}
 
 
 # Password validation
@@ -129,4 +214,25 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # PDF настройки
-EASY_PDF_DEFAULT_ENGINE = 'weasyprint'
\ No newline at end of file
+EASY_PDF_DEFAULT_ENGINE = 'weasyprint'
+
+# Кэш готовых PDF-отчётов (ключ — хэш содержимого месяца)
+PDF_EXPORT_CACHE_DIR = BASE_DIR / 'pdf_cache'
+# True — отчёты формирует воркер (manage.py run_pdf_worker), False — прямо в запросе.
+# Включать вместе с запуском воркера: без него задания только копятся в очереди
+PDF_EXPORT_ASYNC = os.environ.get('PDF_EXPORT_ASYNC', '0') == '1'
+
+
+# Async-версии dashboard, графиков и страницы месяца — для запуска под ASGI (uvicorn core.asgi:application)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+
+# Замеры производительности (expenses.middleware.QueryStatsMiddleware)
+# Запись замеров в файл: выключена по умолчанию и всегда под manage.py test
+PERF_STATS_ENABLED = os.environ.get('PERF_STATS_ENABLED', '0') == '1' and sys.argv[1:2] != ['test']
+# Каталог var/ не отслеживается git (.gitignore)
+PERF_STATS_FILE = Path(os.environ.get('PERF_STATS_FILE', BASE_DIR / 'var' / 'perf_stats.jsonl'))
+PERF_STATS_MAX_BYTES = 10 * 1024 * 1024
+PERF_STATS_WINDOW = 20000  # сколько последних замеров учитывать в отчёте
+# Больше запросов на страницу — предупреждение в лог expenses.perf (при любом PERF_STATS_ENABLED)
+PERF_QUERY_BUDGET = int(os.environ.get('PERF_QUERY_BUDGET', 20))
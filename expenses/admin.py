@@ -1,8 +1,10 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import (
-    Apartment, ExpenseCategory, Expense,
-    MeterReading, Payment, PaymentAllocation, Credit
+    Apartment, ExpenseCategory, Expense, RecurringExpense, Tariff, TariffBand,
+    MeterReading, Payment, PaymentAllocation, Credit, CreditApplication, MonthlyLedger,
+    PDFExportJob
 )
+from .allocation import reverse_payments
 
 
 @admin.register(Apartment)
@@ -20,29 +22,71 @@ class ExpenseCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ['user', 'category', 'amount', 'paid_amount', 'debt', 'date']
-    list_filter = ['category', 'date', 'user']
+    list_display = ['user', 'apartment', 'category', 'amount', 'paid_amount', 'debt', 'date', 'billed']
+    list_filter = ['category', 'date', 'user', 'billed']
     search_fields = ['category__name', 'description']
     readonly_fields = ['debt']
 
     def debt(self, obj):
         return obj.debt  # ← ПРАВИЛЬНО (без скобок!)
     debt.short_description = 'Долг'
-    debt.admin_order_field = 'amount'  # для сортировки (опционально)
+    debt.admin_order_field = 'debt'
+
+
+@admin.register(RecurringExpense)
+class RecurringExpenseAdmin(admin.ModelAdmin):
+    list_display = ['apartment', 'category', 'amount', 'day', 'active']
+    list_filter = ['active']
+    list_select_related = ['apartment', 'category__user']
+    search_fields = ['category__user__username', 'category__name']
 
 
 @admin.register(MeterReading)
 class MeterReadingAdmin(admin.ModelAdmin):
-    list_display = ['user', 'type', 'value', 'date']
+    list_display = ['user', 'apartment', 'type', 'value', 'date']
     list_filter = ['type', 'date', 'user']
     search_fields = ['user__username']
 
 
+class TariffBandInline(admin.TabularInline):
+    model = TariffBand
+    extra = 1
+
+
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    list_display = ['meter_type', 'kind', 'rate', 'category_name', 'valid_from']
+    list_filter = ['meter_type', 'kind']
+    inlines = [TariffBandInline]
+
+
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
-    list_display = ['user', 'amount', 'date', 'description']
+    list_display = ['user', 'apartment', 'amount', 'date', 'description']
     list_filter = ['date', 'user']
     search_fields = ['description']
+    actions = ['reverse_selected']
+
+    def _reverse(self, queryset):
+        # Пачкой по каждой квартире — столько запросов, сколько квартир
+        reversed_count = 0
+        for apartment in Apartment.objects.filter(pk__in=queryset.values('apartment')):
+            reversed_count += reverse_payments(
+                apartment, queryset.filter(apartment=apartment).values_list('pk', flat=True)
+            )
+        return reversed_count
+
+    @admin.action(description='Отменить выбранные платежи (вернуть долг)')
+    def reverse_selected(self, request, queryset):
+        reversed_count = self._reverse(queryset)
+        self.message_user(request, f"Отменено платежей: {reversed_count}", messages.SUCCESS)
+
+    # Простое удаление оставило бы расходам оплату, которой больше нет
+    def delete_model(self, request, obj):
+        reverse_payments(obj.apartment, [obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        self._reverse(queryset)
 
 
 @admin.register(PaymentAllocation)
@@ -52,6 +96,23 @@ class PaymentAllocationAdmin(admin.ModelAdmin):
 
 @admin.register(Credit)
 class CreditAdmin(admin.ModelAdmin):
-    list_display = ['user', 'amount', 'date']
+    list_display = ['user', 'apartment', 'amount', 'remaining', 'payment', 'date']
     list_filter = ['date', 'user']
-    search_fields = ['user__username']
\ No newline at end of file
+    search_fields = ['user__username']
+
+
+@admin.register(CreditApplication)
+class CreditApplicationAdmin(admin.ModelAdmin):
+    list_display = ['credit', 'expense', 'amount', 'created_at']
+
+
+@admin.register(MonthlyLedger)
+class MonthlyLedgerAdmin(admin.ModelAdmin):
+    list_display = ['user', 'apartment', 'year', 'month', 'category', 'amount', 'paid', 'debt']
+    list_filter = ['year', 'user']
+
+
+@admin.register(PDFExportJob)
+class PDFExportJobAdmin(admin.ModelAdmin):
+    list_display = ['user', 'year', 'month', 'status', 'created_at', 'finished_at']
+    list_filter = ['status']
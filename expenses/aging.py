@@ -0,0 +1,100 @@
+from datetime import date, timedelta
+
+from django.db.models import Case, DecimalField, Sum, Value, When
+
+from .models import Expense
+
+AGING_CHUNK_SIZE = 2000
+AGING_TOP_ROWS = 100
+
+# Корзина → (название, возраст долга в днях от, до включительно; None — без верхней границы)
+AGING_BUCKETS = {
+    'days_0_30': ("0–30", 0, 30),
+    'days_31_60': ("31–60", 31, 60),
+    'days_61_90': ("61–90", 61, 90),
+    'days_90_plus': ("90+", 91, None),
+}
+
+# Разрез отчёта → поля группировки (values) и подписи колонок CSV
+AGING_GROUPS = {
+    'apartment': (
+        ('user__username', 'apartment_id', 'apartment__address'),
+        ["Владелец", "Квартира №", "Адрес"],
+    ),
+    'user': (
+        ('user__username',),
+        ["Владелец"],
+    ),
+}
+
+
+def aging_sums(today):
+    """
+    Аннотации Sum(Case(...)) по корзинам возраста долга и общий долг.
+
+    Возраст считается от даты расхода до today. Границы — даты, поэтому
+    условие сравнивает столбец date с константой, а не вычисляет разницу
+    по каждой строке. Расходы «из будущего» попадают в первую корзину.
+    """
+    zero = Value(0, output_field=DecimalField())
+    sums = {}
+    for key, (label, low, high) in AGING_BUCKETS.items():
+        condition = {'date__lte': today - timedelta(days=low)} if low else {}
+        if high is not None:
+            condition['date__gte'] = today - timedelta(days=high)
+        sums[key] = Sum(Case(When(then='debt', **condition), default=zero, output_field=DecimalField()))
+    sums['total_debt'] = Sum('debt')
+    return sums
+
+
+def _open_debts():
+    # Только строки с долгом — по частичному индексу expense_open_debt_idx
+    return Expense.objects.filter(debt__gt=0).order_by()
+
+
+def debt_aging(by='apartment', today=None, per_category=False):
+    """
+    Долги по корзинам возраста в разрезе квартир или пользователей
+    (per_category=True — ещё и по категориям). Один группирующий запрос,
+    строки — словари values(); самые старые долги идут первыми.
+    """
+    today = today or date.today()
+    fields, _ = AGING_GROUPS[by]
+    if per_category:
+        fields += ('category__name',)
+    return (
+        _open_debts()
+        .values(*fields)
+        .annotate(**aging_sums(today))
+        .order_by('-days_90_plus', '-total_debt', *fields)
+    )
+
+
+def aging_summary(today=None, top=AGING_TOP_ROWS, by='apartment'):
+    """
+    Данные страницы отчёта: итоги по всему портфелю, разбивка по категориям
+    и крупнейшие должники. Три запроса независимо от числа квартир.
+    """
+    today = today or date.today()
+    sums = aging_sums(today)
+    return {
+        'today': today,
+        'buckets': [(key, label) for key, (label, _, _) in AGING_BUCKETS.items()],
+        'totals': _open_debts().aggregate(**sums),
+        # Категории у каждого пользователя свои — складываем одноимённые
+        'by_category': list(
+            _open_debts().values('category__name').annotate(**sums).order_by('-total_debt', 'category__name')
+        ),
+        'rows': list(debt_aging(by, today)[:top]),
+    }
+
+
+def aging_csv_rows(by='apartment', today=None):
+    """Заголовок и строки CSV (разрез × категория); строки читаются из БД порциями"""
+    today = today or date.today()
+    fields, header = AGING_GROUPS[by]
+    yield header + ["Категория"] + [label for label, _, _ in AGING_BUCKETS.values()] + ["Итого"]
+
+    columns = fields + ('category__name',) + tuple(AGING_BUCKETS) + ('total_debt',)
+    rows = debt_aging(by, today, per_category=True).values_list(*columns)
+    yield from rows.iterator(chunk_size=AGING_CHUNK_SIZE)
@@ -0,0 +1,300 @@
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+
+from .models import Apartment, Expense, Payment, PaymentAllocation, Credit, CreditApplication
+from . import ledger, usercache
+
+# Порядок погашения: категории по приоритету, внутри категории — старые долги первыми
+WATERFALL_ORDER = ('category__priority', 'category__name', 'date', 'pk')
+
+
+class DebtRecord(NamedTuple):
+    """Открытый долг для предпросмотра — лёгкая запись вместо экземпляра Expense"""
+    expense_id: int
+    category: str
+    date: date
+    debt: Decimal
+
+
+def waterfall(amount, debts):
+    """
+    Разложить amount по долгам в переданном порядке.
+    Общая логика для настоящего распределения и предпросмотра.
+    Возвращает список пар (долг, сумма) и нераспределённый остаток.
+    """
+    remaining = amount
+    plan = []
+    for item in debts:
+        if remaining <= 0:
+            break
+
+        pay_here = min(item.debt, remaining)
+        if pay_here <= 0:
+            continue
+
+        plan.append((item, pay_here))
+        remaining -= pay_here
+    return plan, remaining
+
+
+def load_open_debts(apartment, **filters):
+    """
+    Все расходы квартиры с долгом — одним упорядоченным запросом.
+
+    Строки блокируются (SELECT ... FOR UPDATE), поэтому вызывать нужно
+    внутри transaction.atomic().
+    """
+    return list(
+        Expense.objects
+        .select_for_update(of=('self',))
+        .filter(apartment=apartment, debt__gt=0, **filters)
+        .order_by(*WATERFALL_ORDER)
+    )
+
+
+def allocate_payment(payment, debts=None, create_credit=True):
+    """
+    Распределить платёж по долгам «водопадом» и записать результат пачкой.
+
+    debts — заранее загруженный список из load_open_debts(); если не передан,
+    берутся все долги квартиры платежа. Остаток платежа оформляется как Credit.
+    Возвращает (список PaymentAllocation, Credit или None).
+    """
+    with transaction.atomic():
+        if debts is None:
+            debts = load_open_debts(payment.apartment_id)
+
+        plan, remaining = waterfall(payment.amount, debts)
+        allocations = []
+        changed = []
+        for expense, pay_here in plan:
+            expense.paid_amount += pay_here
+            changed.append(expense)
+            allocations.append(PaymentAllocation(payment=payment, expense=expense, amount=pay_here))
+
+        if changed:
+            Expense.objects.bulk_update(changed, ['paid_amount'])
+            PaymentAllocation.objects.bulk_create(allocations)
+            ledger.refresh_after_bulk([payment.user_id], map(ledger.ledger_key, changed))
+
+        credit = None
+        if remaining > 0 and create_credit:
+            credit = Credit.objects.create(
+                user_id=payment.user_id,
+                apartment_id=payment.apartment_id,
+                payment=payment,
+                amount=remaining,
+                remaining=remaining,
+                date=payment.date
+            )
+
+    return allocations, credit
+
+
+def allocate_payments(apartment, payments):
+    """
+    allocate_payment для пачки уже сохранённых платежей одной квартиры (импорт).
+
+    Долги загружаются и блокируются один раз, платежи гасят их по очереди
+    в порядке дат — результат тот же, что при поштучном распределении,
+    но записывается одним bulk_update и двумя bulk_create.
+    Возвращает (список PaymentAllocation, список Credit).
+    """
+    with transaction.atomic():
+        debts = load_open_debts(apartment)
+        allocations = []
+        credits = []
+        changed = {}
+        for payment in sorted(payments, key=lambda payment: (payment.date, payment.pk)):
+            plan, remaining = waterfall(payment.amount, debts)
+            for expense, pay_here in plan:
+                expense.paid_amount += pay_here
+                # expense.debt считает БД — следующему платежу нужен уже уменьшенный долг
+                expense.debt -= pay_here
+                changed[expense.pk] = expense
+                allocations.append(PaymentAllocation(payment=payment, expense=expense, amount=pay_here))
+            if remaining > 0:
+                credits.append(Credit(
+                    user_id=payment.user_id,
+                    apartment_id=apartment.pk,
+                    payment=payment,
+                    amount=remaining,
+                    remaining=remaining,
+                    date=payment.date
+                ))
+
+        if changed:
+            Expense.objects.bulk_update(changed.values(), ['paid_amount'])
+            PaymentAllocation.objects.bulk_create(allocations)
+            ledger.refresh_after_bulk([apartment.user_id], map(ledger.ledger_key, changed.values()))
+        if credits:
+            Credit.objects.bulk_create(credits)
+
+    return allocations, credits
+
+
+def load_debt_records(apartment):
+    """Открытые долги в порядке «водопада» — один запрос, без блокировок"""
+    rows = (
+        Expense.objects
+        .filter(apartment=apartment, debt__gt=0)
+        .order_by(*WATERFALL_ORDER)
+        .values_list('pk', 'category__name', 'date', 'debt')
+    )
+    return [DebtRecord(*row) for row in rows]
+
+
+def preview_allocation(apartment, amount):
+    """
+    Как распределится платёж amount в квартире — без записи и блокировок.
+
+    Список долгов кэшируется до следующего изменения данных пользователя,
+    так что повторные вызовы (на каждое нажатие клавиши) обходятся без запросов.
+    Возвращает (список пар (DebtRecord, сумма), остаток, который станет кредитом).
+    """
+    debts = usercache.get_or_compute(
+        apartment.user_id, 'open_debts', apartment.pk, lambda: load_debt_records(apartment)
+    )
+    return waterfall(amount, debts)
+
+
+def apply_credits(apartment, expenses=None):
+    """
+    Погасить долги квартиры её кредитами: старые кредиты тратятся первыми (FIFO),
+    долги — в порядке «водопада». expenses — только что добавленные расходы;
+    если не переданы, гасятся все открытые долги квартиры.
+
+    Всё пишется пачкой в одной транзакции; каждое списание оставляет CreditApplication.
+    Возвращает список CreditApplication.
+    """
+    with transaction.atomic():
+        credits = list(
+            Credit.objects
+            .select_for_update()
+            .filter(apartment=apartment, remaining__gt=0)
+            .order_by('date', 'pk')
+        )
+        if not credits:
+            return []
+
+        if expenses is None:
+            debts = load_open_debts(apartment)
+        else:
+            debts = load_open_debts(apartment, pk__in=[expense.pk for expense in expenses])
+
+        applications = []
+        changed_expenses = []
+        changed_credits = []
+        credit_iter = iter(credits)
+        credit = next(credit_iter)
+        for expense in debts:
+            if credit is None:
+                break
+
+            # expense.debt считает БД — в цикле ведём остаток долга сами
+            debt = expense.debt
+            changed_expenses.append(expense)
+            while debt > 0 and credit is not None:
+                pay_here = min(debt, credit.remaining)
+                credit.remaining -= pay_here
+                expense.paid_amount += pay_here
+                debt -= pay_here
+                applications.append(CreditApplication(credit=credit, expense=expense, amount=pay_here))
+                if not changed_credits or changed_credits[-1] is not credit:
+                    changed_credits.append(credit)
+                if credit.remaining <= 0:
+                    credit = next(credit_iter, None)
+
+        if applications:
+            Expense.objects.bulk_update(changed_expenses, ['paid_amount'])
+            Credit.objects.bulk_update(changed_credits, ['remaining'])
+            CreditApplication.objects.bulk_create(applications)
+            ledger.refresh_after_bulk([apartment.user_id], map(ledger.ledger_key, changed_expenses))
+
+    return applications
+
+
+def apply_credits_bulk(expenses):
+    """
+    apply_credits для пачки новых расходов разных квартир (пакетные задания).
+    Кредиты есть у немногих, поэтому отдельные запросы — только для них.
+    """
+    by_apartment = {}
+    for expense in expenses:
+        by_apartment.setdefault(expense.apartment_id, []).append(expense)
+    if not by_apartment:
+        return []
+
+    credited = Credit.objects.filter(apartment_id__in=by_apartment, remaining__gt=0).values('apartment_id')
+    applications = []
+    for apartment in Apartment.objects.filter(pk__in=credited):
+        applications += apply_credits(apartment, by_apartment[apartment.pk])
+    return applications
+
+
+def _refunds_by_expense(rows, refunds):
+    """Сложить возвраты по расходам: {pk: [ячейка леджера, сумма]}"""
+    for pk, apartment_id, day, category_id, total in rows:
+        entry = refunds.setdefault(pk, [(apartment_id, day.year, day.month, category_id), Decimal('0')])
+        entry[1] += total
+    return refunds
+
+
+def reverse_payments(apartment, payment_ids):
+    """
+    Отменить платежи: вернуть долг расходам, которые они гасили (в том числе
+    через кредит из переплаты), удалить кредиты и сами платежи.
+
+    Всё в одной транзакции и за постоянное число запросов — сколько бы
+    платежей и распределений ни было: суммы возвратов собираются GROUP BY,
+    paid_amount уменьшается одним UPDATE с CASE по pk.
+    Возвращает число отменённых платежей.
+    """
+    with transaction.atomic():
+        payments = list(
+            Payment.objects
+            .select_for_update()
+            .filter(apartment=apartment, pk__in=payment_ids)
+            .values_list('pk', flat=True)
+        )
+        if not payments:
+            return 0
+
+        columns = ('expense_id', 'expense__apartment_id', 'expense__date', 'expense__category_id')
+        refunds = _refunds_by_expense(
+            PaymentAllocation.objects
+            .filter(payment_id__in=payments)
+            .values(*columns).annotate(total=Sum('amount'))
+            .values_list(*columns, 'total'),
+            {}
+        )
+        # Часть переплаты могла уже погасить новые расходы — это тоже деньги платежа
+        _refunds_by_expense(
+            CreditApplication.objects
+            .filter(credit__payment_id__in=payments)
+            .values(*columns).annotate(total=Sum('amount'))
+            .values_list(*columns, 'total'),
+            refunds
+        )
+
+        if refunds:
+            Expense.objects.filter(pk__in=refunds).update(
+                paid_amount=F('paid_amount') - Case(
+                    *[When(pk=pk, then=Value(amount)) for pk, (cell, amount) in refunds.items()],
+                    default=Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=10, decimal_places=2)
+                )
+            )
+
+        # Платежи удаляются вместе с распределениями, кредитами и их списаниями (CASCADE).
+        # Поштучные сигналы леджера на это время молчат — ячейки обновляются ниже разом
+        with ledger.bulk_changes():
+            Payment.objects.filter(pk__in=payments).delete()
+
+        ledger.refresh_after_bulk([apartment.user_id], (cell for cell, amount in refunds.values()))
+
+    return len(payments)
@@ -0,0 +1,314 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.views import View
+
+from . import usercache
+from .allocation import allocate_payment, apply_credits, preview_allocation, reverse_payments
+from .forms import ExpenseForm, MeterReadingForm, PaymentForm
+from .models import Expense, MeterReading, Payment
+from .services import (
+    build_month_summary, cached_year_summary, date_range, keyset_page, parse_cursor, user_apartment
+)
+
+API_PAGE_SIZE = 200
+
+# date_range берёт начало следующего года, поэтому 9999 уже не годится
+MAX_YEAR = 9998
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API — превращается в JSON-ответ с кодом status"""
+
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+class ApiView(View):
+    """
+    Основа JSON API: только для вошедших пользователей (сессия; для POST/PUT/DELETE
+    нужен CSRF-токен), ошибки — в JSON.
+
+    ETag строится из поколения данных пользователя (usercache) и URL, поэтому
+    If-None-Match проверяется без запросов к таблицам expenses (нужна только
+    сессия): неизменившиеся данные сразу получают 304. If-Match на запись защищает от перезаписи чужих изменений (412).
+
+    Квартира задаётся параметром ?apartment=<id> (по умолчанию — основная);
+    он входит в URL, а значит, и в ETag.
+    """
+
+    @cached_property
+    def apartment(self):
+        apartment_id = self.int_param('apartment')
+        apartment = user_apartment(self.request.user, apartment_id)
+        if apartment is None or (apartment_id and apartment.pk != apartment_id):
+            raise ApiError("Квартира не найдена.", status=404)
+        return apartment
+
+    def get_etag(self):
+        return usercache.etag(self.request.user.pk, self.request.get_full_path())
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': "Требуется вход."}, status=401)
+
+        etag = self.get_etag()
+        conditional = get_conditional_response(request, etag=etag)
+        if conditional is not None:
+            return conditional
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except ApiError as exc:
+            body = {'error': exc.message}
+            if exc.errors:
+                body['errors'] = exc.errors
+            return JsonResponse(body, status=exc.status)
+
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            response['ETag'] = etag
+            # Клиент может хранить ответ, но каждый раз сверяет ETag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def json_body(self):
+        try:
+            data = json.loads(self.request.body or b'{}')
+        except ValueError:
+            raise ApiError("Некорректный JSON.")
+        if not isinstance(data, dict):
+            raise ApiError("Ожидается JSON-объект.")
+        return data
+
+    def int_param(self, name):
+        value = self.request.GET.get(name)
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ApiError(f"Параметр {name} должен быть числом.")
+
+
+class ResourceMixin:
+    """
+    Общее для списка и отдельной записи: queryset пользователя, values() и форма.
+    Список ограничен квартирой (?apartment=), отдельная запись доступна по id в любой квартире пользователя.
+    """
+    model = None
+    form_class = None
+    fields = ()
+    expressions = {}
+
+    def get_queryset(self):
+        return self.model.objects.filter(user=self.request.user)
+
+    def get_values(self, queryset):
+        return queryset.values(*self.fields, **self.expressions)
+
+    def serialize(self, pk):
+        return self.get_values(self.get_queryset().filter(pk=pk)).first()
+
+    def get_form(self, data, instance=None):
+        return self.form_class(data, instance=instance)
+
+    def perform_save(self, form):
+        form.instance.user = self.request.user
+        if form.instance.apartment_id is None:
+            form.instance.apartment = self.apartment
+        return form.save()
+
+    def save_form(self, data, instance=None):
+        form = self.get_form(data, instance)
+        if not form.is_valid():
+            raise ApiError("Ошибка в данных.", errors=form.errors.get_json_data())
+        try:
+            with transaction.atomic():
+                obj = self.perform_save(form)
+        except IntegrityError:
+            raise ApiError("Такая запись уже существует.", status=409)
+        return self.serialize(obj.pk)
+
+
+class ResourceListView(ResourceMixin, ApiView):
+    """
+    GET — страница записей от новых к старым (?year=, ?month=, ?after=<курсор>),
+    POST — создать запись из JSON с теми же полями, что и форма на сайте.
+    """
+    http_method_names = ['get', 'head', 'post', 'options']
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset().filter(apartment=self.apartment)
+        year, month = self.int_param('year'), self.int_param('month')
+        if year:
+            try:
+                queryset = queryset.filter(**date_range(year, month))
+            except ValueError:
+                raise ApiError("Некорректный год или месяц.")
+
+        after = request.GET.get('after')
+        try:
+            after = parse_cursor(after) if after else None
+        except ValueError:
+            raise ApiError("Некорректный курсор страницы.")
+
+        rows, next_cursor = keyset_page(self.get_values(queryset), after, API_PAGE_SIZE)
+        return JsonResponse({'results': rows, 'next': next_cursor})
+
+    def post(self, request, *args, **kwargs):
+        return JsonResponse(self.save_form(self.json_body()), status=201)
+
+
+class ResourceDetailView(ResourceMixin, ApiView):
+    """GET, PUT (все поля формы) и DELETE одной записи"""
+    http_method_names = ['get', 'head', 'put', 'delete', 'options']
+
+    def get_object(self):
+        obj = self.get_queryset().filter(pk=self.kwargs['pk']).first()
+        if obj is None:
+            raise ApiError("Запись не найдена.", status=404)
+        return obj
+
+    def get(self, request, *args, **kwargs):
+        row = self.serialize(self.kwargs['pk'])
+        if row is None:
+            raise ApiError("Запись не найдена.", status=404)
+        return JsonResponse(row)
+
+    def put(self, request, *args, **kwargs):
+        return JsonResponse(self.save_form(self.json_body(), instance=self.get_object()))
+
+    def delete(self, request, *args, **kwargs):
+        self.get_object().delete()
+        return HttpResponse(status=204)
+
+
+class ExpenseResourceMixin(ResourceMixin):
+    model = Expense
+    form_class = ExpenseForm
+    fields = ('id', 'category_id', 'amount', 'paid_amount', 'debt', 'date', 'description')
+    expressions = {'category_name': F('category__name')}
+
+    def get_form(self, data, instance=None):
+        # У существующего расхода форма берёт квартиру из него самого
+        apartment = None if instance else self.apartment
+        return self.form_class(data, instance=instance, user=self.request.user, apartment=apartment)
+
+    def perform_save(self, form):
+        expense = super().perform_save(form)
+        # Как на сайте: накопленная переплата сразу гасит новый долг
+        apply_credits(expense.apartment, [expense])
+        return expense
+
+
+class ExpenseListApiView(ExpenseResourceMixin, ResourceListView):
+    pass
+
+
+class ExpenseDetailApiView(ExpenseResourceMixin, ResourceDetailView):
+    pass
+
+
+class PaymentListApiView(ResourceListView):
+    """
+    Платёж при создании сразу распределяется по долгам (как AddPaymentView).
+    Изменять платежи через API нельзя — только отменить (DELETE).
+    """
+    model = Payment
+    form_class = PaymentForm
+    fields = ('id', 'amount', 'date', 'description')
+
+    def perform_save(self, form):
+        payment = super().perform_save(form)
+        allocate_payment(payment)
+        return payment
+
+
+class PaymentPreviewApiView(ApiView):
+    """
+    Предпросмотр распределения платежа (?amount=) для формы платежа:
+    те же правила, что у allocate_payment, но без записи и блокировок.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, *args, **kwargs):
+        # Те же проверки, что у поля суммы в форме платежа: разрядность, знаки после запятой, ≥ 0
+        field = Payment._meta.get_field('amount')
+        try:
+            amount = field.formfield().clean(request.GET.get('amount', '').replace(',', '.'))
+            field.run_validators(amount)
+        except ValidationError:
+            raise ApiError("Некорректная сумма.")
+
+        plan, credit = preview_allocation(self.apartment, amount)
+        return JsonResponse({
+            'allocations': [
+                {'expense_id': debt.expense_id, 'category': debt.category, 'date': debt.date, 'amount': pay_here}
+                for debt, pay_here in plan
+            ],
+            'credit': credit,
+        })
+
+
+class PaymentDetailApiView(ResourceDetailView):
+    http_method_names = ['get', 'head', 'delete', 'options']
+    model = Payment
+    fields = PaymentListApiView.fields
+
+    def delete(self, request, *args, **kwargs):
+        # Удаление = отмена: распределения и кредит из переплаты откатываются
+        payment = self.get_object()
+        reverse_payments(payment.apartment, [payment.pk])
+        return HttpResponse(status=204)
+
+
+class MeterReadingResourceMixin(ResourceMixin):
+    model = MeterReading
+    form_class = MeterReadingForm
+    fields = ('id', 'type', 'value', 'date')
+
+
+class MeterReadingListApiView(MeterReadingResourceMixin, ResourceListView):
+    pass
+
+
+class MeterReadingDetailApiView(MeterReadingResourceMixin, ResourceDetailView):
+    pass
+
+
+def check_year(year):
+    """Год, для которого date_range может построить границы (до начала следующего года)"""
+    if not 1 <= year <= MAX_YEAR:
+        raise ApiError("Некорректный год.", status=404)
+
+
+class YearSummaryApiView(ApiView):
+    """Статусы месяцев и итоги года — тот же кэшированный блок, что на dashboard"""
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, year):
+        check_year(year)
+        return JsonResponse(cached_year_summary(self.apartment, year))
+
+
+class MonthSummaryApiView(ApiView):
+    """Итоги месяца по категориям из MonthlyLedger"""
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, year, month):
+        check_year(year)
+        if not 1 <= month <= 12:
+            raise ApiError("Некорректный месяц.", status=404)
+        summary = usercache.get_or_compute(
+            request.user.pk, 'month_summary', f"{self.apartment.pk}:{year}-{month}",
+            lambda: build_month_summary(self.apartment, year, month)
+        )
+        return JsonResponse(summary)
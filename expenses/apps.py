@@ -7,3 +7,4 @@ class ExpensesConfig(AppConfig):
 
     def ready(self):
         import expenses.signals  # Подключаем signals
+        import expenses.checks  # Проверки manage.py check --deploy
@@ -0,0 +1,207 @@
+import json
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from dateutil.relativedelta import relativedelta
+
+from .models import (
+    Apartment, ExpenseCategory, Expense, MeterReading, Payment, PaymentAllocation, Credit
+)
+from . import ledger
+
+BENCHMARK_PASSWORD = 'benchmark'
+
+# Категории как у обычного пользователя (см. signals.py) и типичные суммы по ним
+CATEGORIES = [('Аренда', 1, 450, 650), ('Коммуналка', 2, 40, 160), ('Электричество', 3, 15, 70)]
+# Средний месячный расход по счётчикам
+METER_USAGE = {'cold_water': 6, 'hot_water': 3, 'electricity': 180}
+
+# Сценарии идут на отдельном локальном кэше: перед каждым запросом он очищается,
+# а общий кэш (Redis, memcached) других процессов и пользователей остаётся нетронутым
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'expenses-benchmark',
+    }
+}
+
+
+def seed(users=10, years=3, end=None, prefix='bench', seed_value=0, batch_size=5000):
+    """
+    Синтетическая история: на каждого пользователя years лет помесячных расходов,
+    платежей с распределениями, переплат и показаний счётчиков. Всё через bulk_create.
+    Возвращает список созданных пользователей.
+    """
+    rnd = random.Random(seed_value)
+    end = end or date.today().replace(day=1)
+    months = [end - relativedelta(months=i) for i in range(years * 12 - 1, -1, -1)]
+    password = make_password(BENCHMARK_PASSWORD)
+
+    created = User.objects.bulk_create([
+        User(username=f'{prefix}_{i:05d}', password=password) for i in range(users)
+    ], batch_size=batch_size)
+    # bulk_create не шлёт сигналы — квартиры и категории создаём сами
+    created = list(User.objects.filter(username__in=[u.username for u in created]).order_by('pk'))
+    Apartment.objects.bulk_create([Apartment(user=u) for u in created], batch_size=batch_size)
+    ExpenseCategory.objects.bulk_create([
+        ExpenseCategory(user=u, name=name, priority=priority)
+        for u in created for name, priority, _, _ in CATEGORIES
+    ], batch_size=batch_size)
+    apartments = {apartment.user_id: apartment for apartment in Apartment.objects.filter(user__in=created)}
+    categories = {}
+    for category in ExpenseCategory.objects.filter(user__in=created):
+        categories[category.user_id, category.name] = category
+
+    for user in created:
+        apartment = apartments[user.pk]
+        expenses, payments, readings, credits = [], [], [], []
+        counters = {meter: Decimal(rnd.randint(0, 500)) for meter in METER_USAGE}
+        for i, month in enumerate(months):
+            recent = i >= len(months) - 3  # последние месяцы остаются частично неоплаченными
+            for name, _, low, high in CATEGORIES:
+                amount = Decimal(rnd.randint(low * 100, high * 100)) / 100
+                paid = amount if not recent or rnd.random() < 0.3 else (amount * Decimal(rnd.random())).quantize(Decimal('0.01'))
+                expenses.append(Expense(
+                    user=user, apartment=apartment, category=categories[user.pk, name], amount=amount,
+                    paid_amount=paid, date=month.replace(day=rnd.randint(1, 10))
+                ))
+            for meter, usage in METER_USAGE.items():
+                counters[meter] += Decimal(rnd.uniform(0.6, 1.4) * usage).quantize(Decimal('0.01'))
+                readings.append(MeterReading(user=user, apartment=apartment, type=meter, value=counters[meter], date=month.replace(day=25)))
+            if rnd.random() < 0.05:
+                amount = Decimal(rnd.randint(1, 50))
+                credits.append(Credit(user=user, apartment=apartment, amount=amount, remaining=amount, date=month))
+
+        Expense.objects.bulk_create(expenses, batch_size=batch_size)
+        MeterReading.objects.bulk_create(readings, batch_size=batch_size)
+        Credit.objects.bulk_create(credits, batch_size=batch_size)
+
+        # Платёж за месяц = сумма оплат его расходов, по одному распределению на расход
+        by_month = {}
+        for expense in expenses:
+            if expense.paid_amount > 0:
+                by_month.setdefault(expense.date.replace(day=1), []).append(expense)
+        for month, paid in by_month.items():
+            payments.append(Payment(
+                user=user, apartment=apartment, amount=sum(e.paid_amount for e in paid),
+                date=month + relativedelta(days=14)
+            ))
+        Payment.objects.bulk_create(payments, batch_size=batch_size)
+        PaymentAllocation.objects.bulk_create([
+            PaymentAllocation(payment=payment, expense=expense, amount=expense.paid_amount)
+            for payment, paid in zip(payments, by_month.values()) for expense in paid
+        ], batch_size=batch_size)
+
+    ledger.rebuild_users([u.pk for u in created])
+    return created
+
+
+def scenarios(user, year, month):
+    """(имя, метод, URL, данные POST) — всё, что меряем на одном пользователе"""
+    return [
+        ('dashboard', 'get', f'/expenses/?year={year}', None),
+        ('graphs', 'get', f'/expenses/graphs/?year={year}', None),
+        ('month_detail', 'get', f'/expenses/month/{year}/{month}/', None),
+        ('month_expenses', 'get', f'/expenses/month/{year}/{month}/expenses/', None),
+        ('month_readings', 'get', f'/expenses/month/{year}/{month}/readings/', None),
+        ('month_payments', 'get', f'/expenses/month/{year}/{month}/payments/', None),
+        # Платёж больше любого долга: гасит все открытые долги и оставляет кредит
+        ('add_payment', 'post', '/expenses/add-payment/', {'amount': '100000.00', 'date': f'{year}-{month:02d}-15', 'description': ''}),
+        ('pay_all', 'post', f'/expenses/month/{year}/{month}/pay-all/', {}),
+        ('export_pdf', 'get', f'/expenses/export-pdf/{year}/{month}/', None),
+    ]
+
+
+def _run_once(client, method, url, data):
+    """
+    Один запрос внутри транзакции, которая откатывается: данные не меняются.
+    Вызывается только внутри run(), где cache — это BENCHMARK_CACHES.
+    """
+    cache.clear()
+    with transaction.atomic():
+        response = getattr(client, method)(url, data) if data is not None else getattr(client, method)(url)
+        transaction.set_rollback(True)
+    return response
+
+
+def run(user, year=None, month=None, repeat=5, host='localhost'):
+    """
+    Прогнать все сценарии через тестовый клиент.
+    Возвращает {сценарий: {'queries', 'time_ms', 'peak_kb', 'status'}}.
+    """
+    today = date.today()
+    year, month = year or today.year, month or today.month
+    client = Client(HTTP_HOST=host)
+    client.force_login(user)
+    results = {}
+
+    with override_settings(CACHES=BENCHMARK_CACHES, PERF_STATS_ENABLED=False, PDF_EXPORT_ASYNC=True,
+                           PDF_EXPORT_CACHE_DIR=tempfile.mkdtemp()):
+        for name, method, url, data in scenarios(user, year, month):
+            with CaptureQueriesContext(connection) as queries:
+                response = _run_once(client, method, url, data)
+            # Считаем сразу: следующий запрос очистит connection.queries (reset_queries)
+            # BEGIN/ROLLBACK и SAVEPOINT от обёртки самого бенчмарка не считаем
+            query_count = sum(
+                1 for q in queries.captured_queries
+                if q['sql'] not in ('BEGIN', 'ROLLBACK') and 'SAVEPOINT' not in q['sql']
+            )
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _run_once(client, method, url, data)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            tracemalloc.start()
+            _run_once(client, method, url, data)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[name] = {
+                'queries': query_count,
+                'time_ms': round(statistics.median(timings), 2),
+                'peak_kb': round(peak / 1024, 1),
+                'status': response.status_code,
+            }
+    return results
+
+
+def compare(results, baseline, threshold=1.25):
+    """
+    Регрессии относительно базовой линии. Число запросов должно совпадать
+    или уменьшаться; время и память — не больше чем в threshold раз.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if current['queries'] > base['queries']:
+            regressions.append(f"{name}: SQL-запросов {current['queries']} > {base['queries']}")
+        for metric in ('time_ms', 'peak_kb'):
+            if base[metric] and current[metric] > base[metric] * threshold:
+                regressions.append(f"{name}: {metric} {current[metric]} > {base[metric]} × {threshold}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(results, baseline_file, indent=2, ensure_ascii=False, sort_keys=True)
+        baseline_file.write('\n')
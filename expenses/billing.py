@@ -0,0 +1,191 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Credit, Expense, ExpenseCategory, MeterReading, Tariff
+from .allocation import apply_credits_bulk
+from .services import date_range
+from . import ledger
+
+CENT = Decimal('0.01')
+# Точность доли расхода, когда он делится между несколькими месяцами
+SHARE = Decimal('0.001')
+METER_LABELS = dict(MeterReading.TYPE_CHOICES)
+
+
+def tariff_cost(tariff, bands, consumption, month):
+    """Стоимость consumption единиц за месяц month (1–12) по тарифу; bands — его ступени"""
+    if tariff.kind == Tariff.KIND_TIERED:
+        cost = Decimal('0')
+        lower = Decimal('0')
+        for band in sorted(bands, key=lambda b: (b.up_to is None, b.up_to)):
+            if consumption <= lower:
+                break
+            upper = consumption if band.up_to is None else min(consumption, band.up_to)
+            cost += (upper - lower) * band.rate
+            lower = upper
+        # Сверх последней ступени — по базовой цене тарифа
+        if consumption > lower:
+            cost += (consumption - lower) * tariff.rate
+        return cost.quantize(CENT)
+
+    if tariff.kind == Tariff.KIND_SEASONAL:
+        rate = next((band.rate for band in bands if band.covers_month(month)), tariff.rate)
+        return (consumption * rate).quantize(CENT)
+
+    return (consumption * tariff.rate).quantize(CENT)
+
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def month_consumption(year, month):
+    """
+    Расход по всем счётчикам всех квартир, начисляемый в месяце:
+    {(apartment_id, user_id, тип): {индекс месяца: расход}}.
+
+    Один запрос: каждое показание месяца получает предыдущее показание того же
+    счётчика подзапросом по уникальному индексу (apartment, type, date). Если
+    счётчик не снимали несколько месяцев, расход делится поровну между ними,
+    как в consumption.py, — ступени тарифа применяются к каждому месяцу отдельно.
+    Первое показание счётчика — только точка отсчёта; уменьшение считается
+    заменой счётчика.
+    """
+    previous = (
+        MeterReading.objects
+        .filter(apartment=OuterRef('apartment'), type=OuterRef('type'), date__lt=OuterRef('date'))
+        .order_by('-date')
+    )
+    rows = (
+        MeterReading.objects
+        .filter(**date_range(year, month))
+        .annotate(
+            prev_value=Subquery(previous.values('value')[:1]),
+            prev_date=Subquery(previous.values('date')[:1]),
+        )
+        .order_by()
+        .values_list('apartment_id', 'user_id', 'type', 'date', 'value', 'prev_value', 'prev_date')
+    )
+
+    totals = defaultdict(lambda: defaultdict(Decimal))
+    for apartment_id, user_id, meter, day, value, prev_value, prev_date in rows.iterator(chunk_size=2000):
+        if prev_value is None:
+            continue
+        delta = value - prev_value
+        if delta < 0:
+            delta = value
+
+        end = _month_index(day)
+        span = max(end - _month_index(prev_date), 1)
+        per_month = (delta / span).quantize(SHARE)
+        months = totals[(apartment_id, user_id, meter)]
+        for index in range(end - span + 1, end):
+            months[index] += per_month
+        # Остаток от округления — последнему месяцу, чтобы сумма долей равнялась delta
+        months[end] += delta - per_month * (span - 1)
+    return totals
+
+
+def current_tariffs(day):
+    """Тариф каждого типа счётчика, действующий на day, со ступенями — два запроса"""
+    tariffs = Tariff.objects.filter(valid_from__lte=day).order_by('valid_from').prefetch_related('bands')
+    # Более поздний тариф того же типа перекрывает ранний
+    return {tariff.meter_type: tariff for tariff in tariffs}
+
+
+def _unit(meter):
+    return "kWh" if meter == 'electricity' else "м³"
+
+
+def run_billing(year, month):
+    """
+    Начислить расходы за месяц по показаниям счётчиков всех квартир.
+
+    Счётчики квартиры, тарифы которых ведут в одну категорию, дают один расход месяца.
+    Новые расходы создаются одним bulk_create, начисленные раньше (billed)
+    пересчитываются одним bulk_update, поэтому повторный запуск после
+    исправления показаний безопасен: если уже оплачено больше новой суммы,
+    излишек становится кредитом. Расходы, введённые вручную, не трогаются.
+    Возвращает словарь со счётчиками created/updated/skipped.
+    """
+    start = date(year, month, 1)
+    tariffs = current_tariffs(start)
+
+    amounts = defaultdict(Decimal)
+    notes = defaultdict(list)
+    for (apartment_id, user_id, meter), months in sorted(month_consumption(year, month).items()):
+        tariff = tariffs.get(meter)
+        if tariff is None:
+            continue
+        key = (apartment_id, user_id, tariff.category_name)
+        bands = tariff.bands.all()
+        amounts[key] += sum(
+            tariff_cost(tariff, bands, part, index % 12 + 1) for index, part in sorted(months.items())
+        )
+        used = sum(months.values()).quantize(CENT)
+        notes[key].append(f"{METER_LABELS[meter]}: {used} {_unit(meter)}")
+
+    result = {'created': 0, 'updated': 0, 'skipped': 0}
+    if not amounts:
+        return result
+
+    categories = {
+        (user_id, name): pk
+        for user_id, name, pk in ExpenseCategory.objects.filter(
+            user_id__in={user_id for _, user_id, _ in amounts},
+            name__in={name for _, _, name in amounts},
+        ).order_by().values_list('user_id', 'name', 'pk')
+    }
+
+    with transaction.atomic():
+        existing = {
+            (expense.apartment_id, expense.category_id): expense
+            for expense in Expense.objects
+            .select_for_update()
+            .filter(category_id__in=categories.values(), **date_range(year, month))
+            .order_by()
+        }
+
+        created, updated, credits = [], [], []
+        for key, amount in amounts.items():
+            apartment_id, user_id, name = key
+            category_id = categories.get((user_id, name))
+            expense = existing.get((apartment_id, category_id))
+            description = "По показаниям: " + ", ".join(notes[key])
+            if category_id is None or (expense is not None and not expense.billed):
+                result['skipped'] += 1
+            elif expense is None:
+                created.append(Expense(
+                    user_id=user_id, apartment_id=apartment_id, category_id=category_id,
+                    amount=amount, date=start, description=description, billed=True
+                ))
+            elif (expense.amount, expense.description) != (amount, description):
+                expense.amount = amount
+                expense.description = description
+                if expense.paid_amount > amount:
+                    # Переплата по пересчитанному расходу — в кредит, как остаток платежа
+                    excess = expense.paid_amount - amount
+                    credits.append(Credit(
+                        user_id=user_id, apartment_id=apartment_id,
+                        amount=excess, remaining=excess, date=start
+                    ))
+                    expense.paid_amount = amount
+                updated.append(expense)
+
+        Expense.objects.bulk_create(created)
+        Expense.objects.bulk_update(updated, ['amount', 'paid_amount', 'description'])
+        if credits:
+            Credit.objects.bulk_create(credits)
+        ledger.refresh_after_bulk(
+            (expense.user_id for expense in created + updated), map(ledger.ledger_key, created + updated)
+        )
+        # Выросшие суммы гасятся кредитами квартиры, в том числе только что появившимися
+        apply_credits_bulk(created + updated)
+
+    result['created'] = len(created)
+    result['updated'] = len(updated)
+    return result
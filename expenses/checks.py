@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Кэши, которые не делятся между процессами gunicorn и серверами
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """usercache хранит поколение данных в кэше: все процессы должны видеть один и тот же кэш"""
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f"Кэш по умолчанию — {backend.rsplit('.', 1)[-1]}: при нескольких процессах "
+        "сброс кэша пользователя в одном из них не виден остальным.",
+        hint="Задайте CACHE_BACKEND=redis, memcached или db.",
+        id='expenses.W001',
+    )]
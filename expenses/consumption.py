@@ -0,0 +1,138 @@
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from statistics import median
+
+from django.db.models import OuterRef, Subquery
+
+from . import usercache
+from .services import alist
+from .models import MeterReading
+
+# Расход в месяц больше медианного во столько раз — подозрительный скачок
+SPIKE_FACTOR = 5
+
+METER_TYPES = [code for code, _ in MeterReading.TYPE_CHOICES]
+METER_LABELS = dict(MeterReading.TYPE_CHOICES)
+
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def _readings_with_previous(apartment, year):
+    """
+    Показания за год вместе с предыдущим показанием того же счётчика — один запрос.
+
+    Предыдущее показание ищется подзапросом по уникальному индексу (apartment, type, date)
+    без нижней границы по дате: даже если счётчик не снимали больше года,
+    у первого показания года есть с чем сравнивать (как в billing.month_consumption).
+    """
+    previous = (
+        MeterReading.objects
+        .filter(apartment=OuterRef('apartment'), type=OuterRef('type'), date__lt=OuterRef('date'))
+        .order_by('-date')
+    )
+    return (
+        MeterReading.objects
+        .filter(apartment=apartment, date__gte=date(year, 1, 1), date__lt=date(year + 1, 1, 1))
+        .annotate(
+            prev_value=Subquery(previous.values('value')[:1]),
+            prev_date=Subquery(previous.values('date')[:1]),
+        )
+        .order_by('type', 'date')
+        .values_list('type', 'date', 'value', 'prev_value', 'prev_date')
+    )
+
+
+def compute_consumption(apartment, year):
+    """
+    Помесячный расход по каждому счётчику из накопительных показаний.
+
+    Расход между двумя показаниями распределяется поровну по месяцам между ними
+    (интерполяция пропущенных месяцев). Уменьшение показания считается сбросом
+    или заменой счётчика: расходом считается новое значение целиком.
+    """
+    return _consumption_from_rows(year, _readings_with_previous(apartment, year))
+
+
+async def acompute_consumption(apartment, year):
+    """compute_consumption на асинхронном ORM"""
+    return _consumption_from_rows(year, await alist(_readings_with_previous(apartment, year)))
+
+
+def _consumption_from_rows(year, rows):
+    first_month = year * 12
+    series = {meter: [None] * 12 for meter in METER_TYPES}
+    rates = defaultdict(list)
+    anomalies = []
+
+    for meter, day, value, prev_value, prev_date in rows:
+        if prev_value is None:
+            continue
+
+        delta = value - prev_value
+        if delta < 0:
+            anomalies.append({'type': meter, 'label': str(METER_LABELS[meter]), 'date': day,
+                              'kind': 'reset', 'delta': float(delta)})
+            delta = value
+
+        end = _month_index(day)
+        span = max(end - _month_index(prev_date), 1)
+        per_month = float(delta) / span
+        if day.year == year:
+            rates[meter].append((day, per_month))
+
+        for index in range(end - span + 1, end + 1):
+            slot = index - first_month
+            if 0 <= slot < 12:
+                series[meter][slot] = round((series[meter][slot] or 0) + per_month, 3)
+
+    for meter, values in rates.items():
+        typical = median(rate for _, rate in values)
+        for day, rate in values:
+            if typical > 0 and rate > SPIKE_FACTOR * typical:
+                anomalies.append({'type': meter, 'label': str(METER_LABELS[meter]), 'date': day,
+                                  'kind': 'spike', 'delta': round(rate, 3)})
+
+    return series, sorted(anomalies, key=lambda a: a['date'])
+
+
+def _stats(values):
+    known = [v for v in values if v is not None]
+    if not known:
+        return {'min': 0, 'max': 0, 'avg': 0}
+    return {'min': min(known), 'max': max(known), 'avg': sum(known) / len(known)}
+
+
+def chart_context(apartment, year):
+    """Контекст для graphs.html: chart_data (JSON-строки) и статистика по счётчикам"""
+    return usercache.get_or_compute(
+        apartment.user_id, 'consumption', f"{apartment.pk}:{year}",
+        lambda: _build_chart_context(apartment, year)
+    )
+
+
+async def achart_context(apartment, year):
+    """chart_context для async-представлений"""
+    async def build():
+        return _chart_context(year, *await acompute_consumption(apartment, year))
+
+    return await usercache.aget_or_compute(apartment.user_id, 'consumption', f"{apartment.pk}:{year}", build)
+
+
+def _build_chart_context(apartment, year):
+    return _chart_context(year, *compute_consumption(apartment, year))
+
+
+def _chart_context(year, series, anomalies):
+    return {
+        'chart_data': {
+            'labels': json.dumps([datetime(year, month, 1).strftime('%b') for month in range(1, 13)]),
+            **{meter: json.dumps(values) for meter, values in series.items()},
+        },
+        'cold_stats': _stats(series['cold_water']),
+        'hot_stats': _stats(series['hot_water']),
+        'electricity_stats': _stats(series['electricity']),
+        'anomalies': anomalies,
+    }
@@ -0,0 +1,91 @@
+import csv
+import tempfile
+
+from .models import Expense, Payment, PaymentAllocation, MeterReading
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _expenses(apartment, start, end):
+    return (
+        Expense.objects
+        .filter(apartment=apartment, date__gte=start, date__lte=end)
+        .order_by('date', 'id')
+        .values_list('date', 'category__name', 'amount', 'paid_amount', 'debt', 'description')
+    )
+
+
+def _payments(apartment, start, end):
+    return (
+        Payment.objects
+        .filter(apartment=apartment, date__gte=start, date__lte=end)
+        .order_by('date', 'id')
+        .values_list('date', 'id', 'amount', 'description')
+    )
+
+
+def _allocations(apartment, start, end):
+    return (
+        PaymentAllocation.objects
+        .filter(payment__apartment=apartment, payment__date__gte=start, payment__date__lte=end)
+        .order_by('payment__date', 'payment_id', 'id')
+        .values_list('payment__date', 'payment_id', 'expense__date', 'expense__category__name', 'amount')
+    )
+
+
+def _meter_readings(apartment, start, end):
+    return (
+        MeterReading.objects
+        .filter(apartment=apartment, date__gte=start, date__lte=end)
+        .order_by('date', 'type')
+        .values_list('date', 'type', 'value')
+    )
+
+
+# Вид данных → (заголовок, функция построения values_list-запроса)
+EXPORTS = {
+    'expenses': (['Дата', 'Категория', 'Сумма', 'Оплачено', 'Долг', 'Описание'], _expenses),
+    'payments': (['Дата', 'Платёж', 'Сумма', 'Описание'], _payments),
+    'allocations': (['Дата платежа', 'Платёж', 'Дата расхода', 'Категория', 'Сумма'], _allocations),
+    'meter_readings': (['Дата', 'Тип', 'Значение'], _meter_readings),
+}
+
+
+def export_rows(kind, apartment, start, end):
+    """Заголовок и строки выгрузки; строки читаются из БД порциями"""
+    header, build = EXPORTS[kind]
+    yield header
+    yield from build(apartment, start, end).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo(), delimiter=';')
+    # BOM — чтобы Excel сразу открыл файл в UTF-8
+    yield '\ufeff'
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, title):
+    """
+    XLSX во временный файл в режиме write_only: openpyxl не держит лист в памяти.
+    openpyxl — необязательная зависимость; ImportError обрабатывает вызывающий.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    for row in rows:
+        sheet.append(list(row))
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
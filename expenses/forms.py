@@ -2,9 +2,11 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator, MinValueValidator
-from .models import Expense, ExpenseCategory, MeterReading, Payment
+from .models import Apartment, Expense, ExpenseCategory, MeterReading, Payment, RecurringExpense
+from .services import date_range, parse_cursor
 from django.core.exceptions import ValidationError
 
+
 class RegisterForm(UserCreationForm):
     username = forms.CharField(
         max_length=150,
@@ -20,7 +22,14 @@ class RegisterForm(UserCreationForm):
         model = User
         fields = ['username', 'password1', 'password2']
 
+
 class ExpenseForm(forms.ModelForm):
+    recurring = forms.BooleanField(
+        label='Повторять каждый месяц',
+        required=False,
+        help_text='Расход с этой суммой будет создаваться автоматически в начале месяца.'
+    )
+
     class Meta:
         model = Expense
         fields = ['category', 'amount', 'date', 'description']
@@ -30,22 +39,27 @@ class ExpenseForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
+        self.apartment = kwargs.pop('apartment', None)
         super().__init__(*args, **kwargs)
+        if self.apartment is None and self.instance.pk:
+            self.apartment = self.instance.apartment
         if self.user:
             self.fields['category'].queryset = ExpenseCategory.objects.filter(user=self.user)
+        if self.instance.pk:
+            # Шаблон задаётся при добавлении расхода; при редактировании — через админку
+            del self.fields['recurring']
 
     def clean(self):
         cleaned_data = super().clean()
         category = cleaned_data.get('category')
         date = cleaned_data.get('date')
 
-        if category and date and self.user:
-            # Проверяем: есть ли уже расход в этой категории за этот месяц
+        if category and date and self.apartment:
+            # Проверяем: есть ли уже расход квартиры в этой категории за этот месяц
             existing = Expense.objects.filter(
-                user=self.user,
+                apartment=self.apartment,
                 category=category,
-                date__year=date.year,
-                date__month=date.month
+                **date_range(date.year, date.month)
             )
             if self.instance:
                 existing = existing.exclude(pk=self.instance.pk)  # Исключаем текущий при редактировании
@@ -56,6 +70,31 @@ class ExpenseForm(forms.ModelForm):
                 )
         return cleaned_data
 
+    def save(self, commit=True):
+        expense = super().save(commit)
+        if commit and self.cleaned_data.get('recurring'):
+            RecurringExpense.objects.update_or_create(
+                apartment_id=expense.apartment_id,
+                category=expense.category,
+                defaults={
+                    'amount': expense.amount,
+                    'day': expense.date.day,
+                    'description': expense.description,
+                    'active': True,
+                }
+            )
+        return expense
+
+
+class ApartmentForm(forms.ModelForm):
+    class Meta:
+        model = Apartment
+        fields = ['address']
+        widgets = {
+            'address': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Город, улица, дом, квартира'}),
+        }
+
+
 class MeterReadingForm(forms.ModelForm):
     class Meta:
         model = MeterReading
@@ -64,6 +103,7 @@ class MeterReadingForm(forms.ModelForm):
             'date': forms.DateInput(attrs={'type': 'date'}),
         }
 
+
 class PaymentForm(forms.ModelForm):
     class Meta:
         model = Payment
@@ -78,4 +118,64 @@ class PaymentForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['amount'].widget.attrs.update({'class': 'form-control', 'placeholder': '0.00'})
         self.fields['date'].widget.attrs.update({'class': 'form-control'})
-        self.fields['description'].widget.attrs.update({'class': 'form-control', 'placeholder': 'Необязательно'})
\ No newline at end of file
+        self.fields['description'].widget.attrs.update({'class': 'form-control', 'placeholder': 'Необязательно'})
+
+
+class DataFilterForm(forms.Form):
+    KIND_CHOICES = [
+        ('expenses', 'Расходы'),
+        ('payments', 'Платежи'),
+        ('meter_readings', 'Показания счётчиков'),
+    ]
+
+    start_date = forms.DateField(label='Начальная дата', widget=forms.DateInput(attrs={'type': 'date'}))
+    end_date = forms.DateField(label='Конечная дата', widget=forms.DateInput(attrs={'type': 'date'}))
+    kind = forms.ChoiceField(label='Данные', choices=KIND_CHOICES, initial='expenses', required=False)
+    after = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean_kind(self):
+        return self.cleaned_data.get('kind') or 'expenses'
+
+    def clean_after(self):
+        # Курсор страницы: "<дата>_<id>" последней показанной строки
+        value = self.cleaned_data.get('after')
+        if not value:
+            return None
+        try:
+            return parse_cursor(value)
+        except ValueError:
+            raise ValidationError("Некорректный курсор страницы.")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start and end and start > end:
+            raise ValidationError("Начальная дата позже конечной.")
+        return cleaned_data
+
+
+class DataExportForm(DataFilterForm):
+    KIND_CHOICES = DataFilterForm.KIND_CHOICES + [
+        ('allocations', 'Распределения платежей'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'XLSX'),
+    ]
+
+    kind = forms.ChoiceField(label='Данные', choices=KIND_CHOICES, initial='expenses', required=False)
+    format = forms.ChoiceField(label='Формат', choices=FORMAT_CHOICES, initial='csv', required=False)
+
+    def clean_format(self):
+        return self.cleaned_data.get('format') or 'csv'
+
+
+class ImportForm(forms.Form):
+    KIND_CHOICES = [
+        ('expenses', 'Расходы'),
+        ('payments', 'Платежи'),
+        ('meter_readings', 'Показания счётчиков'),
+    ]
+
+    kind = forms.ChoiceField(label='Данные', choices=KIND_CHOICES)
+    file = forms.FileField(label='CSV-файл')
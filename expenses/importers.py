@@ -0,0 +1,178 @@
+import csv
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from .models import Expense, ExpenseCategory, MeterReading, Payment
+from .allocation import allocate_payments, apply_credits
+from . import ledger
+
+IMPORT_BATCH_SIZE = 1000
+
+# Колонки CSV для каждого вида данных (первая строка файла — заголовок)
+IMPORT_COLUMNS = {
+    'expenses': ['date', 'category', 'amount', 'paid_amount', 'description'],
+    'payments': ['date', 'amount', 'description'],
+    'meter_readings': ['date', 'type', 'value'],
+}
+
+METER_TYPES = {code for code, _ in MeterReading.TYPE_CHOICES}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _date(value):
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise RowError(f"некорректная дата «{value}»")
+
+
+def _amount(value, default=None):
+    if not value and default is not None:
+        return default
+    try:
+        amount = Decimal(value.replace(',', '.').replace(' ', ''))
+        if not amount.is_finite():
+            raise InvalidOperation
+    except InvalidOperation:
+        raise RowError(f"некорректная сумма «{value}»")
+    amount = amount.quantize(Decimal('0.01'))
+    if amount < 0 or amount >= Decimal('1e8'):
+        raise RowError(f"сумма вне диапазона «{value}»")
+    return amount
+
+
+def read_csv(stream):
+    """Построчное чтение CSV: разделитель (',' или ';') определяется по началу файла"""
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(stream, dialect=dialect)
+    # Номер строки в файле с учётом заголовка — для сообщений об ошибках
+    for line, row in enumerate(reader, start=2):
+        yield line, {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _import_expenses(apartment, batches, result):
+    categories = {c.name.lower(): c for c in ExpenseCategory.objects.filter(user_id=apartment.user_id)}
+    # Один запрос вместо .exists() на каждую строку (то же правило, что в ExpenseForm.clean)
+    seen = set(Expense.objects.filter(apartment=apartment).values_list('category_id', 'date__year', 'date__month'))
+
+    for batch in batches:
+        objects = []
+        for line, row in batch:
+            try:
+                category = categories.get(row.get('category', '').lower())
+                if category is None:
+                    raise RowError(f"неизвестная категория «{row.get('category', '')}»")
+                day = _date(row.get('date', ''))
+                amount = _amount(row.get('amount', ''))
+                paid_amount = _amount(row.get('paid_amount', ''), default=Decimal('0'))
+                if paid_amount > amount:
+                    raise RowError("оплачено больше суммы расхода")
+            except RowError as exc:
+                result['errors'].append((line, str(exc)))
+                continue
+
+            key = (category.pk, day.year, day.month)
+            if key in seen:
+                result['skipped'] += 1
+                continue
+            seen.add(key)
+            objects.append(Expense(
+                user_id=apartment.user_id, apartment=apartment, category=category,
+                amount=amount, paid_amount=paid_amount,
+                date=day, description=row.get('description', '')
+            ))
+
+        with transaction.atomic():
+            Expense.objects.bulk_create(objects)
+            ledger.refresh_after_bulk([apartment.user_id], map(ledger.ledger_key, objects))
+            apply_credits(apartment, objects)
+        result['created'] += len(objects)
+
+
+def _import_payments(apartment, batches, result):
+    for batch in batches:
+        objects = []
+        for line, row in batch:
+            try:
+                objects.append(Payment(
+                    user_id=apartment.user_id, apartment=apartment, date=_date(row.get('date', '')),
+                    amount=_amount(row.get('amount', '')), description=row.get('description', '')
+                ))
+            except RowError as exc:
+                result['errors'].append((line, str(exc)))
+
+        with transaction.atomic():
+            Payment.objects.bulk_create(objects)
+            # Распределяем так же, как AddPaymentView: по приоритету категорий, остаток — в кредит,
+            # но всю пачку за один проход
+            allocate_payments(apartment, objects)
+        result['created'] += len(objects)
+
+
+def _import_meter_readings(apartment, batches, result):
+    seen = set(MeterReading.objects.filter(apartment=apartment).values_list('type', 'date'))
+
+    for batch in batches:
+        objects = []
+        for line, row in batch:
+            try:
+                kind = row.get('type', '')
+                if kind not in METER_TYPES:
+                    raise RowError(f"неизвестный тип счётчика «{kind}»")
+                day = _date(row.get('date', ''))
+                value = _amount(row.get('value', ''))
+            except RowError as exc:
+                result['errors'].append((line, str(exc)))
+                continue
+
+            if (kind, day) in seen:
+                result['skipped'] += 1
+                continue
+            seen.add((kind, day))
+            objects.append(MeterReading(
+                user_id=apartment.user_id, apartment=apartment, type=kind, value=value, date=day
+            ))
+
+        MeterReading.objects.bulk_create(objects)
+        result['created'] += len(objects)
+
+
+IMPORTERS = {
+    'expenses': _import_expenses,
+    'payments': _import_payments,
+    'meter_readings': _import_meter_readings,
+}
+
+
+def import_csv(apartment, kind, stream, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Импорт CSV в квартиру пачками по batch_size строк.
+
+    Строки проверяются обычными функциями и заранее загруженными множествами
+    ключей, без формы на каждую строку. Возвращает словарь со счётчиками
+    created/skipped и списком ошибок (номер строки, текст).
+    """
+    result = {'created': 0, 'skipped': 0, 'errors': []}
+    IMPORTERS[kind](apartment, _batches(read_csv(stream), batch_size), result)
+    # Показаний счётчиков нет в леджере, но кэш графиков тоже нужно сбросить
+    ledger.refresh_after_bulk([apartment.user_id])
+    return result
@@ -0,0 +1,132 @@
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Sum, Q
+from django.db.models.functions import TruncMonth
+from dateutil.relativedelta import relativedelta
+
+from .models import Expense, MonthlyLedger
+from . import usercache
+
+
+_bulk = threading.local()
+
+
+@contextmanager
+def bulk_changes():
+    """
+    Пачка изменений, после которой вызывающий сам пересчитает ячейки и сбросит кэш.
+    Пока она идёт, сигналы отдельных строк (signals.py) леджер не трогают —
+    например, при каскадном удалении сотни распределений не дают сотни пересчётов.
+    """
+    _bulk.depth = getattr(_bulk, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _bulk.depth -= 1
+
+
+def in_bulk():
+    return getattr(_bulk, 'depth', 0) > 0
+
+
+def ledger_key(expense):
+    """Ячейка леджера, в которую попадает расход"""
+    return (expense.apartment_id, expense.date.year, expense.date.month, expense.category_id)
+
+
+def _aggregate_expenses(queryset):
+    """Суммы расходов, сгруппированные по (квартира, год, месяц, категория)"""
+    rows = (
+        queryset
+        .annotate(period=TruncMonth('date'))
+        .values('user_id', 'apartment_id', 'category_id', 'period')
+        .annotate(
+            cell_amount=Sum('amount'),
+            cell_paid=Sum('paid_amount'),
+            cell_debt=Sum('debt'),
+        )
+        .order_by()
+    )
+    return {
+        (row['apartment_id'], row['period'].year, row['period'].month, row['category_id']): row
+        for row in rows
+    }
+
+
+def _ledger_rows(cells):
+    return [
+        MonthlyLedger(
+            user_id=row['user_id'], apartment_id=apartment_id, year=year, month=month, category_id=category_id,
+            amount=row['cell_amount'], paid=row['cell_paid'], debt=row['cell_debt'],
+        )
+        for (apartment_id, year, month, category_id), row in cells.items()
+    ]
+
+
+def refresh_cells(keys):
+    """
+    Пересчитать указанные ячейки леджера.
+
+    Один агрегирующий запрос по затронутым расходам, один upsert и одно удаление
+    опустевших ячеек — независимо от количества ключей.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+
+    periods = [date(year, month, 1) for _, year, month, _ in keys]
+    # Фильтр по apartment_id не добавляем: на больших пачках SQLite перебирал бы
+    # все пары (apartment, category); лишние ячейки отбрасываются ниже
+    cells = _aggregate_expenses(Expense.objects.filter(
+        category_id__in={key[3] for key in keys},
+        date__gte=min(periods),
+        date__lt=max(periods) + relativedelta(months=1),
+    ))
+    cells = {key: row for key, row in cells.items() if key in keys}
+
+    with transaction.atomic():
+        if cells:
+            MonthlyLedger.objects.bulk_create(
+                _ledger_rows(cells),
+                update_conflicts=True,
+                unique_fields=['apartment', 'year', 'month', 'category'],
+                update_fields=['amount', 'paid', 'debt'],
+            )
+
+        # Ячейки, в которых не осталось расходов
+        empty = Q()
+        for apartment_id, year, month, category_id in keys - cells.keys():
+            empty |= Q(apartment_id=apartment_id, year=year, month=month, category_id=category_id)
+        if empty:
+            MonthlyLedger.objects.filter(empty).delete()
+
+
+def refresh_for_expenses(expense_ids):
+    """Пересчитать ячейки, к которым относятся расходы с указанными id"""
+    expenses = Expense.objects.filter(pk__in=expense_ids).only('apartment', 'category', 'date')
+    refresh_cells(ledger_key(expense) for expense in expenses)
+
+
+def refresh_after_bulk(user_ids, cells=()):
+    """
+    bulk_create, bulk_update и update() не шлют сигналы: пересчитать затронутые
+    ячейки леджера и сбросить кэш владельцев данных. Вызывается после каждой такой пачки.
+    """
+    refresh_cells(cells)
+    for user_id in set(user_ids):
+        usercache.bump(user_id)
+
+
+def rebuild_users(user_ids):
+    """Полностью перестроить леджер для указанных пользователей"""
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        MonthlyLedger.objects.filter(user_id__in=user_ids).delete()
+        cells = _aggregate_expenses(Expense.objects.filter(user_id__in=user_ids))
+        MonthlyLedger.objects.bulk_create(_ledger_rows(cells), batch_size=1000)
+    for user_id in user_ids:
+        usercache.bump(user_id)
+    return len(cells)
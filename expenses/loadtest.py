@@ -0,0 +1,105 @@
+import json
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+from . import benchmark
+from .perf import percentile
+
+# Страницы, которые сравниваем под нагрузкой: только чтение, без PDF
+LOAD_SCENARIOS = ('dashboard', 'graphs', 'month_expenses', 'month_readings', 'month_payments')
+
+
+def load_urls(year, month):
+    return [
+        url for name, method, url, data in benchmark.scenarios(None, year, month)
+        if name in LOAD_SCENARIOS and method == 'get'
+    ]
+
+
+def login(base_url, username, password, timeout=10):
+    """
+    Войти через обычную форму входа и вернуть заголовок Cookie с сессией.
+    CSRF-токен берём из cookie: Django принимает его и без маски.
+    """
+    jar = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    login_url = f"{base_url}/accounts/login/"
+    opener.open(login_url, timeout=timeout).read()
+    csrf = next((cookie.value for cookie in jar if cookie.name == 'csrftoken'), '')
+    data = urllib.parse.urlencode({
+        'username': username, 'password': password, 'csrfmiddlewaretoken': csrf,
+    }).encode()
+    opener.open(urllib.request.Request(login_url, data=data, headers={'Referer': login_url}), timeout=timeout).read()
+
+    cookies = {cookie.name: cookie.value for cookie in jar}
+    if 'sessionid' not in cookies:
+        raise ValueError("Не удалось войти: проверьте имя пользователя и пароль")
+    return '; '.join(f"{name}={value}" for name, value in cookies.items())
+
+
+def _worker(base_url, urls, cookie, deadline, offset, timeout):
+    """Запросы по кругу до deadline; возвращает (задержки в мс, число ошибок)"""
+    latencies, errors = [], 0
+    i = offset
+    while time.perf_counter() < deadline:
+        request = urllib.request.Request(base_url + urls[i % len(urls)], headers={'Cookie': cookie})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except (urllib.error.URLError, OSError):
+            errors += 1
+        i += 1
+    return latencies, errors
+
+
+def run(base_url, urls, cookie, concurrency=8, duration=20, timeout=10):
+    """
+    Нагрузить запущенный сервер: concurrency потоков в течение duration секунд.
+    Возвращает {'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'}.
+    """
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(_worker, base_url, urls, cookie, deadline, offset, timeout)
+            for offset in range(concurrency)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+    result = {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'rps': round(len(latencies) / elapsed, 1),
+    }
+    for p in (50, 95, 99):
+        result[f'p{p}_ms'] = round(percentile(latencies, p), 1)
+    return result
+
+
+def save_result(path, label, result):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as results_file:
+        results_file.write(json.dumps({'label': label, **result}, ensure_ascii=False) + '\n')
+
+
+def load_results(path):
+    """Последний результат для каждой метки — в порядке первого появления"""
+    results = {}
+    try:
+        with open(path, encoding='utf-8') as results_file:
+            for line in results_file:
+                if line.strip():
+                    row = json.loads(line)
+                    results[row['label']] = row
+    except FileNotFoundError:
+        pass
+    return list(results.values())
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.importers import IMPORT_BATCH_SIZE, IMPORT_COLUMNS, import_csv
+from expenses.services import user_apartment
+
+
+class Command(BaseCommand):
+    help = "Импорт расходов, платежей или показаний счётчиков из CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('kind', choices=sorted(IMPORT_COLUMNS))
+        parser.add_argument('path')
+        parser.add_argument('--apartment', type=int, help="id квартиры; по умолчанию — основная квартира")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь «{options['username']}» не найден")
+        apartment = user_apartment(user, options['apartment'])
+        if options['apartment'] and apartment.pk != options['apartment']:
+            raise CommandError(f"У пользователя «{user.username}» нет квартиры {options['apartment']}")
+
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            result = import_csv(apartment, options['kind'], stream, batch_size=options['batch_size'])
+
+        for line, error in result['errors']:
+            self.stderr.write(f"строка {line}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: {result['created']}, пропущено дубликатов: {result['skipped']}, "
+            f"ошибок: {len(result['errors'])}"
+        ))
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from expenses import perf
+
+
+class Command(BaseCommand):
+    help = "Перцентили числа SQL-запросов и времени ответа по каждому URL expenses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Сколько последних замеров учитывать")
+        parser.add_argument('--json', action='store_true', help="Вывести отчёт в JSON")
+
+    def handle(self, *args, **options):
+        report = perf.summarize(perf.load_samples(options['limit']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+
+        if not report:
+            self.stdout.write("Замеров пока нет.")
+            return
+
+        header = f"{'URL':<36}{'n':>7}{'SQL p50':>9}{'SQL p95':>9}{'SQL max':>9}{'DB p95':>10}{'render p95':>12}{'total p95':>11}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in report:
+            self.stdout.write(
+                f"{row['view']:<36}{row['count']:>7}{row['queries_p50']:>9}{row['queries_p95']:>9}"
+                f"{row['queries_max']:>9}{row['db_ms_p95']:>10.1f}{row['render_ms_p95']:>12.1f}{row['total_ms_p95']:>11.1f}"
+            )
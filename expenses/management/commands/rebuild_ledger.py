@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from expenses import ledger
+
+
+def _rebuild_chunk(user_ids):
+    try:
+        return ledger.rebuild_users(user_ids)
+    finally:
+        # Каждый поток открывает своё соединение — закрываем его сами
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Перестраивает сводки MonthlyLedger по таблице расходов (для заполнения и восстановления)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Имя пользователя; по умолчанию — все пользователи")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Пользователей в одной транзакции")
+        parser.add_argument('--workers', type=int, default=1, help="Параллельных потоков (для PostgreSQL)")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"Пользователь «{options['user']}» не найден")
+
+        user_ids = list(users.values_list('pk', flat=True))
+        size = max(options['chunk_size'], 1)
+        chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                cells = sum(pool.map(_rebuild_chunk, chunks))
+        else:
+            cells = sum(ledger.rebuild_users(chunk) for chunk in chunks)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Леджер перестроен: пользователей {len(user_ids)}, ячеек {cells}"
+        ))
@@ -0,0 +1,44 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import benchmark
+
+
+class Command(BaseCommand):
+    help = "Прогоняет страницы expenses через тестовый клиент и сравнивает с базовой линией"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench_00000', help="Пользователь из seed_benchmark")
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--month', type=int)
+        parser.add_argument('--repeat', type=int, default=5, help="Повторов для медианы времени")
+        parser.add_argument('--baseline', default='benchmark_baseline.json', help="JSON с базовой линией")
+        parser.add_argument('--threshold', type=float, default=1.25, help="Допустимый рост времени и памяти")
+        parser.add_argument('--update', action='store_true', help="Записать результаты как новую базовую линию")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь «{options['user']}» не найден — запустите seed_benchmark")
+
+        results = benchmark.run(user, options['year'], options['month'], repeat=options['repeat'])
+        self.stdout.write(json.dumps(results, indent=2, ensure_ascii=False))
+
+        if options['update']:
+            benchmark.save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f"Базовая линия записана в {options['baseline']}"))
+            return
+
+        try:
+            baseline = benchmark.load_baseline(options['baseline'])
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING("Базовой линии нет — запустите с --update"))
+            return
+
+        regressions = benchmark.compare(results, baseline, options['threshold'])
+        if regressions:
+            raise CommandError("Регрессии производительности:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Регрессий нет"))
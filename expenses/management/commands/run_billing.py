@@ -0,0 +1,28 @@
+from datetime import date, datetime
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.billing import run_billing
+
+
+class Command(BaseCommand):
+    help = "Начисляет коммунальные расходы месяца по показаниям счётчиков и тарифам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help="Месяц в формате ГГГГ-ММ; по умолчанию — прошедший")
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                period = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError(f"Некорректный месяц «{options['month']}», нужен ГГГГ-ММ")
+        else:
+            period = date.today().replace(day=1) - relativedelta(months=1)
+
+        result = run_billing(period.year, period.month)
+        self.stdout.write(self.style.SUCCESS(
+            f"{period:%m.%Y}: создано расходов {result['created']}, пересчитано {result['updated']}, "
+            f"пропущено (введены вручную или нет категории) {result['skipped']}"
+        ))
@@ -0,0 +1,52 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import benchmark, loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагружает запущенный сервер страницами expenses и сравнивает пропускную способность "
+        "профилей БД. Пример: seed_benchmark, затем под каждым профилем "
+        "«DB_ENGINE=postgres DB_CONN_MAX_AGE=0 gunicorn core.wsgi -w 4» и "
+        "«run_load_test --label pg-no-reuse» (далее DB_CONN_MAX_AGE=60, DB_POOL=1, "
+        "DB_ENGINE=sqlite CACHE_BACKEND=redis — кэш должен быть общим для воркеров)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Адрес запущенного сервера")
+        parser.add_argument('--user', default='bench_00000', help="Пользователь из seed_benchmark")
+        parser.add_argument('--password', default=benchmark.BENCHMARK_PASSWORD)
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--month', type=int)
+        parser.add_argument('--concurrency', type=int, default=8, help="Одновременных клиентов")
+        parser.add_argument('--duration', type=int, default=20, help="Длительность, секунд")
+        parser.add_argument('--label', required=True, help="Имя профиля в таблице сравнения")
+        parser.add_argument('--results', default=settings.BASE_DIR / 'var' / 'load_test_results.jsonl',
+                            help="Файл с результатами прогонов (по умолчанию в var/, вне git)")
+
+    def handle(self, *args, **options):
+        today = date.today()
+        base_url = options['url'].rstrip('/')
+        try:
+            cookie = loadtest.login(base_url, options['user'], options['password'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Вход на {base_url} не удался: {exc}")
+
+        urls = loadtest.load_urls(options['year'] or today.year, options['month'] or today.month)
+        result = loadtest.run(base_url, urls, cookie, options['concurrency'], options['duration'])
+        loadtest.save_result(options['results'], options['label'], result)
+
+        # Все профили из файла результатов; первый — точка отсчёта
+        rows = loadtest.load_results(options['results'])
+        baseline = rows[0]['rps'] or 1
+        self.stdout.write(f"{'Профиль':<20} {'RPS':>8} {'×':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'Ошибок':>7}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['label']:<20} {row['rps']:>8} {row['rps'] / baseline:>6.2f} "
+                f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['errors']:>7}"
+            )
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(f"Ошибок в этом прогоне: {result['errors']}"))
@@ -0,0 +1,125 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from expenses import pdf
+from expenses.models import PDFExportJob
+
+# Как часто возвращать зависшие задания и чистить кэш, сек
+HOUSEKEEPING_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Воркер очереди PDF-отчётов: рендерит задания в пуле процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help="Размер пула процессов")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Пауза между опросами очереди, сек")
+        parser.add_argument('--once', action='store_true', help="Обработать очередь и выйти")
+        parser.add_argument('--stale-after', type=int, default=pdf.STALE_JOB_SECONDS,
+                            help="Через сколько секунд задание «формируется» считается брошенным")
+        parser.add_argument('--cache-max-age', type=int, default=pdf.CACHE_MAX_AGE_DAYS,
+                            help="Удалять из кэша файлы, которые не запрашивали столько дней")
+
+    def requeue_stale(self, seconds):
+        """Вернуть в очередь задания, которые взял и не закончил упавший воркер"""
+        deadline = timezone.now() - timedelta(seconds=seconds)
+        return (
+            PDFExportJob.objects
+            .filter(status=PDFExportJob.STATUS_RUNNING)
+            .filter(Q(started_at__lt=deadline) | Q(started_at__isnull=True))
+            .update(status=PDFExportJob.STATUS_PENDING, started_at=None)
+        )
+
+    def housekeeping(self, options):
+        requeued = self.requeue_stale(options['stale_after'])
+        removed = pdf.prune_cache(options['cache_max_age'])
+        if requeued or removed:
+            self.stdout.write(f"Возвращено в очередь: {requeued}, удалено из кэша: {removed}")
+
+    def claim_jobs(self, limit):
+        with transaction.atomic():
+            ids = list(
+                PDFExportJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=PDFExportJob.STATUS_PENDING)
+                .values_list('pk', flat=True)[:limit]
+            )
+            PDFExportJob.objects.filter(pk__in=ids).update(
+                status=PDFExportJob.STATUS_RUNNING, started_at=timezone.now()
+            )
+        return list(PDFExportJob.objects.filter(pk__in=ids).select_related('apartment'))
+
+    def finish(self, job, error=''):
+        job.status = PDFExportJob.STATUS_FAILED if error else PDFExportJob.STATUS_DONE
+        job.error = error
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at', 'content_hash'])
+
+    def fail(self, job, exc):
+        self.finish(job, error=str(exc) or exc.__class__.__name__)
+        self.stderr.write(f"{job}: {exc}")
+
+    def submit(self, pool, jobs):
+        """Поставить задания в пул; ошибка одного задания не останавливает остальные"""
+        futures = {}
+        css_path = pdf.stylesheet_path()
+        for job in jobs:
+            try:
+                # Данные могли измениться после постановки в очередь — считаем ключ заново
+                job.content_hash, path, pages = pdf.prepare_export(job.apartment, job.start, job.end, job.format)
+                if os.path.exists(path):
+                    self.finish(job)
+                    continue
+                futures[pool.submit(pdf.write_export, pages(), path, job.format, css_path)] = job
+            except Exception as exc:
+                self.fail(job, exc)
+        return futures
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        self.housekeeping(options)
+        last_housekeeping = time.monotonic()
+
+        pool = ProcessPoolExecutor(max_workers=processes)
+        try:
+            while True:
+                if time.monotonic() - last_housekeeping >= HOUSEKEEPING_INTERVAL:
+                    self.housekeeping(options)
+                    last_housekeeping = time.monotonic()
+
+                jobs = self.claim_jobs(processes * 2)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                futures = self.submit(pool, jobs)
+                broken = False
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        future.result()
+                    except BrokenProcessPool as exc:
+                        # Процесс пула упал (например, WeasyPrint на битом HTML) — пул больше не принимает задач
+                        broken = True
+                        self.fail(job, exc)
+                    except Exception as exc:
+                        self.fail(job, exc)
+                    else:
+                        self.finish(job)
+                        self.stdout.write(f"{job}")
+
+                if broken:
+                    pool.shutdown(wait=False)
+                    pool = ProcessPoolExecutor(max_workers=processes)
+        finally:
+            pool.shutdown()
@@ -0,0 +1,28 @@
+from datetime import date, datetime
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.recurring import ROLLOVER_BATCH_SIZE, run_rollover
+
+
+class Command(BaseCommand):
+    help = "Создаёт расходы месяца по шаблонам повторяющихся расходов (повторный запуск безопасен)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help="Месяц в формате ГГГГ-ММ; по умолчанию — следующий")
+        parser.add_argument('--batch-size', type=int, default=ROLLOVER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                period = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError(f"Некорректный месяц «{options['month']}», нужен ГГГГ-ММ")
+        else:
+            period = date.today().replace(day=1) + relativedelta(months=1)
+
+        result = run_rollover(period.year, period.month, batch_size=max(options['batch_size'], 1))
+        self.stdout.write(self.style.SUCCESS(
+            f"{period:%m.%Y}: создано расходов {result['created']}, уже было {result['skipped']}"
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses import benchmark
+
+
+class Command(BaseCommand):
+    help = "Создаёт синтетических пользователей с многолетней историей для бенчмарков"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--years', type=int, default=3)
+        parser.add_argument('--prefix', default='bench', help="Префикс имён пользователей")
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора случайных чисел")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        users = benchmark.seed(
+            users=options['users'], years=options['years'],
+            prefix=options['prefix'], seed_value=options['seed']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано пользователей: {len(users)} × {options['years']} г. истории "
+            f"за {time.perf_counter() - start:.1f} с (пароль «{benchmark.BENCHMARK_PASSWORD}»)"
+        ))
@@ -0,0 +1,123 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from . import perf
+
+logger = logging.getLogger('expenses.perf')
+
+
+class QueryCounter:
+    """execute_wrapper: считает SQL-запросы и суммарное время в БД"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+# connection — прокси на соединение текущего потока, поэтому обращаться
+# к нему нужно внутри sync_to_async, а не в потоке цикла событий
+def _install_wrapper(counter):
+    connection.execute_wrappers.append(counter)
+
+
+def _remove_wrapper(counter):
+    connection.execute_wrappers.remove(counter)
+
+
+class QueryStatsMiddleware:
+    """
+    Замеры для всех URL пространства имён expenses: число SQL-запросов,
+    время в БД, время рендеринга шаблона и общее время ответа.
+
+    Запросы считаются всегда, и превышение PERF_QUERY_BUDGET пишется в лог
+    как предупреждение; в файл замеры попадают только при PERF_STATS_ENABLED.
+
+    Работает и под ASGI без перехода в поток на каждый запрос: там ORM
+    выполняется в потоке sync_to_async, поэтому счётчик ставится в нём же.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        request._perf_render = [None, None]
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        view = self.check_budget(request, counter)
+        if view and settings.PERF_STATS_ENABLED:
+            self.record(request, response, view, counter, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        request._perf_render = [None, None]
+        start = time.perf_counter()
+        await sync_to_async(_install_wrapper)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_wrapper)(counter)
+        view = self.check_budget(request, counter)
+        if view and settings.PERF_STATS_ENABLED:
+            # Запись в файл и request.user (может сходить в БД) — тоже в потоке ORM
+            await sync_to_async(self.record)(request, response, view, counter, time.perf_counter() - start)
+        return response
+
+    def check_budget(self, request, counter):
+        """Имя URL expenses (None для остальных) и предупреждение о превышении бюджета запросов"""
+        match = request.resolver_match
+        if match is None or match.namespace != 'expenses':
+            return None
+
+        view = f"{match.namespace}:{match.url_name}"
+        if counter.count > settings.PERF_QUERY_BUDGET:
+            logger.warning(
+                "%s: %d SQL-запросов (бюджет %d), %.1f мс в БД",
+                view, counter.count, settings.PERF_QUERY_BUDGET, counter.duration * 1000
+            )
+        return view
+
+    def record(self, request, response, view, counter, total):
+        render_start, render_end = request._perf_render
+        perf.record({
+            'view': view,
+            'user': request.user.pk if request.user.is_authenticated else None,
+            'status': response.status_code,
+            'queries': counter.count,
+            'db_ms': round(counter.duration * 1000, 2),
+            'render_ms': round((render_end - render_start) * 1000, 2) if render_end else 0,
+            'total_ms': round(total * 1000, 2),
+            'ts': time.time(),
+        })
+
+    def process_template_response(self, request, response):
+        marks = getattr(request, '_perf_render', None)
+        if marks is not None:
+            marks[0] = time.perf_counter()
+
+            def rendered(response):
+                marks[1] = time.perf_counter()
+
+            response.add_post_render_callback(rendered)
+        return response
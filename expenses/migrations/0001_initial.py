@@ -0,0 +1,126 @@
+# Generated by Django 5.2 on 2026-10-16 23:39
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Apartment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(blank=True, max_length=255, verbose_name='адрес')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'квартира',
+                'verbose_name_plural': 'квартиры',
+            },
+        ),
+        migrations.CreateModel(
+            name='Credit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='сумма')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'кредит (переплата)',
+                'verbose_name_plural': 'кредиты',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpenseCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='название')),
+                ('priority', models.PositiveIntegerField(default=100, verbose_name='приоритет')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'категория расходов',
+                'verbose_name_plural': 'категории расходов',
+                'ordering': ['priority', 'name'],
+                'unique_together': {('user', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Expense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='сумма')),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='оплачено')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('description', models.TextField(blank=True, verbose_name='описание')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.expensecategory', verbose_name='категория')),
+            ],
+            options={
+                'verbose_name': 'расход',
+                'verbose_name_plural': 'расходы',
+                'ordering': ['-date', 'category'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='сумма')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('description', models.TextField(blank=True, verbose_name='описание')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'платёж',
+                'verbose_name_plural': 'платежи',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='сумма')),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_allocations', to='expenses.expense', verbose_name='расход')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='expenses.payment', verbose_name='платёж')),
+            ],
+            options={
+                'verbose_name': 'распределение платежа',
+                'verbose_name_plural': 'распределения платежей',
+                'unique_together': {('payment', 'expense')},
+            },
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='payments',
+            field=models.ManyToManyField(related_name='allocated_expenses', through='expenses.PaymentAllocation', to='expenses.payment', verbose_name='платежи'),
+        ),
+        migrations.CreateModel(
+            name='MeterReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('cold_water', 'Холодная вода'), ('hot_water', 'Горячая вода'), ('electricity', 'Электричество')], max_length=20, verbose_name='тип')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='значение')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'показание счётчика',
+                'verbose_name_plural': 'показания счётчиков',
+                'ordering': ['-date', 'type'],
+                'unique_together': {('user', 'type', 'date')},
+            },
+        ),
+    ]
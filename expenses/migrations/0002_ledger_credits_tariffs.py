@@ -0,0 +1,203 @@
+# Generated by Django 5.2 on 2026-10-16 23:39
+
+import django.core.validators
+import django.db.models.deletion
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditApplication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='сумма')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+            ],
+            options={
+                'verbose_name': 'списание кредита',
+                'verbose_name_plural': 'списания кредитов',
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='месяц')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='сумма')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='оплачено')),
+                ('debt', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='долг')),
+            ],
+            options={
+                'verbose_name': 'сводка за месяц',
+                'verbose_name_plural': 'сводки за месяц',
+                'ordering': ['year', 'month', 'category'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PDFExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='месяц')),
+                ('end_year', models.PositiveSmallIntegerField(verbose_name='год окончания')),
+                ('end_month', models.PositiveSmallIntegerField(verbose_name='месяц окончания')),
+                ('format', models.CharField(choices=[('pdf', 'PDF'), ('zip', 'ZIP')], default='pdf', max_length=3, verbose_name='формат')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='хэш содержимого')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='статус')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='завершено')),
+            ],
+            options={
+                'verbose_name': 'экспорт PDF',
+                'verbose_name_plural': 'экспорты PDF',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecurringExpense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='сумма')),
+                ('day', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(31)], verbose_name='день месяца')),
+                ('description', models.TextField(blank=True, verbose_name='описание')),
+                ('active', models.BooleanField(default=True, verbose_name='активен')),
+            ],
+            options={
+                'verbose_name': 'повторяющийся расход',
+                'verbose_name_plural': 'повторяющиеся расходы',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meter_type', models.CharField(choices=[('cold_water', 'Холодная вода'), ('hot_water', 'Горячая вода'), ('electricity', 'Электричество')], max_length=20, verbose_name='тип счётчика')),
+                ('kind', models.CharField(choices=[('flat', 'Единая цена'), ('tiered', 'Ступенчатый'), ('seasonal', 'По периодам года')], default='flat', max_length=10, verbose_name='вид тарифа')),
+                ('rate', models.DecimalField(decimal_places=4, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='цена за единицу')),
+                ('category_name', models.CharField(max_length=50, verbose_name='категория расходов')),
+                ('valid_from', models.DateField(verbose_name='действует с')),
+            ],
+            options={
+                'verbose_name': 'тариф',
+                'verbose_name_plural': 'тарифы',
+                'ordering': ['meter_type', 'valid_from'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TariffBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='цена за единицу')),
+                ('up_to', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='до (единиц в месяц)')),
+                ('month_from', models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(12)], verbose_name='с месяца')),
+                ('month_to', models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(12)], verbose_name='по месяц')),
+            ],
+            options={
+                'verbose_name': 'ступень тарифа',
+                'verbose_name_plural': 'ступени тарифа',
+            },
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='payment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='credits', to='expenses.payment', verbose_name='платёж'),
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='remaining',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='остаток'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='billed',
+            field=models.BooleanField(default=False, editable=False, verbose_name='начислен по тарифу'),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='debt',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('amount'), '-', models.F('paid_amount')), output_field=models.DecimalField(decimal_places=2, max_digits=10), verbose_name='долг'),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(fields=['user', 'date'], name='credit_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['user', 'date'], name='credit_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', 'date'], name='expense_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', 'category', 'date'], name='expense_user_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(condition=models.Q(('debt__gt', 0)), fields=['user', 'category', 'date'], name='expense_open_debt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meterreading',
+            index=models.Index(fields=['user', 'date'], name='reading_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'date'], name='payment_user_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='creditapplication',
+            name='credit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='applications', to='expenses.credit', verbose_name='кредит'),
+        ),
+        migrations.AddField(
+            model_name='creditapplication',
+            name='expense',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_applications', to='expenses.expense', verbose_name='расход'),
+        ),
+        migrations.AddField(
+            model_name='monthlyledger',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.expensecategory', verbose_name='категория'),
+        ),
+        migrations.AddField(
+            model_name='monthlyledger',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AddField(
+            model_name='pdfexportjob',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AddField(
+            model_name='recurringexpense',
+            name='category',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recurring', to='expenses.expensecategory', verbose_name='категория'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tariff',
+            unique_together={('meter_type', 'valid_from')},
+        ),
+        migrations.AddField(
+            model_name='tariffband',
+            name='tariff',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='expenses.tariff', verbose_name='тариф'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlyledger',
+            unique_together={('user', 'year', 'month', 'category')},
+        ),
+    ]
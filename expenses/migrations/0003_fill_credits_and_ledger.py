@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def fill_credit_remaining(apps, schema_editor):
+    # Списаний кредитов раньше не было — остаток равен всей сумме
+    apps.get_model('expenses', 'Credit').objects.update(remaining=F('amount'))
+
+
+def fill_ledger(apps, schema_editor):
+    """Сводки по уже внесённым расходам — то же, что rebuild_ledger"""
+    Expense = apps.get_model('expenses', 'Expense')
+    MonthlyLedger = apps.get_model('expenses', 'MonthlyLedger')
+    rows = (
+        Expense.objects
+        .values('user_id', 'category_id', year=ExtractYear('date'), month=ExtractMonth('date'))
+        .annotate(cell_amount=Sum('amount'), cell_paid=Sum('paid_amount'), cell_debt=Sum('debt'))
+        .order_by()
+    )
+    MonthlyLedger.objects.bulk_create([
+        MonthlyLedger(
+            user_id=row['user_id'], category_id=row['category_id'], year=row['year'], month=row['month'],
+            amount=row['cell_amount'], paid=row['cell_paid'], debt=row['cell_debt'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    # Данные отдельно от схемы 0002 — по той же причине, что и 0005_fill_apartments
+
+    dependencies = [
+        ('expenses', '0002_ledger_credits_tariffs'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_credit_remaining, migrations.RunPython.noop),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,100 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Квартира у записей: сначала nullable, заполняется в 0005, обязательной становится в 0006
+
+    dependencies = [
+        ('expenses', '0003_fill_credits_and_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='apartment',
+            options={'ordering': ['pk'], 'verbose_name': 'квартира', 'verbose_name_plural': 'квартиры'},
+        ),
+        migrations.RemoveIndex(
+            model_name='credit',
+            name='credit_user_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='credit',
+            name='credit_open_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_user_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_user_cat_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_open_debt_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='meterreading',
+            name='reading_user_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='payment_user_date_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='meterreading',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlyledger',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='apartment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='apartment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AddField(
+            model_name='meterreading',
+            name='apartment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AddField(
+            model_name='monthlyledger',
+            name='apartment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='apartment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AddField(
+            model_name='pdfexportjob',
+            name='apartment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AddField(
+            model_name='recurringexpense',
+            name='apartment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterField(
+            model_name='apartment',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='apartments', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='recurringexpense',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring', to='expenses.expensecategory', verbose_name='категория'),
+        ),
+    ]
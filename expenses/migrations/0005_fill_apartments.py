@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+APARTMENT_SCOPED = [
+    'credit', 'expense', 'meterreading', 'monthlyledger', 'payment', 'pdfexportjob', 'recurringexpense',
+]
+
+
+def fill_apartments(apps, schema_editor):
+    """
+    Существующие записи переходят в квартиру владельца — ту, что была у него
+    по OneToOne. Пользователям без квартиры она создаётся здесь.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Apartment = apps.get_model('expenses', 'Apartment')
+    Apartment.objects.bulk_create([
+        Apartment(user=user) for user in User.objects.filter(apartments__isnull=True)
+    ])
+
+    main = Apartment.objects.filter(user=OuterRef('user')).order_by('pk').values('pk')[:1]
+    for model_name in APARTMENT_SCOPED:
+        model = apps.get_model('expenses', model_name)
+        if model_name == 'recurringexpense':
+            # У шаблона нет user — владелец берётся через категорию
+            apartment = Apartment.objects.filter(user__expensecategory=OuterRef('category')).order_by('pk')
+            model.objects.update(apartment=Subquery(apartment.values('pk')[:1]))
+        else:
+            model.objects.filter(apartment__isnull=True).update(apartment=Subquery(main))
+
+
+class Migration(migrations.Migration):
+    # Отдельная миграция только с данными: на PostgreSQL UPDATE столбцов FK оставляет
+    # отложенные проверки до коммита, и ALTER TABLE в той же транзакции упал бы
+
+    dependencies = [
+        ('expenses', '0004_apartment_nullable'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_apartments, migrations.RunPython.noop),
+    ]
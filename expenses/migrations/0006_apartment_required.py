@@ -0,0 +1,87 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0005_fill_apartments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='credit',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterField(
+            model_name='meterreading',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterField(
+            model_name='monthlyledger',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterField(
+            model_name='pdfexportjob',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterField(
+            model_name='recurringexpense',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expenses.apartment', verbose_name='квартира'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='meterreading',
+            unique_together={('apartment', 'type', 'date')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlyledger',
+            unique_together={('apartment', 'year', 'month', 'category')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='recurringexpense',
+            unique_together={('apartment', 'category')},
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(fields=['apartment', 'date'], name='credit_apt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['apartment', 'date'], name='credit_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['apartment', 'date'], name='expense_apt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['apartment', 'category', 'date'], name='expense_apt_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(condition=models.Q(('debt__gt', 0)), fields=['apartment', 'category', 'date'], name='expense_open_debt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meterreading',
+            index=models.Index(fields=['apartment', 'date'], name='reading_apt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['apartment', 'date'], name='payment_apt_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_apartment_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfexportjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='взято в работу'),
+        ),
+    ]
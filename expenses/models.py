@@ -1,13 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.core.validators import MinValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
 
 class Apartment(models.Model):
-    user = models.OneToOneField(
+    # У пользователя может быть много квартир; первая (по pk) — основная
+    user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        related_name='apartments',
         verbose_name=_("пользователь")
     )
     address = models.CharField(
@@ -17,11 +19,12 @@ class Apartment(models.Model):
     )
 
     class Meta:
+        ordering = ['pk']
         verbose_name = _("квартира")
         verbose_name_plural = _("квартиры")
 
     def __str__(self):
-        return f"Квартира {self.user.username}"
+        return self.address or f"Квартира №{self.pk}"
 
 
 class ExpenseCategory(models.Model):
@@ -55,6 +58,11 @@ class Expense(models.Model):
         on_delete=models.CASCADE,
         verbose_name=_("пользователь")
     )
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        verbose_name=_("квартира")
+    )
     category = models.ForeignKey(
         ExpenseCategory,
         on_delete=models.CASCADE,
@@ -73,8 +81,19 @@ class Expense(models.Model):
         validators=[MinValueValidator(0)],
         verbose_name=_("оплачено")
     )
+    # Долг считает сама БД при каждой записи amount/paid_amount, в том числе
+    # через bulk_update — по нему работает частичный индекс открытых долгов.
+    # После save() значение в объекте обновляется только через refresh_from_db().
+    debt = models.GeneratedField(
+        expression=models.F('amount') - models.F('paid_amount'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+        verbose_name=_("долг")
+    )
     date = models.DateField(verbose_name=_("дата"))
     description = models.TextField(blank=True, verbose_name=_("описание"))
+    # Начислен по тарифу из показаний — только такие расходы billing пересчитывает
+    billed = models.BooleanField(default=False, editable=False, verbose_name=_("начислен по тарифу"))
 
     # Связи
     payments = models.ManyToManyField(
@@ -86,16 +105,58 @@ class Expense(models.Model):
 
     class Meta:
         ordering = ['-date', 'category']
+        indexes = [
+            # Расходы квартиры за месяц/год, в том числе по категории (проверка дубликата в форме)
+            models.Index(fields=['apartment', 'date'], name='expense_apt_date_idx'),
+            models.Index(fields=['apartment', 'category', 'date'], name='expense_apt_cat_date_idx'),
+            # Открытые долги в порядке «водопада» — обычно малая часть таблицы
+            models.Index(
+                fields=['apartment', 'category', 'date'],
+                name='expense_open_debt_idx',
+                condition=models.Q(debt__gt=0),
+            ),
+        ]
         verbose_name = _("расход")
         verbose_name_plural = _("расходы")
 
     def __str__(self):
         return f"{self.category} — {self.date}: {self.amount} €"
 
-    @property
-    def debt(self):
-        """Долг по расходу"""
-        return self.amount - self.paid_amount
+
+class RecurringExpense(models.Model):
+    """Шаблон ежемесячного расхода категории квартиры — по нему run_rollover создаёт расходы месяца"""
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        verbose_name=_("квартира")
+    )
+    category = models.ForeignKey(
+        ExpenseCategory,
+        on_delete=models.CASCADE,
+        related_name='recurring',
+        verbose_name=_("категория")
+    )
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+        verbose_name=_("сумма")
+    )
+    day = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1), MaxValueValidator(31)],
+        verbose_name=_("день месяца")
+    )
+    description = models.TextField(blank=True, verbose_name=_("описание"))
+    active = models.BooleanField(default=True, verbose_name=_("активен"))
+
+    class Meta:
+        unique_together = ['apartment', 'category']
+        verbose_name = _("повторяющийся расход")
+        verbose_name_plural = _("повторяющиеся расходы")
+
+    def __str__(self):
+        return f"{self.category} — {self.amount} € каждый месяц"
 
 
 class MeterReading(models.Model):
@@ -110,6 +171,11 @@ class MeterReading(models.Model):
         on_delete=models.CASCADE,
         verbose_name=_("пользователь")
     )
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        verbose_name=_("квартира")
+    )
     type = models.CharField(
         max_length=20,
         choices=TYPE_CHOICES,
@@ -125,7 +191,10 @@ class MeterReading(models.Model):
 
     class Meta:
         ordering = ['-date', 'type']
-        unique_together = ['user', 'type', 'date']
+        unique_together = ['apartment', 'type', 'date']
+        indexes = [
+            models.Index(fields=['apartment', 'date'], name='reading_apt_date_idx'),
+        ]
         verbose_name = _("показание счётчика")
         verbose_name_plural = _("показания счётчиков")
 
@@ -136,12 +205,117 @@ class MeterReading(models.Model):
         return "kWh" if self.type == 'electricity' else "м³"
 
 
+class Tariff(models.Model):
+    """
+    Тариф на показания счётчика. Действует с valid_from до следующего тарифа
+    того же типа; начисление попадает в категорию пользователя category_name.
+    """
+    KIND_FLAT = 'flat'
+    KIND_TIERED = 'tiered'
+    KIND_SEASONAL = 'seasonal'
+    KIND_CHOICES = [
+        (KIND_FLAT, _("Единая цена")),
+        (KIND_TIERED, _("Ступенчатый")),
+        (KIND_SEASONAL, _("По периодам года")),
+    ]
+
+    meter_type = models.CharField(
+        max_length=20,
+        choices=MeterReading.TYPE_CHOICES,
+        verbose_name=_("тип счётчика")
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        default=KIND_FLAT,
+        verbose_name=_("вид тарифа")
+    )
+    # Цена единицы для единого тарифа и вне периодов сезонного
+    rate = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        default=0,
+        validators=[MinValueValidator(0)],
+        verbose_name=_("цена за единицу")
+    )
+    category_name = models.CharField(
+        max_length=50,
+        verbose_name=_("категория расходов")
+    )
+    valid_from = models.DateField(verbose_name=_("действует с"))
+
+    class Meta:
+        ordering = ['meter_type', 'valid_from']
+        unique_together = ['meter_type', 'valid_from']
+        verbose_name = _("тариф")
+        verbose_name_plural = _("тарифы")
+
+    def __str__(self):
+        return f"{self.get_meter_type_display()} — {self.get_kind_display()} с {self.valid_from}"
+
+
+class TariffBand(models.Model):
+    """
+    Ступень тарифа: для ступенчатого — цена расхода до up_to единиц в месяц
+    (последняя ступень без границы), для сезонного — цена в месяцы month_from..month_to
+    (период может переходить через Новый год, например 10..3).
+    """
+    tariff = models.ForeignKey(
+        Tariff,
+        on_delete=models.CASCADE,
+        related_name='bands',
+        verbose_name=_("тариф")
+    )
+    rate = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        validators=[MinValueValidator(0)],
+        verbose_name=_("цена за единицу")
+    )
+    up_to = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_("до (единиц в месяц)")
+    )
+    month_from = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(12)],
+        verbose_name=_("с месяца")
+    )
+    month_to = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(12)],
+        verbose_name=_("по месяц")
+    )
+
+    class Meta:
+        verbose_name = _("ступень тарифа")
+        verbose_name_plural = _("ступени тарифа")
+
+    def __str__(self):
+        return f"{self.tariff}: {self.rate}"
+
+    def covers_month(self, month):
+        if self.month_from <= self.month_to:
+            return self.month_from <= month <= self.month_to
+        return month >= self.month_from or month <= self.month_to
+
+
 class Payment(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         verbose_name=_("пользователь")
     )
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        verbose_name=_("квартира")
+    )
     amount = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -156,6 +330,9 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['apartment', 'date'], name='payment_apt_date_idx'),
+        ]
         verbose_name = _("платёж")
         verbose_name_plural = _("платежи")
 
@@ -191,6 +368,7 @@ class PaymentAllocation(models.Model):
     )
 
     class Meta:
+        # Уникальность (payment, expense) уже даёт составной индекс с payment впереди
         unique_together = ('payment', 'expense')
         verbose_name = _("распределение платежа")
         verbose_name_plural = _("распределения платежей")
@@ -205,18 +383,200 @@ class Credit(models.Model):
         on_delete=models.CASCADE,
         verbose_name=_("пользователь")
     )
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        verbose_name=_("квартира")
+    )
     amount = models.DecimalField(
         max_digits=10,
         decimal_places=2,
         validators=[MinValueValidator(0)],
         verbose_name=_("сумма")
     )
+    # Неизрасходованный остаток: уменьшается, когда кредит гасит новые расходы
+    remaining = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name=_("остаток")
+    )
+    # Платёж, переплата по которому стала кредитом: при отмене платежа кредит удаляется
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='credits',
+        verbose_name=_("платёж")
+    )
     date = models.DateField(verbose_name=_("дата"))
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['apartment', 'date'], name='credit_apt_date_idx'),
+            # Израсходованные кредиты остаются для истории, но в суммы и FIFO не попадают
+            models.Index(
+                fields=['apartment', 'date'],
+                name='credit_open_idx',
+                condition=models.Q(remaining__gt=0),
+            ),
+        ]
         verbose_name = _("кредит (переплата)")
         verbose_name_plural = _("кредиты")
 
     def __str__(self):
-        return f"Кредит {self.amount} € — {self.date}"
\ No newline at end of file
+        return f"Кредит {self.amount} € — {self.date}"
+
+    def save(self, *args, **kwargs):
+        if self.remaining is None:
+            self.remaining = self.amount
+        super().save(*args, **kwargs)
+
+
+class CreditApplication(models.Model):
+    """Списание кредита в счёт расхода — то же, что PaymentAllocation для платежа"""
+    credit = models.ForeignKey(
+        Credit,
+        on_delete=models.CASCADE,
+        related_name='applications',
+        verbose_name=_("кредит")
+    )
+    expense = models.ForeignKey(
+        Expense,
+        on_delete=models.CASCADE,
+        related_name='credit_applications',
+        verbose_name=_("расход")
+    )
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+        verbose_name=_("сумма")
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("создано"))
+
+    class Meta:
+        verbose_name = _("списание кредита")
+        verbose_name_plural = _("списания кредитов")
+
+    def __str__(self):
+        return f"{self.amount} €: {self.credit} → {self.expense}"
+
+
+class MonthlyLedger(models.Model):
+    """Предрасчитанные суммы по категории квартиры за месяц (поддерживается в ledger.py)"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name=_("пользователь")
+    )
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        verbose_name=_("квартира")
+    )
+    year = models.PositiveSmallIntegerField(verbose_name=_("год"))
+    month = models.PositiveSmallIntegerField(verbose_name=_("месяц"))
+    category = models.ForeignKey(
+        ExpenseCategory,
+        on_delete=models.CASCADE,
+        verbose_name=_("категория")
+    )
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("сумма")
+    )
+    paid = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("оплачено")
+    )
+    debt = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name=_("долг")
+    )
+
+    class Meta:
+        unique_together = ['apartment', 'year', 'month', 'category']
+        ordering = ['year', 'month', 'category']
+        verbose_name = _("сводка за месяц")
+        verbose_name_plural = _("сводки за месяц")
+
+    def __str__(self):
+        return f"{self.apartment} — {self.month:02d}.{self.year} {self.category}: {self.debt} €"
+
+
+class PDFExportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _("В очереди")),
+        (STATUS_RUNNING, _("Формируется")),
+        (STATUS_DONE, _("Готово")),
+        (STATUS_FAILED, _("Ошибка")),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name=_("пользователь")
+    )
+    apartment = models.ForeignKey(
+        Apartment,
+        on_delete=models.CASCADE,
+        verbose_name=_("квартира")
+    )
+    year = models.PositiveSmallIntegerField(verbose_name=_("год"))
+    month = models.PositiveSmallIntegerField(verbose_name=_("месяц"))
+    # Для пакетного отчёта — последний месяц периода (для обычного совпадает с первым)
+    end_year = models.PositiveSmallIntegerField(verbose_name=_("год окончания"))
+    end_month = models.PositiveSmallIntegerField(verbose_name=_("месяц окончания"))
+    format = models.CharField(
+        max_length=3,
+        choices=[('pdf', 'PDF'), ('zip', 'ZIP')],
+        default='pdf',
+        verbose_name=_("формат")
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        verbose_name=_("хэш содержимого")
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name=_("статус")
+    )
+    error = models.TextField(blank=True, verbose_name=_("ошибка"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("создано"))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_("взято в работу"))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_("завершено"))
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = _("экспорт PDF")
+        verbose_name_plural = _("экспорты PDF")
+
+    def __str__(self):
+        period = f"{self.month:02d}.{self.year}"
+        if self.end != self.start:
+            period += f"–{self.end_month:02d}.{self.end_year}"
+        return f"{self.get_format_display()} {period} ({self.user}) — {self.get_status_display()}"
+
+    @property
+    def start(self):
+        return (self.year, self.month)
+
+    @property
+    def end(self):
+        return (self.end_year, self.end_month)
@@ -0,0 +1,259 @@
+import hashlib
+import os
+import time
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.template.loader import render_to_string
+from django.utils import timezone
+from dateutil.relativedelta import relativedelta
+
+from .models import Expense, MeterReading, Payment, PDFExportJob
+
+TEMPLATE_NAME = 'expenses/pdf_export.html'
+STYLESHEET = 'css/pdf_report.css'
+
+# Поднимать при изменении шаблона отчёта — старые файлы в кэше перестанут совпадать
+REPORT_VERSION = 2
+
+# Ограничение на размер пакетного отчёта (10 лет помесячно)
+MAX_BATCH_MONTHS = 120
+
+# Задание в статусе «формируется» дольше этого — воркер упал, задание возвращается в очередь
+STALE_JOB_SECONDS = 15 * 60
+
+# Задание в очереди дольше этого так и не взяли — воркер не запущен
+PENDING_TIMEOUT_SECONDS = 5 * 60
+NO_WORKER_ERROR = "воркер отчётов не запущен (manage.py run_pdf_worker)"
+
+# Файлы в кэше, которые не запрашивали столько дней, удаляются воркером
+CACHE_MAX_AGE_DAYS = 30
+
+FORMAT_PDF = 'pdf'
+FORMAT_ZIP = 'zip'
+
+
+def iter_months(start, end):
+    """(год, месяц) от start до end включительно"""
+    current = date(*start, 1)
+    last = date(*end, 1)
+    while current <= last:
+        yield current.year, current.month
+        current += relativedelta(months=1)
+
+
+def range_report_data(apartment, start, end):
+    """
+    Данные отчётов за все месяцы от start до end включительно.
+
+    Три запроса на весь период вместо трёх на каждый месяц;
+    строки раскладываются по месяцам в памяти.
+    """
+    period = {
+        'date__gte': date(*start, 1),
+        'date__lt': date(*end, 1) + relativedelta(months=1),
+    }
+
+    expenses = defaultdict(list)
+    for e in Expense.objects.filter(apartment=apartment, **period).select_related('category'):
+        expenses[e.date.year, e.date.month].append(e)
+
+    readings = defaultdict(list)
+    for r in MeterReading.objects.filter(apartment=apartment, **period):
+        readings[r.date.year, r.date.month].append(r)
+
+    payments = {
+        (row['period'].year, row['period'].month): row['total']
+        for row in Payment.objects.filter(apartment=apartment, **period)
+        .annotate(period=TruncMonth('date'))
+        .values('period')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    }
+
+    return [
+        {
+            'month': datetime(year, month, 1),
+            'expenses': expenses[year, month],
+            'meter_readings': readings[year, month],
+            'total_debt': sum(e.debt for e in expenses[year, month]),
+            'total_payments': payments.get((year, month)) or 0,
+        }
+        for year, month in iter_months(start, end)
+    ]
+
+
+def month_report_data(apartment, year, month):
+    """Данные отчёта за один месяц"""
+    return range_report_data(apartment, (year, month), (year, month))[0]
+
+
+def content_hash(context):
+    """Хэш содержимого отчёта за месяц"""
+    digest = hashlib.sha256(f"v{REPORT_VERSION}|{context['month']:%Y-%m}".encode())
+    for e in context['expenses']:
+        digest.update(f"|e{e.pk}:{e.category.name}:{e.amount}:{e.paid_amount}:{e.date}".encode())
+    for r in context['meter_readings']:
+        digest.update(f"|m{r.pk}:{r.type}:{r.value}:{r.date}".encode())
+    digest.update(f"|p{context['total_payments']}".encode())
+    return digest.hexdigest()
+
+
+def export_key(contexts, fmt=FORMAT_PDF):
+    """Ключ кэша готового файла: формат + хэши всех месяцев"""
+    if len(contexts) == 1 and fmt == FORMAT_PDF:
+        return content_hash(contexts[0])
+    digest = hashlib.sha256(fmt.encode())
+    for context in contexts:
+        digest.update(content_hash(context).encode())
+    return digest.hexdigest()
+
+
+def cache_path(key, fmt=FORMAT_PDF):
+    return os.path.join(settings.PDF_EXPORT_CACHE_DIR, f"{key}.{fmt}")
+
+
+def prune_cache(max_age_days=CACHE_MAX_AGE_DAYS):
+    """
+    Удалить из кэша файлы, которые не запрашивали max_age_days дней,
+    и брошенные .tmp от упавших процессов. Возвращает число удалённых файлов.
+    """
+    deadline = time.time() - max_age_days * 24 * 60 * 60
+    removed = 0
+    try:
+        entries = list(os.scandir(settings.PDF_EXPORT_CACHE_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass  # файл уже удалил другой воркер
+    return removed
+
+
+def render_html(context):
+    return render_to_string(TEMPLATE_NAME, context)
+
+
+def stylesheet_path():
+    return finders.find(STYLESHEET)
+
+
+@lru_cache(maxsize=None)
+def _shared_resources(css_path):
+    """
+    Разобранная таблица стилей и шрифты — один раз на процесс,
+    а не на каждую страницу отчёта.
+    """
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    return [CSS(filename=css_path, font_config=font_config)], font_config
+
+
+def write_export(pages, path, fmt, css_path):
+    """
+    Список (имя файла, HTML) → PDF или ZIP на диск. Выполняется в отдельном
+    процессе воркера, поэтому получает только строки и ничего не знает о Django.
+    """
+    from weasyprint import HTML
+
+    stylesheets, font_config = _shared_resources(css_path)
+    documents = [
+        HTML(string=html).render(stylesheets=stylesheets, font_config=font_config)
+        for _, html in pages
+    ]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if fmt == FORMAT_ZIP:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for (name, _), document in zip(pages, documents):
+                archive.writestr(name, document.write_pdf())
+    else:
+        all_pages = [page for document in documents for page in document.pages]
+        documents[0].copy(all_pages).write_pdf(tmp_path)
+    os.replace(tmp_path, path)  # атомарно: читатели не увидят недописанный файл
+    return path
+
+
+def report_filename(start, end=None, fmt=FORMAT_PDF):
+    if end is None or end == start:
+        return f"report_{start[0]}_{start[1]}.{fmt}"
+    return f"report_{start[0]}_{start[1]}-{end[0]}_{end[1]}.{fmt}"
+
+
+def prepare_export(apartment, start, end, fmt):
+    """
+    Ключ, путь в кэше и функция, формирующая страницы отчёта.
+    HTML рендерится только если файла ещё нет в кэше.
+    """
+    contexts = range_report_data(apartment, start, end)
+    key = export_key(contexts, fmt)
+
+    def pages():
+        return [
+            (report_filename((c['month'].year, c['month'].month)), render_html(c))
+            for c in contexts
+        ]
+
+    return key, cache_path(key, fmt), pages
+
+
+def get_or_enqueue(apartment, start, end=None, fmt=FORMAT_PDF):
+    """
+    Готовый файл из кэша или задание в очереди воркера.
+    Возвращает (путь к файлу или None, PDFExportJob или None).
+    """
+    end = end or start
+    key, path, pages = prepare_export(apartment, start, end, fmt)
+    try:
+        # Время изменения — «последний запрос»: по нему prune_cache оставляет живые отчёты
+        os.utime(path)
+        return path, None
+    except FileNotFoundError:
+        pass
+
+    if not settings.PDF_EXPORT_ASYNC:
+        # Режим без воркера (локальная разработка): рендерим сразу, но тоже в кэш
+        return write_export(pages(), path, fmt, stylesheet_path()), None
+
+    job = PDFExportJob.objects.filter(
+        apartment=apartment, year=start[0], month=start[1], end_year=end[0], end_month=end[1],
+        format=fmt, content_hash=key,
+        status__in=[PDFExportJob.STATUS_PENDING, PDFExportJob.STATUS_RUNNING]
+    ).first()
+    if job is None:
+        job = PDFExportJob.objects.create(
+            user_id=apartment.user_id, apartment=apartment,
+            year=start[0], month=start[1], end_year=end[0], end_month=end[1],
+            format=fmt, content_hash=key
+        )
+    return None, job
+
+
+def fail_unclaimed(job):
+    """
+    Задание, которое пролежало в очереди дольше PENDING_TIMEOUT_SECONDS, помечается
+    ошибкой: иначе страница статуса ждала бы воркер бесконечно. Повторный
+    экспорт создаст новое задание. Возвращает job с актуальным статусом.
+    """
+    deadline = timezone.now() - timedelta(seconds=PENDING_TIMEOUT_SECONDS)
+    if job.status != PDFExportJob.STATUS_PENDING or job.created_at >= deadline:
+        return job
+    # Условие на статус: воркер мог взять задание между чтением и записью
+    if PDFExportJob.objects.filter(pk=job.pk, status=PDFExportJob.STATUS_PENDING).update(
+        status=PDFExportJob.STATUS_FAILED, error=NO_WORKER_ERROR, finished_at=timezone.now()
+    ):
+        job.status, job.error = PDFExportJob.STATUS_FAILED, NO_WORKER_ERROR
+    return job
@@ -0,0 +1,72 @@
+import json
+import math
+import os
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+METRICS = ['queries', 'db_ms', 'render_ms', 'total_ms']
+PERCENTILES = [50, 95, 99]
+
+
+def record(sample):
+    """
+    Дописать замер запроса в файл статистики (JSON Lines).
+
+    Одна строка через O_APPEND — безопасно для нескольких процессов gunicorn;
+    при превышении PERF_STATS_MAX_BYTES файл уходит в .1 и начинается заново.
+    """
+    path = settings.PERF_STATS_FILE
+    try:
+        if os.path.getsize(path) > settings.PERF_STATS_MAX_BYTES:
+            os.replace(path, f"{path}.1")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    except OSError:
+        pass
+    with open(path, 'a', encoding='utf-8') as stats_file:
+        stats_file.write(json.dumps(sample) + '\n')
+
+
+def load_samples(limit=None):
+    """Последние limit замеров (по умолчанию PERF_STATS_WINDOW)"""
+    limit = limit or settings.PERF_STATS_WINDOW
+    try:
+        with open(settings.PERF_STATS_FILE, encoding='utf-8') as stats_file:
+            lines = deque(stats_file, maxlen=limit)
+    except FileNotFoundError:
+        return []
+    samples = []
+    for line in lines:
+        try:
+            samples.append(json.loads(line))
+        except ValueError:
+            continue  # недописанная строка при одновременной записи
+    return samples
+
+
+def percentile(values, p):
+    """Перцентиль методом ближайшего ранга по отсортированному списку"""
+    if not values:
+        return 0
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(samples):
+    """Сводка по имени URL: число запросов и перцентили каждой метрики"""
+    by_view = defaultdict(lambda: defaultdict(list))
+    for sample in samples:
+        for metric in METRICS:
+            by_view[sample['view']][metric].append(sample.get(metric, 0))
+
+    report = []
+    for view, metrics in sorted(by_view.items()):
+        row = {'view': view, 'count': len(metrics['queries'])}
+        for metric in METRICS:
+            values = sorted(metrics[metric])
+            for p in PERCENTILES:
+                row[f'{metric}_p{p}'] = percentile(values, p)
+            row[f'{metric}_max'] = values[-1]
+        report.append(row)
+    return report
@@ -0,0 +1,69 @@
+import calendar
+from datetime import date
+
+from django.db import transaction
+
+from .models import Expense, RecurringExpense
+from .allocation import apply_credits_bulk
+from .services import date_range
+from . import ledger
+
+ROLLOVER_BATCH_SIZE = 2000
+
+
+def _template_batches(batch_size):
+    """Активные шаблоны пачками по pk (keyset вместо OFFSET) — лёгкими кортежами"""
+    last_pk = 0
+    while True:
+        batch = list(
+            RecurringExpense.objects
+            .filter(active=True, pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'category__user_id', 'apartment_id', 'category_id', 'amount', 'day', 'description')
+            [:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def run_rollover(year, month, batch_size=ROLLOVER_BATCH_SIZE):
+    """
+    Создать расходы месяца по всем активным шаблонам RecurringExpense.
+
+    На пачку шаблонов — один запрос уже существующих расходов (то же правило
+    «одна категория квартиры — один расход в месяц», что в ExpenseForm.clean), один
+    bulk_create и один пересчёт леджера, поэтому повторный запуск ничего
+    не дублирует. Возвращает словарь со счётчиками created/skipped.
+    """
+    last_day = calendar.monthrange(year, month)[1]
+    period = date_range(year, month)
+    result = {'created': 0, 'skipped': 0}
+
+    for batch in _template_batches(batch_size):
+        with transaction.atomic():
+            existing = set(
+                Expense.objects
+                # Только по категориям: с apartment_id__in SQLite перебирал бы все пары (apartment, category)
+                .filter(category_id__in=[row[3] for row in batch], **period)
+                # Без сортировки из Meta — иначе лишний JOIN с категориями
+                .order_by()
+                .values_list('apartment_id', 'category_id')
+            )
+            objects = [
+                Expense(
+                    user_id=user_id, apartment_id=apartment_id, category_id=category_id, amount=amount,
+                    date=date(year, month, min(day, last_day)), description=description
+                )
+                for pk, user_id, apartment_id, category_id, amount, day, description in batch
+                if (apartment_id, category_id) not in existing
+            ]
+            Expense.objects.bulk_create(objects)
+            ledger.refresh_after_bulk((expense.user_id for expense in objects), map(ledger.ledger_key, objects))
+            # Переплату тратим как при ручном добавлении расхода
+            apply_credits_bulk(objects)
+
+        result['created'] += len(objects)
+        result['skipped'] += len(batch) - len(objects)
+    return result
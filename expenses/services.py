@@ -0,0 +1,307 @@
+import asyncio
+from datetime import date, datetime
+
+from django.db.models import Sum, Min, F, Prefetch, Q
+from dateutil.relativedelta import relativedelta
+
+from .models import Apartment, Credit, MonthlyLedger, Expense, Payment, PaymentAllocation, MeterReading
+from . import usercache
+
+FILTER_PAGE_SIZE = 50
+
+FILTER_QUERYSETS = {
+    'expenses': lambda: Expense.objects.select_related('category'),
+    'payments': lambda: Payment.objects.all(),
+    'meter_readings': lambda: MeterReading.objects.all(),
+}
+
+
+def date_range(year, month=None, field='date'):
+    """
+    Фильтр за год или месяц как полуоткрытый диапазон [начало, начало следующего).
+    В отличие от date__month (EXTRACT/strftime) такой фильтр использует индексы по (apartment, date).
+    """
+    start = date(year, month or 1, 1)
+    end = start + relativedelta(months=1) if month else date(year + 1, 1, 1)
+    return {f'{field}__gte': start, f'{field}__lt': end}
+
+
+def main_apartment(user):
+    """Основная (первая) квартира пользователя — для данных без явно выбранной квартиры"""
+    return Apartment.objects.filter(user=user).order_by('pk').first()
+
+
+def user_apartment(user, apartment_id=None):
+    """Квартира пользователя с указанным id; если её нет (или id не задан) — основная"""
+    if apartment_id:
+        apartment = Apartment.objects.filter(user=user, pk=apartment_id).first()
+        if apartment is not None:
+            return apartment
+    return main_apartment(user)
+
+
+async def auser_apartment(user, apartment_id=None):
+    """user_apartment для async-представлений"""
+    if apartment_id:
+        apartment = await Apartment.objects.filter(user=user, pk=apartment_id).afirst()
+        if apartment is not None:
+            return apartment
+    return await Apartment.objects.filter(user=user).order_by('pk').afirst()
+
+
+def _ledger_months(apartment, year):
+    """Предрасчитанные суммы из леджера, сгруппированные по месяцам"""
+    return (
+        MonthlyLedger.objects
+        .filter(apartment=apartment, year=year)
+        .values('month')
+        .annotate(
+            month_amount=Sum('amount'),
+            month_paid=Sum('paid'),
+            month_debt=Sum('debt'),
+        )
+        .order_by()
+    )
+
+
+def _open_credit(apartment):
+    # Только неизрасходованные кредиты — по частичному индексу credit_open_idx
+    return Credit.objects.filter(apartment=apartment, remaining__gt=0)
+
+
+def _year_summary(year, today, min_year, rows, credit):
+    # Диапазон лет: от самого старого расхода до текущего +1
+    years = list(range(min_year or today.year, today.year + 2))
+    by_month = {row['month']: row for row in rows}
+
+    months = []
+    total_amount = total_paid = 0
+    for month in range(1, 13):
+        month_date = datetime(year, month, 1)
+        row = by_month.get(month)
+        debt = row['month_debt'] if row else 0
+        if row:
+            total_amount += row['month_amount']
+            total_paid += row['month_paid']
+        status = 'future' if month_date > today else ('green' if debt <= 0 else 'red')
+
+        months.append({
+            'year': year,
+            'month': month,
+            'name': month_date.strftime('%b'),
+            'status': status
+        })
+
+    return {
+        'years': years,
+        'months': months,
+        'year_summary': {
+            'total_amount': total_amount,
+            'total_paid': total_paid,
+            'total_debt': total_amount - total_paid,
+            'credit': credit
+        },
+    }
+
+
+def build_year_summary(apartment, year, today=None):
+    """
+    Статусы 12 месяцев и сводка за год одним запросом к MonthlyLedger.
+
+    Возвращает словарь с ключами years, months и year_summary —
+    в том виде, в каком их ждут dashboard.html и graphs.html.
+    """
+    today = today or datetime.today()
+    min_year = MonthlyLedger.objects.filter(apartment=apartment).aggregate(min_year=Min('year'))['min_year']
+    return _year_summary(year, today, min_year, _ledger_months(apartment, year), open_credit_total(apartment))
+
+
+async def alist(queryset):
+    """list(queryset) для async-кода"""
+    return [row async for row in queryset]
+
+
+async def abuild_year_summary(apartment, year, today=None):
+    """build_year_summary на асинхронном ORM: независимые запросы запускаются вместе"""
+    today = today or datetime.today()
+    first, rows, credit = await asyncio.gather(
+        MonthlyLedger.objects.filter(apartment=apartment).aaggregate(min_year=Min('year')),
+        alist(_ledger_months(apartment, year)),
+        _open_credit(apartment).aaggregate(total=Sum('remaining')),
+    )
+    return _year_summary(year, today, first['min_year'], rows, credit['total'] or 0)
+
+
+def cached_year_summary(apartment, year):
+    """build_year_summary через кэш пользователя-владельца (usercache)"""
+    # Статусы месяцев зависят от сегодняшней даты — она тоже часть ключа
+    today = datetime.today()
+    return usercache.get_or_compute(
+        apartment.user_id, 'year_summary', f"{apartment.pk}:{year}:{today.date().isoformat()}",
+        lambda: build_year_summary(apartment, year, today=today)
+    )
+
+
+async def acached_year_summary(apartment, year):
+    """cached_year_summary для async-представлений"""
+    today = datetime.today()
+    return await usercache.aget_or_compute(
+        apartment.user_id, 'year_summary', f"{apartment.pk}:{year}:{today.date().isoformat()}",
+        lambda: abuild_year_summary(apartment, year, today=today)
+    )
+
+
+def build_portfolio(user, year):
+    """
+    Сводка по всем квартирам пользователя: итоги года, весь долг и переплата.
+
+    Суммы считаются в БД двумя группирующими запросами (леджер и кредиты)
+    плюс список квартир — независимо от их количества.
+    """
+    today = datetime.today()
+    totals = {
+        row['apartment']: row
+        for row in MonthlyLedger.objects
+        .filter(user=user)
+        .values('apartment')
+        .annotate(
+            year_amount=Sum('amount', filter=Q(year=year)),
+            year_paid=Sum('paid', filter=Q(year=year)),
+            total_debt=Sum('debt'),
+            min_year=Min('year'),
+        )
+        .order_by()
+    }
+    credits = dict(
+        Credit.objects
+        .filter(user=user, remaining__gt=0)
+        .values('apartment')
+        .annotate(total=Sum('remaining'))
+        .order_by()
+        .values_list('apartment', 'total')
+    )
+
+    apartments = []
+    for apartment in Apartment.objects.filter(user=user).order_by('pk'):
+        row = totals.get(apartment.pk, {})
+        apartments.append({
+            'apartment': apartment,
+            'year_amount': row.get('year_amount') or 0,
+            'year_paid': row.get('year_paid') or 0,
+            'total_debt': row.get('total_debt') or 0,
+            'credit': credits.get(apartment.pk) or 0,
+        })
+    min_year = min((row['min_year'] for row in totals.values()), default=today.year)
+    return {
+        'years': list(range(min_year, today.year + 2)),
+        'apartments': apartments,
+        'portfolio_totals': {
+            key: sum(item[key] for item in apartments)
+            for key in ('year_amount', 'year_paid', 'total_debt', 'credit')
+        },
+    }
+
+
+def cached_portfolio(user, year):
+    """build_portfolio через кэш пользователя (usercache)"""
+    return usercache.get_or_compute(user.pk, 'portfolio', year, lambda: build_portfolio(user, year))
+
+
+def build_month_summary(apartment, year, month):
+    """Итоги месяца по категориям из MonthlyLedger и сумма платежей за месяц"""
+    categories = list(
+        MonthlyLedger.objects
+        .filter(apartment=apartment, year=year, month=month)
+        .order_by('category__priority', 'category__name')
+        .values('category_id', 'amount', 'paid', 'debt', category_name=F('category__name'))
+    )
+    return {
+        'year': year,
+        'month': month,
+        'categories': categories,
+        'total_amount': sum(row['amount'] for row in categories),
+        'total_paid': sum(row['paid'] for row in categories),
+        'total_debt': sum(row['debt'] for row in categories),
+        'payments': Payment.objects.filter(apartment=apartment, **date_range(year, month)).aggregate(
+            total=Sum('amount')
+        )['total'] or 0,
+    }
+
+
+def month_expenses(apartment, year, month):
+    return Expense.objects.filter(apartment=apartment, **date_range(year, month)).select_related('category')
+
+
+def month_readings(apartment, year, month):
+    return MeterReading.objects.filter(apartment=apartment, **date_range(year, month))
+
+
+def month_payments(apartment, year, month):
+    """Платежи месяца вместе с распределениями по расходам (два запроса)"""
+    return Payment.objects.filter(apartment=apartment, **date_range(year, month)).prefetch_related(
+        Prefetch('allocations', queryset=PaymentAllocation.objects.select_related('expense__category'))
+    )
+
+
+def open_credit_total(apartment):
+    return _open_credit(apartment).aggregate(total=Sum('remaining'))['total'] or 0
+
+
+def keyset_page(queryset, after=None, size=FILTER_PAGE_SIZE):
+    """
+    Страница по (date, id) от новых к старым без OFFSET.
+
+    after — (дата, id) последней строки предыдущей страницы. Возвращает
+    строки и курсор следующей страницы (None, если это последняя).
+    """
+    queryset = queryset.order_by('-date', '-id')
+    if after:
+        day, pk = after
+        queryset = queryset.filter(Q(date__lt=day) | Q(date=day, id__lt=pk))
+
+    rows = list(queryset[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    # Строки могут быть и объектами, и словарями из values()
+    last = rows[-1]
+    day, pk = (last['date'], last['id']) if isinstance(last, dict) else (last.date, last.pk)
+    return rows, f"{day.isoformat()}_{pk}"
+
+
+def parse_cursor(value):
+    """Курсор keyset_page "<дата>_<id>" → (date, id); ValueError, если формат неверный"""
+    day, pk = value.split('_')
+    return date.fromisoformat(day), int(pk)
+
+
+def filter_range(apartment, start_date, end_date, kind='expenses', after=None):
+    """Выборка за период: страница строк + промежуточные итоги, посчитанные в БД"""
+    period = {'apartment': apartment, 'date__gte': start_date, 'date__lte': end_date}
+
+    rows, next_cursor = keyset_page(FILTER_QUERYSETS[kind]().filter(**period), after)
+
+    subtotals = list(
+        Expense.objects.filter(**period)
+        .values('category__name')
+        .annotate(
+            total_amount=Sum('amount'),
+            total_paid=Sum('paid_amount'),
+            total_debt=Sum('debt'),
+        )
+        .order_by('category__priority', 'category__name')
+    )
+    totals = {
+        'total_amount': sum(row['total_amount'] for row in subtotals),
+        'total_paid': sum(row['total_paid'] for row in subtotals),
+        'total_debt': sum(row['total_debt'] for row in subtotals),
+        'payments': Payment.objects.filter(**period).aggregate(total=Sum('amount'))['total'] or 0,
+    }
+
+    return {
+        'kind': kind,
+        'rows': rows,
+        'next_cursor': next_cursor,
+        'subtotals': subtotals,
+        'totals': totals,
+    }
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models import F, Sum
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Apartment, ExpenseCategory
+from .models import (
+    Apartment, ExpenseCategory, Expense, Payment, PaymentAllocation, Credit, CreditApplication, MeterReading
+)
+from .services import main_apartment
+from . import ledger, usercache
 
 @receiver(post_save, sender=User)
 def create_user_apartment_and_categories(sender, instance, created, **kwargs):
@@ -20,4 +25,93 @@ def create_user_apartment_and_categories(sender, instance, created, **kwargs):
                 user=instance,
                 name=name,
                 defaults={'priority': priority}
-            )
\ No newline at end of file
+            )
+
+
+# === Квартира записи ===
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=MeterReading)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Credit)
+def fill_owner(sender, instance, **kwargs):
+    # user и apartment должны совпадать: недостающее берём из второго,
+    # а запись без квартиры попадает в основную квартиру владельца
+    if instance.user_id is None and instance.apartment_id is not None:
+        instance.user_id = instance.apartment.user_id
+    elif instance.apartment_id is None and instance.user_id is not None:
+        instance.apartment = main_apartment(instance.user_id)
+
+
+# === Леджер: инкрементальное обновление сводок по месяцам ===
+
+@receiver(pre_save, sender=Expense)
+def remember_expense_ledger_key(sender, instance, update_fields=None, **kwargs):
+    # Расход мог переехать в другой месяц/категорию/квартиру — запоминаем старую ячейку
+    instance._ledger_key_before = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not {'apartment', 'category', 'date'} & set(update_fields):
+        return
+    old = Expense.objects.filter(pk=instance.pk).only('apartment', 'category', 'date').first()
+    if old:
+        instance._ledger_key_before = ledger.ledger_key(old)
+
+
+@receiver(post_save, sender=Expense)
+def update_ledger_on_expense_save(sender, instance, **kwargs):
+    keys = {ledger.ledger_key(instance)}
+    if getattr(instance, '_ledger_key_before', None):
+        keys.add(instance._ledger_key_before)
+    ledger.refresh_cells(keys)
+
+
+@receiver(post_delete, sender=Expense)
+def update_ledger_on_expense_delete(sender, instance, **kwargs):
+    ledger.refresh_cells([ledger.ledger_key(instance)])
+
+
+@receiver(post_save, sender=PaymentAllocation)
+@receiver(post_delete, sender=PaymentAllocation)
+def update_ledger_on_allocation_change(sender, instance, **kwargs):
+    if not ledger.in_bulk():
+        ledger.refresh_for_expenses([instance.expense_id])
+
+
+# === Кредиты: списания удалённого расхода возвращаются в кредит ===
+
+@receiver(pre_delete, sender=Expense)
+def restore_credit_on_expense_delete(sender, instance, **kwargs):
+    # CreditApplication удалится вместе с расходом (CASCADE), а потраченное
+    # на него осталось бы списанным. Леджер и кэш обновят post_delete расхода
+    refunds = (
+        CreditApplication.objects
+        .filter(expense=instance)
+        .values('credit_id').annotate(total=Sum('amount'))
+        .values_list('credit_id', 'total')
+    )
+    for credit_id, total in refunds:
+        Credit.objects.filter(pk=credit_id).update(remaining=F('remaining') + total)
+
+
+# === Кэш контекста страниц: новое поколение данных пользователя ===
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Credit)
+@receiver(post_delete, sender=Credit)
+@receiver(post_save, sender=MeterReading)
+@receiver(post_delete, sender=MeterReading)
+def bump_user_cache(sender, instance, **kwargs):
+    usercache.bump(instance.user_id)
+
+
+@receiver(post_save, sender=PaymentAllocation)
+@receiver(post_delete, sender=PaymentAllocation)
+def bump_user_cache_on_allocation(sender, instance, **kwargs):
+    # У распределения нет user — берём через платёж (обычно он уже загружен);
+    # в пачке (ledger.bulk_changes) кэш сбрасывает вызывающий
+    if not ledger.in_bulk():
+        usercache.bump(instance.payment.user_id)
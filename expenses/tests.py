@@ -1,3 +1,1112 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from .forms import DataFilterForm, ExpenseForm
+from .middleware import QueryStatsMiddleware
+from .allocation import WATERFALL_ORDER, allocate_payment, apply_credits, preview_allocation, reverse_payments
+from . import aging, benchmark, billing, consumption, importers, pdf, perf, recurring, usercache, views
+from .models import (
+    Apartment, Expense, ExpenseCategory, MeterReading, Payment, PaymentAllocation, Credit, CreditApplication,
+    MonthlyLedger, PDFExportJob, RecurringExpense, Tariff, TariffBand
+)
+from .services import build_portfolio, date_range, keyset_page, parse_cursor
+
+
+def legacy_allocate(payment):
+    """Прежний построчный алгоритм из AddPaymentView — эталон для сравнения"""
+    remaining = payment.amount
+    categories = ExpenseCategory.objects.filter(user=payment.user).order_by('priority', 'name')
+    with transaction.atomic():
+        for category in categories:
+            if remaining <= 0:
+                break
+            expenses = Expense.objects.filter(
+                user=payment.user,
+                category=category,
+                paid_amount__lt=F('amount')
+            ).order_by('date', 'pk')
+            for expense in expenses:
+                if remaining <= 0:
+                    break
+                current_debt = expense.debt
+                if current_debt <= 0:
+                    continue
+                pay_here = min(current_debt, remaining)
+                expense.paid_amount = F('paid_amount') + pay_here
+                expense.save(update_fields=['paid_amount'])
+                PaymentAllocation.objects.create(payment=payment, expense=expense, amount=pay_here)
+                remaining -= pay_here
+        if remaining > 0:
+            Credit.objects.create(user=payment.user, amount=remaining, date=payment.date)
+
+
+class AllocationEngineTests(TestCase):
+    def make_user(self, name, seed):
+        """Пользователь со случайными, но воспроизводимыми долгами"""
+        user = User.objects.create_user(name, password='x')
+        rnd = random.Random(seed)
+        for category in ExpenseCategory.objects.filter(user=user):
+            for month in range(1, 13):
+                amount = Decimal(rnd.randint(10, 500))
+                paid = Decimal(rnd.choice([0, 0, rnd.randint(0, int(amount)), int(amount)]))
+                Expense.objects.create(
+                    user=user, category=category, amount=amount,
+                    paid_amount=paid, date=date(2024, month, rnd.randint(1, 28))
+                )
+        return user
+
+    def snapshot(self, user):
+        expenses = Expense.objects.filter(user=user)
+        allocations = PaymentAllocation.objects.filter(expense__user=user)
+        return (
+            sorted(expenses.values_list('category__name', 'date', 'paid_amount')),
+            sorted(allocations.values_list('expense__category__name', 'expense__date', 'amount')),
+            sorted(Credit.objects.filter(user=user).values_list('amount', flat=True)),
+        )
+
+    def test_matches_legacy_algorithm(self):
+        for seed, amount in [(1, '0.01'), (2, '750'), (3, '2500.50'), (4, '100000')]:
+            legacy_user = self.make_user(f'legacy{seed}', seed)
+            engine_user = self.make_user(f'engine{seed}', seed)
+
+            legacy_allocate(Payment.objects.create(user=legacy_user, amount=Decimal(amount), date=date(2024, 6, 1)))
+            allocate_payment(Payment.objects.create(user=engine_user, amount=Decimal(amount), date=date(2024, 6, 1)))
+
+            self.assertEqual(self.snapshot(legacy_user), self.snapshot(engine_user), f"seed={seed}")
+
+    def test_query_count_does_not_grow_with_debts(self):
+        user = self.make_user('bulk', 5)
+        payment = Payment.objects.create(user=user, amount=Decimal('100000'), date=date(2024, 6, 1))
+        # select + bulk_update + bulk_create + леджер (агрегат и upsert) + кредит,
+        # плюс две пары SAVEPOINT/RELEASE от вложенных atomic()
+        with self.assertNumQueries(10):
+            allocations, credit = allocate_payment(payment)
+        self.assertEqual(len(allocations), Expense.objects.filter(user=user, payment_allocations__isnull=False).count())
+        self.assertIsNotNone(credit)
+        self.assertFalse(Expense.objects.filter(user=user, paid_amount__lt=F('amount')).exists())
+
+
+class MonthlyLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ledger', password='x')
+        self.rent, self.utilities = ExpenseCategory.objects.filter(user=self.user).order_by('priority')[:2]
+        self.expenses = [
+            Expense.objects.create(user=self.user, category=category, amount=amount, date=date(2024, month, 10))
+            for category, amount in ((self.rent, 100), (self.utilities, 40))
+            for month in (1, 2)
+        ]
+
+    def assertLedgerMatchesExpenses(self):
+        """Леджер совпадает со свежим агрегатом по таблице расходов"""
+        fresh = (
+            Expense.objects.filter(user=self.user)
+            .values_list('apartment_id', ExtractYear('date'), ExtractMonth('date'), 'category_id')
+            .annotate(Sum('amount'), Sum('paid_amount'), Sum('debt'))
+            .order_by()
+        )
+        stored = MonthlyLedger.objects.filter(user=self.user).values_list(
+            'apartment_id', 'year', 'month', 'category_id', 'amount', 'paid', 'debt'
+        )
+        self.assertEqual(sorted(stored), sorted(fresh))
+
+    def test_expense_moves_to_other_month_and_category(self):
+        expense = self.expenses[0]
+        expense.date = date(2024, 3, 5)
+        expense.save()
+        self.assertLedgerMatchesExpenses()
+        self.assertFalse(MonthlyLedger.objects.filter(category=self.rent, month=1).exists())
+
+        expense.category = self.utilities
+        expense.save(update_fields=['category'])
+        self.assertLedgerMatchesExpenses()
+
+    def test_delete(self):
+        self.expenses[1].delete()
+        self.assertLedgerMatchesExpenses()
+        Expense.objects.filter(category=self.utilities).first().delete()
+        self.assertLedgerMatchesExpenses()
+
+    def test_payment_allocation(self):
+        with transaction.atomic():
+            allocate_payment(Payment.objects.create(user=self.user, amount=Decimal('170.50'), date=date(2024, 3, 1)))
+        self.assertLedgerMatchesExpenses()
+        self.assertEqual(MonthlyLedger.objects.aggregate(total=Sum('paid'))['total'], Decimal('170.50'))
+
+    def test_rebuild_ledger_command(self):
+        MonthlyLedger.objects.filter(month=1).delete()
+        MonthlyLedger.objects.update(amount=0, debt=0)
+
+        out = io.StringIO()
+        call_command('rebuild_ledger', user='ledger', stdout=out)
+
+        self.assertIn("ячеек 4", out.getvalue())
+        self.assertLedgerMatchesExpenses()
+
+
+class BenchmarkHarnessTests(TestCase):
+    def test_query_counts_do_not_grow_with_history(self):
+        end = date(2024, 12, 1)
+        short, = benchmark.seed(users=1, years=1, end=end, prefix='short')
+        long, = benchmark.seed(users=1, years=4, end=end, prefix='long')
+
+        cache.set('not-benchmark', 1)
+        short_results = benchmark.run(short, 2024, 12, repeat=1, host='testserver')
+        long_results = benchmark.run(long, 2024, 12, repeat=1, host='testserver')
+        # Бенчмарк очищает только свой кэш
+        self.assertEqual(cache.get('not-benchmark'), 1)
+
+        for name, result in short_results.items():
+            self.assertLess(result['status'], 400, name)
+            self.assertEqual(result['queries'], long_results[name]['queries'], name)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'dashboard': {'queries': 5, 'time_ms': 10, 'peak_kb': 100}}
+        self.assertEqual(benchmark.compare({'dashboard': {'queries': 5, 'time_ms': 12, 'peak_kb': 100}}, baseline), [])
+        regressions = benchmark.compare({'dashboard': {'queries': 17, 'time_ms': 30, 'peak_kb': 100}}, baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', password='x')
+        self.category = ExpenseCategory.objects.filter(user=self.user).first()
+        self.client.force_login(self.user)
+
+    def dashboard_total(self):
+        response = self.client.get('/expenses/?year=2024')
+        return response.context['year_summary']['total_amount']
+
+    def test_repeat_request_hits_cache_and_changes_invalidate_it(self):
+        Expense.objects.create(user=self.user, category=self.category, amount=100, date=date(2024, 3, 5))
+        self.assertEqual(self.dashboard_total(), 100)
+
+        # Второй запрос не читает леджер: сводка берётся из кэша
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/expenses/?year=2024')
+        self.assertFalse(any('expenses_monthlyledger' in q['sql'] for q in queries.captured_queries))
+
+        # Изменения через сигналы и через пакетное распределение сбрасывают кэш
+        Expense.objects.create(user=self.user, category=self.category, amount=50, date=date(2024, 4, 5))
+        self.assertEqual(self.dashboard_total(), 150)
+        with transaction.atomic():
+            payment = Payment.objects.create(user=self.user, amount=30, date=date(2024, 4, 20))
+            allocate_payment(payment)
+        response = self.client.get('/expenses/?year=2024')
+        self.assertEqual(response.context['year_summary']['total_paid'], 30)
+
+    def test_other_users_are_not_invalidated(self):
+        other = User.objects.create_user('other', password='x')
+        generation = usercache.generation(self.user.pk)
+        usercache.bump(other.pk)
+        self.assertEqual(usercache.generation(self.user.pk), generation)
+
+
+class IndexUsageTests(TestCase):
+    """Планы запросов: выборки за месяц и открытые долги идут по составным индексам"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('indexed', password='x')
+        category = ExpenseCategory.objects.filter(user=self.user).first()
+        for month in range(1, 13):
+            Expense.objects.create(user=self.user, category=category, amount=100,
+                                   paid_amount=100 if month < 12 else 0, date=date(2024, month, 5))
+            Payment.objects.create(user=self.user, amount=100, date=date(2024, month, 20))
+            MeterReading.objects.create(user=self.user, type='electricity', value=month * 10, date=date(2024, month, 25))
+        self.category = category
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_month_filters_use_apartment_date_indexes(self):
+        period = date_range(2024, 3)
+        apartment = self.user.apartments.get()
+        self.assertUsesIndex(Expense.objects.filter(apartment=apartment, **period), 'expense_apt_date_idx')
+        self.assertUsesIndex(Payment.objects.filter(apartment=apartment, **period), 'payment_apt_date_idx')
+        self.assertUsesIndex(MeterReading.objects.filter(apartment=apartment, **period), 'reading_apt_date_idx')
+        self.assertUsesIndex(
+            Expense.objects.filter(apartment=apartment, category=self.category, **period),
+            'expense_apt_cat_date_idx'
+        )
+
+    def test_open_debts_use_partial_index(self):
+        self.assertUsesIndex(
+            Expense.objects.filter(apartment=self.user.apartments.get(), debt__gt=0).order_by(*WATERFALL_ORDER),
+            'expense_open_debt_idx'
+        )
+
+    def test_date_range_is_half_open(self):
+        self.assertEqual(date_range(2024, 12), {'date__gte': date(2024, 12, 1), 'date__lt': date(2025, 1, 1)})
+        self.assertEqual(date_range(2024), {'date__gte': date(2024, 1, 1), 'date__lt': date(2025, 1, 1)})
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('keyset', password='x')
+        category = ExpenseCategory.objects.filter(user=self.user).first()
+        # Много строк с одной датой — порядок внутри даты держится только на id
+        for day in (1, 1, 1, 1, 2, 2, 2, 3, 3, 3, 3):
+            Expense.objects.create(user=self.user, category=category, amount=10, date=date(2024, 4, day))
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        queryset = Expense.objects.filter(user=self.user)
+        seen, cursor = [], None
+        while True:
+            rows, next_cursor = keyset_page(queryset, parse_cursor(cursor) if cursor else None, size=3)
+            seen.extend(row.pk for row in rows)
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+
+        expected = list(queryset.order_by('-date', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+        # Курсор работает и для строк из values()
+        rows, _ = keyset_page(queryset.values('id', 'date'), size=4)
+        self.assertEqual([row['id'] for row in rows], expected[:4])
+
+    def test_invalid_cursors(self):
+        for value in ('abc', '2024-13-01_5', '2024-04-01_x', '2024-04-01', '2024-04-01_5_6'):
+            with self.assertRaises(ValueError, msg=value):
+                parse_cursor(value)
+
+        form = DataFilterForm({'start_date': '2024-01-01', 'end_date': '2024-12-31', 'after': 'abc'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('after', form.errors)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/expenses/api/expenses/?after=abc').status_code, 400)
+
+
+class CreditApplicationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('credited', password='x')
+        self.apartment = self.user.apartments.get()
+        self.rent, self.utilities = ExpenseCategory.objects.filter(user=self.user).order_by('priority')[:2]
+
+    def test_credits_are_spent_oldest_first(self):
+        old = Credit.objects.create(user=self.user, amount=30, date=date(2024, 1, 1))
+        new = Credit.objects.create(user=self.user, amount=100, date=date(2024, 2, 1))
+        expenses = [
+            Expense.objects.create(user=self.user, category=self.utilities, amount=40, date=date(2024, 3, 1)),
+            Expense.objects.create(user=self.user, category=self.rent, amount=50, date=date(2024, 3, 1)),
+        ]
+
+        # кредиты + долги + два bulk_update + bulk_create + леджер (агрегат и upsert),
+        # плюс две пары SAVEPOINT/RELEASE — столько же при любом числе строк
+        with self.assertNumQueries(11):
+            applications = apply_credits(self.apartment, expenses)
+
+        # Аренда важнее: 30 из старого кредита + 20 из нового, затем коммуналка — 40 из нового
+        self.assertEqual(
+            [(a.credit_id, a.expense_id, a.amount) for a in applications],
+            [(old.pk, expenses[1].pk, 30), (new.pk, expenses[1].pk, 20), (new.pk, expenses[0].pk, 40)]
+        )
+        old.refresh_from_db()
+        new.refresh_from_db()
+        self.assertEqual((old.remaining, new.remaining), (0, 40))
+        self.assertFalse(Expense.objects.filter(pk__in=[e.pk for e in expenses], debt__gt=0).exists())
+        self.assertEqual(CreditApplication.objects.count(), 3)
+
+    def test_only_given_expenses_are_paid(self):
+        Credit.objects.create(user=self.user, amount=100, date=date(2024, 1, 1))
+        older = Expense.objects.create(user=self.user, category=self.rent, amount=50, date=date(2024, 1, 1))
+        fresh = Expense.objects.create(user=self.user, category=self.rent, amount=50, date=date(2024, 2, 1))
+
+        apply_credits(self.apartment, [fresh])
+
+        older.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((older.debt, fresh.debt), (50, 0))
+
+    def test_deleting_expense_returns_credit(self):
+        credit = Credit.objects.create(user=self.user, amount=50, date=date(2024, 1, 1))
+        expense = Expense.objects.create(user=self.user, category=self.rent, amount=30, date=date(2024, 2, 1))
+        apply_credits(self.apartment, [expense])
+        credit.refresh_from_db()
+        self.assertEqual(credit.remaining, 20)
+
+        expense.delete()
+
+        credit.refresh_from_db()
+        self.assertEqual(credit.remaining, 50)
+        self.assertFalse(CreditApplication.objects.exists())
+        # Вернувшийся кредит гасит следующий расход
+        fresh = Expense.objects.create(user=self.user, category=self.rent, amount=45, date=date(2024, 3, 1))
+        apply_credits(self.apartment, [fresh])
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.debt, 0)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('api', password='x')
+        self.category = ExpenseCategory.objects.filter(user=self.user).first()
+        self.client.force_login(self.user)
+
+    def test_create_list_and_conditional_get(self):
+        response = self.client.post('/expenses/api/expenses/', {
+            'category': self.category.pk, 'amount': '120.00', 'date': '2024-05-03', 'description': ''
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['debt'], '120.00')
+
+        response = self.client.get('/expenses/api/expenses/?year=2024&month=5')
+        self.assertEqual([row['category_name'] for row in response.json()['results']], [self.category.name])
+        etag = response['ETag']
+
+        # Данные не менялись — 304 без запросов к таблицам expenses (только сессия)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/expenses/api/expenses/?year=2024&month=5', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('expenses_' in q['sql'] for q in queries.captured_queries))
+
+        Payment.objects.create(user=self.user, amount=10, date=date(2024, 5, 10))
+        response = self.client.get('/expenses/api/expenses/?year=2024&month=5', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_stale_if_match_is_rejected(self):
+        expense = Expense.objects.create(user=self.user, category=self.category, amount=50, date=date(2024, 1, 5))
+        url = f'/expenses/api/expenses/{expense.pk}/'
+        etag = self.client.get(url)['ETag']
+        Expense.objects.filter(pk=expense.pk).update(description='x')
+        usercache.bump(self.user.pk)
+
+        response = self.client.delete(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertTrue(Expense.objects.filter(pk=expense.pk).exists())
+
+    def test_summaries_and_errors(self):
+        Expense.objects.create(user=self.user, category=self.category, amount=80, date=date(2024, 2, 5))
+        summary = self.client.get('/expenses/api/summary/2024/2/').json()
+        self.assertEqual(Decimal(summary['total_debt']), 80)
+        year = self.client.get('/expenses/api/summary/2024/').json()
+        self.assertEqual(Decimal(year['year_summary']['total_amount']), 80)
+        for url in ('/expenses/api/summary/0/', '/expenses/api/summary/0/1/', '/expenses/api/summary/9999/12/'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.assertEqual(self.client.get('/expenses/api/expenses/999/').status_code, 404)
+        response = self.client.post('/expenses/api/meter-readings/', {'type': 'gas'}, content_type='application/json')
+        self.assertIn('type', response.json()['errors'])
+
+        self.client.logout()
+        self.assertEqual(self.client.get('/expenses/api/payments/').status_code, 401)
+
+
+class DataExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', password='x')
+        self.category = ExpenseCategory.objects.filter(user=self.user).order_by('priority').first()
+        for day, amount in ((date(2023, 12, 31), 10), (date(2024, 1, 5), 20), (date(2024, 1, 31), 30)):
+            Expense.objects.create(user=self.user, category=self.category, amount=amount, paid_amount=5, date=day,
+                                   description='тест')
+        # Чужие данные в выгрузку не попадают
+        other = User.objects.create_user('other', password='x')
+        Expense.objects.create(user=other, category=ExpenseCategory.objects.filter(user=other).first(),
+                               amount=99, date=date(2024, 1, 10))
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        params = {'start_date': '2024-01-01', 'end_date': '2024-01-31', 'format': 'csv', **params}
+        response = self.client.get('/expenses/data-filter/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+
+    def test_expenses_csv(self):
+        lines = self.export(kind='expenses')
+        self.assertEqual(lines[0], 'Дата;Категория;Сумма;Оплачено;Долг;Описание')
+        self.assertEqual(lines[1:], [
+            f'2024-01-05;{self.category.name};20.00;5.00;15.00;тест',
+            f'2024-01-31;{self.category.name};30.00;5.00;25.00;тест',
+        ])
+
+    def test_payments_csv_and_invalid_period(self):
+        Payment.objects.create(user=self.user, amount=15, date=date(2024, 1, 20), description='январь')
+        Payment.objects.create(user=self.user, amount=15, date=date(2024, 2, 1))
+        lines = self.export(kind='payments')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('2024-01-20;') and lines[1].endswith(';15.00;январь'))
+
+        response = self.client.get('/expenses/data-filter/export/', {'start_date': '2024-02-01', 'end_date': '2024-01-01'})
+        self.assertRedirects(response, '/expenses/data-filter/', fetch_redirect_response=False)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('async', password='x')
+        category = ExpenseCategory.objects.filter(user=self.user).first()
+        Expense.objects.create(user=self.user, category=category, amount=70, paid_amount=20, date=date(2024, 3, 4))
+        Payment.objects.create(user=self.user, amount=20, date=date(2024, 3, 10))
+        MeterReading.objects.create(user=self.user, type='cold_water', value=12, date=date(2024, 3, 25))
+        Credit.objects.create(user=self.user, amount=5, date=date(2024, 3, 10))
+
+    def request(self, factory, url):
+        request = factory.get(url)
+        request.user = self.user
+        request.session = SessionStore()
+
+        async def auser():
+            return self.user
+
+        request.auser = auser
+        return request
+
+    def context(self, response):
+        context = dict(response.context_data)
+        context.pop('view')
+        return context
+
+    async def test_async_views_match_sync_views(self):
+        cases = [
+            (views.DashboardView, views.AsyncDashboardView, '/expenses/?year=2024', {}),
+            (views.GraphsView, views.AsyncGraphsView, '/expenses/graphs/?year=2024', {}),
+        ]
+        for sync_view, async_view, url, kwargs in cases:
+            expected = await sync_to_async(sync_view.as_view())(self.request(RequestFactory(), url), **kwargs)
+            await cache.aclear()
+            actual = await async_view.as_view()(self.request(AsyncRequestFactory(), url), **kwargs)
+            self.assertEqual(self.context(actual), self.context(expected), async_view.__name__)
+
+        # Синхронная страница месяца — только каркас, данные отдают её разделы
+        url = '/expenses/month/2024/3/'
+        expected = {'sections_loaded': True}
+        for section in (views.MonthExpensesView, views.MonthReadingsView, views.MonthPaymentsView):
+            response = await sync_to_async(section.as_view())(self.request(RequestFactory(), url), year=2024, month=3)
+            expected.update(self.context(response))
+        actual = await views.AsyncMonthDetailView.as_view()(self.request(AsyncRequestFactory(), url), year=2024, month=3)
+        self.assertEqual(self.context(actual), expected)
+
+
+class MonthSectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('sections', password='x')
+        category = ExpenseCategory.objects.filter(user=self.user).first()
+        self.expense = Expense.objects.create(user=self.user, category=category, amount=90, date=date(2024, 6, 2))
+        self.client.force_login(self.user)
+
+    def test_shell_renders_without_data_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/expenses/month/2024/6/')
+        self.assertContains(response, 'data-section-url="/expenses/month/2024/6/expenses/"')
+        self.assertFalse(any('expenses_' in q['sql'] for q in queries.captured_queries))
+
+    def test_sections_return_304_until_data_changes(self):
+        url = '/expenses/month/2024/6/payments/'
+        with transaction.atomic():
+            payment = Payment.objects.create(user=self.user, amount=40, date=date(2024, 6, 9))
+            allocate_payment(payment)
+        # Первый ответ ставит CSRF-cookie (во фрагменте формы отмены платежа) — она входит в ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertContains(response, 'Аренда за 06.2024')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get('/expenses/month/2024/6/expenses/')
+        etag = response['ETag']
+        self.assertContains(response, self.expense.category.name)
+        self.expense.description = 'изменён'
+        self.expense.save()
+        self.assertEqual(self.client.get('/expenses/month/2024/6/expenses/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_invalid_month_is_404(self):
+        for url in ('/expenses/month/2024/13/', '/expenses/month/2024/0/expenses/',
+                    '/expenses/month/2024/13/readings/', '/expenses/month/2024/13/payments/'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        self.assertEqual(self.client.post('/expenses/month/2024/13/pay-all/').status_code, 404)
+
+
+class AllocationPreviewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('preview', password='x')
+        self.apartment = self.user.apartments.get()
+        for category in ExpenseCategory.objects.filter(user=self.user):
+            for month in (1, 2):
+                Expense.objects.create(user=self.user, category=category, amount=100, paid_amount=25,
+                                       date=date(2024, month, 3))
+        self.client.force_login(self.user)
+
+    def test_preview_matches_real_allocation_without_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            plan, credit = preview_allocation(self.apartment, Decimal('400'))
+        self.assertFalse(any(q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) or 'FOR UPDATE' in q['sql']
+                             for q in queries.captured_queries))
+        # Повторный вызов берёт долги из кэша
+        with self.assertNumQueries(0):
+            preview_allocation(self.apartment, Decimal('10'))
+
+        with transaction.atomic():
+            payment = Payment.objects.create(user=self.user, amount=Decimal('400'), date=date(2024, 3, 1))
+            allocations, real_credit = allocate_payment(payment)
+        self.assertEqual(
+            [(debt.expense_id, amount) for debt, amount in plan],
+            [(a.expense_id, a.amount) for a in allocations]
+        )
+        self.assertEqual(credit, 0)
+        self.assertIsNone(real_credit)
+
+    def test_preview_endpoint(self):
+        data = self.client.get('/expenses/api/payments/preview/?amount=500').json()
+        self.assertEqual(len(data['allocations']), 6)
+        self.assertEqual(Decimal(data['credit']), 50)
+        self.assertEqual(self.client.get('/expenses/api/payments/preview/?amount=abc').status_code, 400)
+
+    def test_preview_rejects_out_of_range_amounts(self):
+        for amount in ('1e400', '100000000000', '-5', 'NaN', 'Infinity', '1.001', ''):
+            response = self.client.get('/expenses/api/payments/preview/', {'amount': amount})
+            self.assertEqual(response.status_code, 400, amount)
+        self.assertEqual(self.client.get('/expenses/api/payments/preview/?amount=10,5').status_code, 200)
+
+
+class PaymentReversalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reversal', password='x')
+        self.apartment = self.user.apartments.get()
+        self.rent = ExpenseCategory.objects.filter(user=self.user).order_by('priority').first()
+        self.expenses = [
+            Expense.objects.create(user=self.user, category=self.rent, amount=100, date=date(2024, month, 1))
+            for month in range(1, 7)
+        ]
+
+    def pay(self, amount, day):
+        with transaction.atomic():
+            payment = Payment.objects.create(user=self.user, amount=Decimal(amount), date=day)
+            allocate_payment(payment)
+        return payment
+
+    def state(self):
+        return (
+            list(Expense.objects.filter(user=self.user).order_by('pk').values_list('paid_amount', flat=True)),
+            list(Credit.objects.filter(user=self.user).values_list('remaining', flat=True)),
+        )
+
+    def test_reversal_restores_debts_and_removes_credit(self):
+        kept = self.pay('150', date(2024, 1, 10))
+        before = self.state()
+        reversed_payment = self.pay('520', date(2024, 2, 10))
+        # Переплата успела погасить новый расход — это тоже откатывается
+        late = Expense.objects.create(user=self.user, category=self.rent, amount=30, date=date(2024, 7, 1))
+        apply_credits(self.apartment, [late])
+
+        self.assertEqual(reverse_payments(self.apartment, [reversed_payment.pk]), 1)
+
+        late.refresh_from_db()
+        self.assertEqual(late.debt, 30)
+        late.delete()
+        self.assertEqual(self.state(), before)
+        self.assertFalse(Payment.objects.filter(pk=reversed_payment.pk).exists())
+        self.assertTrue(PaymentAllocation.objects.filter(payment=kept).exists())
+        self.assertFalse(CreditApplication.objects.exists())
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def reverse_batch(count):
+            payments = [self.pay('40', date(2024, 1, day)) for day in range(1, count + 1)]
+            with CaptureQueriesContext(connection) as queries:
+                reverse_payments(self.apartment, [p.pk for p in payments])
+            return len(queries.captured_queries)
+
+        self.assertEqual(reverse_batch(2), reverse_batch(12))
+        self.assertEqual(Expense.objects.filter(user=self.user, paid_amount__gt=0).count(), 0)
+
+
+class RolloverTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'rollover{i}', password='x') for i in range(3)]
+        for user in self.users:
+            for category in ExpenseCategory.objects.filter(user=user):
+                RecurringExpense.objects.create(apartment=user.apartments.get(), category=category, amount=100, day=31)
+
+    def test_rollover_is_idempotent(self):
+        # Один расход уже добавлен вручную — его не дублируем
+        category = ExpenseCategory.objects.filter(user=self.users[0]).first()
+        Expense.objects.create(user=self.users[0], category=category, amount=70, date=date(2024, 2, 5))
+        Credit.objects.create(user=self.users[1], amount=40, date=date(2024, 1, 1))
+
+        self.assertEqual(recurring.run_rollover(2024, 2, batch_size=4), {'created': 8, 'skipped': 1})
+        self.assertEqual(recurring.run_rollover(2024, 2), {'created': 0, 'skipped': 9})
+
+        created = Expense.objects.filter(user__in=self.users, **date_range(2024, 2)).exclude(amount=70)
+        self.assertEqual(set(created.values_list('date', flat=True)), {date(2024, 2, 29)})
+        # Переплата сразу погасила часть нового долга, леджер обновлён
+        self.assertEqual(
+            Expense.objects.filter(user=self.users[1]).aggregate(total=Sum('debt'))['total'], 260
+        )
+        self.assertEqual(
+            MonthlyLedger.objects.filter(user=self.users[1], year=2024, month=2).aggregate(total=Sum('debt'))['total'],
+            260
+        )
+
+    def test_form_creates_template(self):
+        user = User.objects.create_user('template', password='x')
+        category = ExpenseCategory.objects.filter(user=user).first()
+        form = ExpenseForm(
+            {'category': category.pk, 'amount': '55', 'date': '2024-03-10', 'recurring': 'on'}, user=user
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.instance.user = user
+        form.save()
+        template = category.recurring.get(apartment__user=user)
+        self.assertEqual((template.amount, template.day), (55, 10))
+
+
+class BillingTests(TestCase):
+    def test_tariff_kinds(self):
+        flat = Tariff(kind=Tariff.KIND_FLAT, rate=Decimal('0.5'))
+        tiered = Tariff(kind=Tariff.KIND_TIERED, rate=Decimal('3'))
+        tiers = [TariffBand(rate=Decimal('2'), up_to=Decimal('50')), TariffBand(rate=1, up_to=10)]
+        seasonal = Tariff(kind=Tariff.KIND_SEASONAL, rate=Decimal('1'))
+        winter = [TariffBand(rate=Decimal('2'), month_from=10, month_to=3)]
+
+        self.assertEqual(billing.tariff_cost(flat, [], Decimal('7'), 5), Decimal('3.50'))
+        # 10 × 1 + 40 × 2 + 10 × 3 (сверх последней ступени — базовая цена)
+        self.assertEqual(billing.tariff_cost(tiered, tiers, Decimal('60'), 5), Decimal('120.00'))
+        self.assertEqual(billing.tariff_cost(tiered, tiers, Decimal('4'), 5), Decimal('4.00'))
+        self.assertEqual(billing.tariff_cost(seasonal, winter, Decimal('10'), 1), Decimal('20.00'))
+        self.assertEqual(billing.tariff_cost(seasonal, winter, Decimal('10'), 7), Decimal('10.00'))
+
+    def test_billing_creates_then_updates_expenses(self):
+        Tariff.objects.create(meter_type='cold_water', rate=2, category_name='Коммуналка', valid_from=date(2020, 1, 1))
+        Tariff.objects.create(meter_type='hot_water', rate=5, category_name='Коммуналка', valid_from=date(2020, 1, 1))
+        Tariff.objects.create(meter_type='electricity', rate=Decimal('0.2'), category_name='Электричество',
+                              valid_from=date(2020, 1, 1))
+        users = [User.objects.create_user(f'billing{i}', password='x') for i in range(3)]
+        for user in users:
+            for meter, before, after in (('cold_water', 10, 13), ('hot_water', 4, 5), ('electricity', 900, 1000)):
+                MeterReading.objects.create(user=user, type=meter, value=before, date=date(2024, 1, 31))
+                MeterReading.objects.create(user=user, type=meter, value=after, date=date(2024, 2, 28))
+        # Электричество у последнего пользователя уже введено вручную — его не трогаем
+        manual = Expense.objects.create(user=users[2], category=ExpenseCategory.objects.get(user=users[2], name='Электричество'),
+                                        amount=33, date=date(2024, 2, 1))
+
+        # Тарифы и ступени, показания, категории, расходы месяца, вставка, леджер (агрегат и upsert),
+        # квартиры с кредитом + две пары SAVEPOINT/RELEASE — столько же при любом числе пользователей
+        with self.assertNumQueries(13):
+            result = billing.run_billing(2024, 2)
+        self.assertEqual(result, {'created': 5, 'updated': 0, 'skipped': 1})
+        utilities = Expense.objects.get(user=users[0], category__name='Коммуналка')
+        self.assertEqual((utilities.amount, utilities.billed), (Decimal('11.00'), True))
+        self.assertEqual(Expense.objects.get(user=users[0], category__name='Электричество').amount, 20)
+
+        MeterReading.objects.filter(user=users[0], type='hot_water', date=date(2024, 2, 28)).update(value=6)
+        self.assertEqual(billing.run_billing(2024, 2), {'created': 0, 'updated': 1, 'skipped': 1})
+        utilities.refresh_from_db()
+        self.assertEqual(utilities.amount, 16)
+        manual.refresh_from_db()
+        self.assertEqual(manual.amount, 33)
+
+    def test_gap_between_readings_is_billed_per_month(self):
+        tariff = Tariff.objects.create(meter_type='electricity', kind=Tariff.KIND_TIERED, rate=2,
+                                       category_name='Электричество', valid_from=date(2020, 1, 1))
+        TariffBand.objects.create(tariff=tariff, rate=1, up_to=100)
+        user = User.objects.create_user('gap', password='x')
+        MeterReading.objects.create(user=user, type='electricity', value=0, date=date(2024, 1, 31))
+        MeterReading.objects.create(user=user, type='electricity', value=300, date=date(2024, 4, 30))
+
+        self.assertEqual(billing.run_billing(2024, 4), {'created': 1, 'updated': 0, 'skipped': 0})
+        # Три месяца по 100 kWh в первой ступени, а не 100 × 1 + 200 × 2 за один месяц
+        self.assertEqual(Expense.objects.get(user=user).amount, 300)
+
+    def test_rebilling_below_paid_amount_moves_excess_to_credit(self):
+        Tariff.objects.create(meter_type='cold_water', rate=2, category_name='Коммуналка', valid_from=date(2020, 1, 1))
+        user = User.objects.create_user('rebill', password='x')
+        MeterReading.objects.create(user=user, type='cold_water', value=10, date=date(2024, 1, 31))
+        reading = MeterReading.objects.create(user=user, type='cold_water', value=20, date=date(2024, 2, 28))
+        billing.run_billing(2024, 2)
+        expense = Expense.objects.get(user=user)
+        Expense.objects.filter(pk=expense.pk).update(paid_amount=20)
+
+        # Показание исправили: 10 € вместо оплаченных 20 — излишек становится кредитом
+        reading.value = 15
+        reading.save()
+        billing.run_billing(2024, 2)
+        expense.refresh_from_db()
+        self.assertEqual((expense.amount, expense.paid_amount, expense.debt), (10, 10, 0))
+        self.assertEqual(Credit.objects.get(user=user).remaining, 10)
+
+        # Новый пересчёт вверх гасится этим кредитом
+        reading.value = 18
+        reading.save()
+        billing.run_billing(2024, 2)
+        expense.refresh_from_db()
+        self.assertEqual((expense.amount, expense.paid_amount), (16, 16))
+        self.assertEqual(Credit.objects.get(user=user).remaining, 4)
+
+
+class ApartmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('landlord', password='x')
+        self.rent = ExpenseCategory.objects.filter(user=self.user).order_by('priority').first()
+        self.client.force_login(self.user)
+
+    def add_apartment(self, debt):
+        apartment = Apartment.objects.create(user=self.user, address=f'Дом {debt}')
+        Expense.objects.create(apartment=apartment, category=self.rent, amount=debt, date=date(2024, 3, 1))
+        Credit.objects.create(apartment=apartment, amount=5, date=date(2024, 3, 1))
+        return apartment
+
+    def test_portfolio_queries_do_not_grow_with_apartments(self):
+        self.add_apartment(100)
+        with CaptureQueriesContext(connection) as few:
+            build_portfolio(self.user, 2024)
+        for debt in (200, 300, 400):
+            self.add_apartment(debt)
+        with CaptureQueriesContext(connection) as many:
+            portfolio = build_portfolio(self.user, 2024)
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        # Основная квартира пустая, остальные — со своими долгами и переплатой
+        self.assertEqual([item['total_debt'] for item in portfolio['apartments']], [0, 100, 200, 300, 400])
+        self.assertEqual(portfolio['portfolio_totals']['credit'], 20)
+
+    def test_data_is_scoped_to_selected_apartment(self):
+        second = self.add_apartment(100)
+        self.assertEqual(self.client.get('/expenses/?year=2024').context['year_summary']['total_debt'], 0)
+
+        self.client.post(f'/expenses/apartments/{second.pk}/select/')
+        self.assertEqual(self.client.get('/expenses/?year=2024').context['year_summary']['total_debt'], 100)
+        self.assertEqual(
+            len(self.client.get(f'/expenses/api/expenses/?apartment={second.pk}').json()['results']), 1
+        )
+        self.assertEqual(len(self.client.get('/expenses/api/expenses/').json()['results']), 0)
+
+        # Чужую квартиру выбрать нельзя
+        other = User.objects.create_user('stranger', password='x').apartments.get()
+        self.assertEqual(self.client.post(f'/expenses/apartments/{other.pk}/select/').status_code, 404)
+        self.assertEqual(self.client.get(f'/expenses/api/expenses/?apartment={other.pk}').status_code, 404)
+
+
+class DebtAgingTests(TestCase):
+    def setUp(self):
+        self.today = date(2024, 6, 30)
+        for i, ages in enumerate(((0, 45), (75, 200))):
+            user = User.objects.create_user(f'aging{i}', password='x')
+            rent, utilities = ExpenseCategory.objects.filter(user=user).order_by('priority')[:2]
+            for age in ages:
+                day = date.fromordinal(self.today.toordinal() - age)
+                Expense.objects.create(user=user, category=rent, amount=100, paid_amount=10, date=day)
+                # Оплаченный расход в отчёт не попадает
+                Expense.objects.create(user=user, category=utilities, amount=50, paid_amount=50, date=day)
+
+    def test_buckets(self):
+        with self.assertNumQueries(3):
+            report = aging.aging_summary(today=self.today)
+        buckets = ('days_0_30', 'days_31_60', 'days_61_90', 'days_90_plus', 'total_debt')
+        self.assertEqual([report['totals'][key] for key in buckets], [90, 90, 90, 90, 360])
+        self.assertEqual(len(report['by_category']), 1)
+        # Самый старый долг — первым
+        self.assertEqual(
+            [(row['user__username'], row['days_90_plus'], row['total_debt']) for row in report['rows']],
+            [('aging1', 90, 180), ('aging0', 0, 180)]
+        )
+
+    def test_staff_only_csv(self):
+        staff = User.objects.create_user('auditor', password='x', is_staff=True)
+        self.client.force_login(User.objects.get(username='aging0'))
+        self.assertEqual(self.client.get('/expenses/reports/debt-aging/').status_code, 403)
+
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/expenses/reports/debt-aging/?by=user').status_code, 200)
+        response = self.client.get('/expenses/reports/debt-aging/export/?by=user')
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], 'Владелец;Категория;0–30;31–60;61–90;90+;Итого')
+        self.assertEqual(len(lines), 3)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer', password='x')
+        self.apartment = self.user.apartments.get()
+        self.rent, self.utilities = ExpenseCategory.objects.filter(user=self.user).order_by('priority')[:2]
+
+    def run_import(self, kind, text, **kwargs):
+        return importers.import_csv(self.apartment, kind, io.StringIO(text), **kwargs)
+
+    def test_expense_rows_are_validated_and_deduplicated(self):
+        Expense.objects.create(user=self.user, category=self.rent, amount=100, date=date(2024, 1, 5))
+        result = self.run_import('expenses', (
+            "date;category;amount;paid_amount;description\n"
+            "2024-01-20;Аренда;100;;уже есть за январь\n"
+            "2024-02-01;Нет такой;10;;\n"
+            "31.02.2024;Аренда;10;;\n"
+            "2024-02-01;Аренда;1e9;;\n"
+            "2024-02-01;Коммуналка;50;60;\n"
+            "01.02.2024;аренда;100,50;20;февраль\n"
+            "2024-02-15;Аренда;100;;второй раз за февраль\n"
+        ))
+
+        self.assertEqual((result['created'], result['skipped']), (1, 2))
+        self.assertEqual([line for line, message in result['errors']], [3, 4, 5, 6])
+        expense = Expense.objects.get(date=date(2024, 2, 1))
+        self.assertEqual((expense.category, expense.amount, expense.paid_amount), (self.rent, Decimal('100.50'), 20))
+        self.assertEqual(MonthlyLedger.objects.get(category=self.rent, month=2).amount, Decimal('100.50'))
+
+    def test_payments_are_allocated_like_single_payments(self):
+        Expense.objects.create(user=self.user, category=self.utilities, amount=100, date=date(2024, 1, 1))
+        Expense.objects.create(user=self.user, category=self.rent, amount=100, date=date(2024, 1, 1))
+        result = self.run_import('payments', (
+            "date,amount,description\n"
+            "2024-01-20,80,\n"
+            "2024-01-10,150,\n"
+            "2024-01-25,-1,\n"
+        ))
+
+        self.assertEqual((result['created'], result['errors']), (2, [(4, "сумма вне диапазона «-1»")]))
+        # Сначала более ранний платёж: аренда 100, коммуналка 50; затем 80 — коммуналка 50 и 30 в кредит
+        self.assertEqual(
+            sorted(PaymentAllocation.objects.values_list('payment__amount', 'expense__category__name', 'amount')),
+            [(80, 'Коммуналка', 50), (150, 'Аренда', 100), (150, 'Коммуналка', 50)]
+        )
+        self.assertEqual(list(Credit.objects.values_list('payment__amount', 'remaining')), [(80, 30)])
+        self.assertFalse(Expense.objects.filter(debt__gt=0).exists())
+        self.assertEqual(MonthlyLedger.objects.aggregate(total=Sum('paid'))['total'], 200)
+
+    def test_payment_query_count_does_not_grow_with_rows(self):
+        def import_payments(count):
+            for month in range(1, 13):
+                Expense.objects.create(user=self.user, category=self.rent, amount=100, date=date(2023 + count, month, 1))
+            text = "date,amount\n" + "".join(f"{2023 + count}-06-{day:02d},70\n" for day in range(1, count + 1))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.run_import('payments', text)['created'], count)
+            return len(queries.captured_queries)
+
+        self.assertEqual(import_payments(2), import_payments(15))
+
+
+class PDFExportQueueTests(TestCase):
+    """Очередь и кэш экспорта; сам WeasyPrint не вызывается — файлы в кэше подкладываются"""
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.enterContext(override_settings(PDF_EXPORT_CACHE_DIR=cache_dir.name, PDF_EXPORT_ASYNC=True))
+        self.user = User.objects.create_user('reports', password='x')
+        self.apartment = self.user.apartments.get()
+        rent = ExpenseCategory.objects.filter(user=self.user).first()
+        self.expense = Expense.objects.create(user=self.user, category=rent, amount=100, date=date(2024, 1, 5))
+
+    def put_in_cache(self, start, end=None, fmt=pdf.FORMAT_PDF):
+        _, path, _ = pdf.prepare_export(self.apartment, start, end or start, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as report:
+            report.write(b'%PDF-')
+        return path
+
+    def test_cached_file_is_returned_without_job(self):
+        path = self.put_in_cache((2024, 1))
+        self.assertEqual(pdf.get_or_enqueue(self.apartment, (2024, 1)), (path, None))
+        self.assertFalse(PDFExportJob.objects.exists())
+
+        # Другой формат или изменённые данные — другой ключ
+        self.assertIsNotNone(pdf.get_or_enqueue(self.apartment, (2024, 1), fmt=pdf.FORMAT_ZIP)[1])
+        self.expense.amount = 120
+        self.expense.save()
+        self.assertIsNotNone(pdf.get_or_enqueue(self.apartment, (2024, 1))[1])
+
+    def test_identical_requests_share_one_job(self):
+        _, first = pdf.get_or_enqueue(self.apartment, (2024, 1), (2024, 3))
+        _, second = pdf.get_or_enqueue(self.apartment, (2024, 1), (2024, 3))
+        self.assertEqual(first.pk, second.pk)
+
+        PDFExportJob.objects.update(status=PDFExportJob.STATUS_RUNNING)
+        self.assertEqual(pdf.get_or_enqueue(self.apartment, (2024, 1), (2024, 3))[1].pk, first.pk)
+        self.assertEqual(PDFExportJob.objects.count(), 1)
+
+    def test_worker_requeues_stale_jobs_and_fails_broken_ones(self):
+        self.put_in_cache((2024, 1))
+        job = dict(user=self.user, apartment=self.apartment, year=2024, end_year=2024, content_hash='-')
+        stale = PDFExportJob.objects.create(
+            month=1, end_month=1, status=PDFExportJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(seconds=pdf.STALE_JOB_SECONDS + 1), **job
+        )
+        busy = PDFExportJob.objects.create(
+            month=1, end_month=1, status=PDFExportJob.STATUS_RUNNING, started_at=timezone.now(), **job
+        )
+        broken = PDFExportJob.objects.create(month=13, end_month=13, **job)
+
+        call_command('run_pdf_worker', once=True, processes=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+        statuses = dict(PDFExportJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[stale.pk], PDFExportJob.STATUS_DONE)
+        self.assertEqual(statuses[busy.pk], PDFExportJob.STATUS_RUNNING)
+        self.assertEqual(statuses[broken.pk], PDFExportJob.STATUS_FAILED)
+        self.assertTrue(PDFExportJob.objects.get(pk=broken.pk).error)
+
+    def test_status_reports_missing_worker(self):
+        self.client.force_login(self.user)
+        _, job = pdf.get_or_enqueue(self.apartment, (2024, 1))
+        url = f'/expenses/export-pdf/job/{job.pk}/'
+        self.assertEqual(self.client.get(url).json()['status'], PDFExportJob.STATUS_PENDING)
+
+        PDFExportJob.objects.update(created_at=timezone.now() - timedelta(seconds=pdf.PENDING_TIMEOUT_SECONDS + 1))
+        self.assertEqual(self.client.get(url).json(), {'status': 'failed', 'error': pdf.NO_WORKER_ERROR})
+        # Повторный экспорт не подхватывает упавшее задание
+        self.assertNotEqual(pdf.get_or_enqueue(self.apartment, (2024, 1))[1].pk, job.pk)
+
+    def test_prune_cache_keeps_recently_requested_files(self):
+        old = self.put_in_cache((2024, 1))
+        fresh = self.put_in_cache((2024, 2))
+        month_ago = time.time() - (pdf.CACHE_MAX_AGE_DAYS + 1) * 24 * 60 * 60
+        os.utime(old, (month_ago, month_ago))
+        os.utime(fresh, (month_ago, month_ago))
+        pdf.get_or_enqueue(self.apartment, (2024, 2))
+
+        self.assertEqual(pdf.prune_cache(), 1)
+        self.assertEqual((os.path.exists(old), os.path.exists(fresh)), (False, True))
+
+
+class ConsumptionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('meters', password='x')
+        self.apartment = self.user.apartments.get()
+
+    def readings(self, meter, *points):
+        MeterReading.objects.bulk_create([
+            MeterReading(user=self.user, apartment=self.apartment, type=meter, date=day, value=value)
+            for day, value in points
+        ])
+
+    def test_gap_is_spread_over_months(self):
+        self.readings('cold_water', (date(2023, 11, 20), 100), (date(2024, 3, 20), 180), (date(2024, 4, 20), 190))
+        series, anomalies = consumption.compute_consumption(self.apartment, 2024)
+        # 80 за четыре месяца (декабрь — март) — по 20; декабрь относится к прошлому году
+        self.assertEqual(series['cold_water'][:5], [20, 20, 20, 10, None])
+        self.assertEqual(anomalies, [])
+
+    def test_previous_reading_older_than_a_year(self):
+        self.readings('hot_water', (date(2022, 1, 15), 0), (date(2024, 2, 15), 250))
+        series, _ = consumption.compute_consumption(self.apartment, 2024)
+        self.assertEqual(series['hot_water'][:3], [10, 10, None])
+
+    def test_meter_reset_and_spike(self):
+        self.readings('electricity', *[(date(2024, month, 1), 100 * month) for month in range(1, 7)])
+        # Замена счётчика в июле: новый начинает почти с нуля; в сентябре — скачок
+        self.readings('electricity', (date(2024, 7, 1), 40), (date(2024, 8, 1), 140), (date(2024, 9, 1), 1140))
+
+        series, anomalies = consumption.compute_consumption(self.apartment, 2024)
+
+        self.assertEqual(series['electricity'][1:9], [100, 100, 100, 100, 100, 40, 100, 1000])
+        self.assertEqual(
+            [(a['date'], a['kind']) for a in anomalies],
+            [(date(2024, 7, 1), 'reset'), (date(2024, 9, 1), 'spike')]
+        )
+
+
+class PerfStatsTests(TestCase):
+    def setUp(self):
+        stats_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(stats_dir.cleanup)
+        self.stats_file = os.path.join(stats_dir.name, 'perf_stats.jsonl')
+        self.enterContext(override_settings(PERF_STATS_FILE=self.stats_file))
+        self.user = User.objects.create_user('measured', password='x')
+
+    def run_queries(self, count):
+        for _ in range(count):
+            User.objects.filter(pk=self.user.pk).exists()
+
+    def request(self, factory):
+        request = factory.get('/expenses/')
+        request.resolver_match = resolve('/expenses/')
+        request.user = AnonymousUser()
+        return request
+
+    @override_settings(PERF_STATS_ENABLED=True)
+    def test_sync_middleware_counts_queries(self):
+        def get_response(request):
+            self.run_queries(3)
+            return HttpResponse()
+
+        QueryStatsMiddleware(get_response)(self.request(RequestFactory()))
+        sample, = perf.load_samples()
+        self.assertEqual((sample['view'], sample['queries'], sample['status']), ('expenses:dashboard', 3, 200))
+
+    @override_settings(PERF_STATS_ENABLED=True)
+    async def test_async_middleware_counts_queries(self):
+        async def get_response(request):
+            await sync_to_async(self.run_queries)(4)
+            return HttpResponse()
+
+        await QueryStatsMiddleware(get_response)(self.request(AsyncRequestFactory()))
+        sample, = perf.load_samples()
+        self.assertEqual((sample['view'], sample['queries']), ('expenses:dashboard', 4))
+
+    @override_settings(PERF_STATS_ENABLED=True, PERF_QUERY_BUDGET=1000)
+    def test_sample_matches_real_page_queries(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/expenses/?year=2024').status_code, 200)
+        sample, = perf.load_samples()
+        self.assertEqual(sample['queries'], len(queries.captured_queries))
+        self.assertEqual(sample['user'], self.user.pk)
+
+    @override_settings(PERF_STATS_ENABLED=False, PERF_QUERY_BUDGET=2)
+    def test_budget_warning_without_sampling(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('expenses.perf', 'WARNING') as logs:
+            self.client.get('/expenses/?year=2024')
+        self.assertIn('expenses:dashboard', logs.output[0])
+        self.assertIn('(бюджет 2)', logs.output[0])
+        self.assertFalse(os.path.exists(self.stats_file))
+
+        # Страницы вне expenses и укладывающиеся в бюджет — без предупреждений
+        with self.assertNoLogs('expenses.perf', 'WARNING'), override_settings(PERF_QUERY_BUDGET=1000):
+            self.client.get('/expenses/?year=2024')
+            self.client.get('/accounts/login/')
+
+    def test_percentiles_and_summary(self):
+        values = list(range(1, 101))
+        self.assertEqual([perf.percentile(values, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(perf.percentile([], 95), 0)
+        self.assertEqual(perf.percentile([7], 50), 7)
+
+        samples = [{'view': 'expenses:dashboard', 'queries': q, 'db_ms': 1, 'render_ms': 2, 'total_ms': q * 10}
+                   for q in (5, 1, 3)]
+        samples.append({'view': 'expenses:graphs', 'queries': 9, 'db_ms': 0, 'render_ms': 0, 'total_ms': 1})
+        dashboard, graphs = perf.summarize(samples)
+        self.assertEqual(
+            (dashboard['count'], dashboard['queries_p50'], dashboard['queries_max'], dashboard['total_ms_p95']),
+            (3, 3, 5, 50)
+        )
+        self.assertEqual((graphs['view'], graphs['count'], graphs['queries_p99']), ('expenses:graphs', 1, 9))
+
+    def test_perf_report_command(self):
+        out = io.StringIO()
+        call_command('perf_report', stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Замеров пока нет.")
+
+        for queries in (2, 4, 12):
+            perf.record({'view': 'expenses:dashboard', 'queries': queries, 'db_ms': 1.5,
+                         'render_ms': 3.0, 'total_ms': 10.0})
+        out = io.StringIO()
+        call_command('perf_report', stdout=out)
+        row = out.getvalue().splitlines()[2].split()
+        self.assertEqual(row[:5], ['expenses:dashboard', '3', '4', '12', '12'])
+
+        out = io.StringIO()
+        call_command('perf_report', '--json', '--limit', '2', stdout=out)
+        report, = json.loads(out.getvalue())
+        self.assertEqual((report['count'], report['queries_max']), (2, 12))
@@ -1,21 +1,58 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'expenses'
 
+# Под ASGI (uvicorn) страницы только для чтения обслуживают async-версии
+if settings.ASYNC_VIEWS:
+    dashboard_view = views.AsyncDashboardView
+    graphs_view = views.AsyncGraphsView
+    month_detail_view = views.AsyncMonthDetailView
+else:
+    dashboard_view = views.DashboardView
+    graphs_view = views.GraphsView
+    month_detail_view = views.MonthDetailView
+
 urlpatterns = [
-    path('', views.DashboardView.as_view(), name='dashboard'),
+    path('', dashboard_view.as_view(), name='dashboard'),
     path('register/', views.RegisterView.as_view(), name='registration_register'),
     path('add-expense/', views.AddExpenseView.as_view(), name='add_expense'),
     path('edit-expense/<int:pk>/', views.UpdateExpenseView.as_view(), name='edit_expense'),
     path('delete-expense/<int:pk>/', views.DeleteExpenseView.as_view(), name='delete_expense'),
     path('add-meter-reading/', views.AddMeterReadingView.as_view(), name='add_meter_reading'),
     path('add-payment/', views.AddPaymentView.as_view(), name='add_payment'),
-    path('graphs/', views.GraphsView.as_view(), name='graphs'),
-    path('month/<int:year>/<int:month>/', views.MonthDetailView.as_view(), name='month_detail'),
+    path('graphs/', graphs_view.as_view(), name='graphs'),
+    path('month/<int:year>/<int:month>/', month_detail_view.as_view(), name='month_detail'),
+    path('month/<int:year>/<int:month>/expenses/', views.MonthExpensesView.as_view(), name='month_expenses'),
+    path('month/<int:year>/<int:month>/readings/', views.MonthReadingsView.as_view(), name='month_readings'),
+    path('month/<int:year>/<int:month>/payments/', views.MonthPaymentsView.as_view(), name='month_payments'),
     path('data-filter/', views.DataFilterView.as_view(), name='data_filter'),
+    path('data-filter/export/', views.DataExportView.as_view(), name='data_export'),
+    path('import/', views.ImportDataView.as_view(), name='import_data'),
     path('export-pdf/<int:year>/<int:month>/', views.PDFExportView.as_view(), name='export_pdf'),
+    path('export-pdf/batch/', views.PDFBatchExportView.as_view(), name='export_pdf_batch'),
+    path('export-pdf/job/<int:pk>/', views.PDFExportStatusView.as_view(), name='export_pdf_status'),
+    path('export-pdf/job/<int:pk>/download/', views.PDFExportDownloadView.as_view(), name='export_pdf_download'),
     path('month/<int:year>/<int:month>/pay-all/', views.PayAllView.as_view(), name='pay_all'),
+    path('reverse-payment/<int:pk>/', views.ReversePaymentView.as_view(), name='reverse_payment'),
     path('edit-meter-reading/<int:pk>/', views.UpdateMeterReadingView.as_view(), name='edit_meter_reading'),
     path('delete-meter-reading/<int:pk>/', views.DeleteMeterReadingView.as_view(), name='delete_meter_reading'),
-]
\ No newline at end of file
+    path('apartments/', views.PortfolioView.as_view(), name='portfolio'),
+    path('apartments/add/', views.AddApartmentView.as_view(), name='add_apartment'),
+    path('apartments/<int:pk>/select/', views.SelectApartmentView.as_view(), name='select_apartment'),
+    path('reports/debt-aging/', views.DebtAgingView.as_view(), name='debt_aging'),
+    path('reports/debt-aging/export/', views.DebtAgingExportView.as_view(), name='debt_aging_export'),
+    path('perf/', views.PerfStatsView.as_view(), name='perf_stats'),
+
+    # JSON API
+    path('api/expenses/', api.ExpenseListApiView.as_view(), name='api_expenses'),
+    path('api/expenses/<int:pk>/', api.ExpenseDetailApiView.as_view(), name='api_expense'),
+    path('api/payments/', api.PaymentListApiView.as_view(), name='api_payments'),
+    path('api/payments/<int:pk>/', api.PaymentDetailApiView.as_view(), name='api_payment'),
+    path('api/payments/preview/', api.PaymentPreviewApiView.as_view(), name='api_payment_preview'),
+    path('api/meter-readings/', api.MeterReadingListApiView.as_view(), name='api_meter_readings'),
+    path('api/meter-readings/<int:pk>/', api.MeterReadingDetailApiView.as_view(), name='api_meter_reading'),
+    path('api/summary/<int:year>/', api.YearSummaryApiView.as_view(), name='api_year_summary'),
+    path('api/summary/<int:year>/<int:month>/', api.MonthSummaryApiView.as_view(), name='api_month_summary'),
+]
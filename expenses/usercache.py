@@ -0,0 +1,132 @@
+import hashlib
+import uuid
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+
+BLOCK_TIMEOUT = 60 * 60 * 24
+
+# Кэшируемые блоки — для статистики попаданий
+BLOCKS = ('year_summary', 'month_summary', 'consumption', 'open_debts', 'portfolio')
+
+
+def _generation_key(user_id):
+    return f"usercache:generation:{user_id}"
+
+
+def _new_generation():
+    # Случайное значение вместо incr: set атомарен в любом общем кэше (incr в DatabaseCache —
+    # это get + set), а значение, которого ещё не было, не совпадёт ни с одним старым поколением
+    return uuid.uuid4().hex
+
+
+def generation(user_id):
+    """
+    Текущее поколение данных пользователя — часть ключа каждого блока.
+    Если его вытеснят из кэша, новое поколение не совпадёт со старым
+    и устаревшие блоки не всплывут.
+    """
+    return cache.get_or_set(_generation_key(user_id), _new_generation, None)
+
+
+def _renew(user_id):
+    cache.set(_generation_key(user_id), _new_generation(), None)
+
+
+def bump(user_id):
+    """
+    Данные пользователя изменились — все его блоки становятся недействительными.
+    Сдвигаем поколение сразу (чтобы та же транзакция не прочитала старый блок)
+    и ещё раз после коммита: параллельный запрос мог успеть закэшировать
+    данные до коммита под уже новым поколением.
+    """
+    _renew(user_id)
+    transaction.on_commit(lambda: _renew(user_id))
+
+
+def etag(user_id, *parts):
+    """
+    Сильный ETag ответа, который зависит только от данных пользователя и parts
+    (URL и т. п.). Считается без запросов к БД — по текущему поколению.
+    """
+    key = ':'.join([str(generation(user_id)), date.today().isoformat(), *map(str, parts)])
+    return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def _count(block, outcome):
+    key = f"usercache:stats:{block}:{outcome}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass  # ключ вытеснили между add и incr — один замер не важен
+
+
+def _block_key(user_id, block, generation, params):
+    return f"usercache:{block}:{user_id}:{generation}:{params}"
+
+
+def get_or_compute(user_id, block, params, compute):
+    """
+    Блок контекста из кэша или compute(), если его нет для текущего поколения.
+    params — всё остальное, от чего зависит блок (год, сегодняшняя дата и т. п.).
+    """
+    key = _block_key(user_id, block, generation(user_id), params)
+    value = cache.get(key)
+    if value is not None:
+        _count(block, 'hit')
+        return value
+
+    _count(block, 'miss')
+    value = compute()
+    cache.set(key, value, BLOCK_TIMEOUT)
+    return value
+
+
+# === То же для async-представлений (асинхронный API кэша Django) ===
+
+async def ageneration(user_id):
+    return await cache.aget_or_set(_generation_key(user_id), _new_generation, None)
+
+
+async def _acount(block, outcome):
+    key = f"usercache:stats:{block}:{outcome}"
+    await cache.aadd(key, 0, None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        pass
+
+
+async def aget_or_compute(user_id, block, params, compute):
+    """get_or_compute, где compute() возвращает корутину"""
+    key = _block_key(user_id, block, await ageneration(user_id), params)
+    value = await cache.aget(key)
+    if value is not None:
+        await _acount(block, 'hit')
+        return value
+
+    await _acount(block, 'miss')
+    value = await compute()
+    await cache.aset(key, value, BLOCK_TIMEOUT)
+    return value
+
+
+def stats(blocks=BLOCKS):
+    """Попадания и промахи по каждому блоку"""
+    counters = cache.get_many([
+        f"usercache:stats:{block}:{outcome}" for block in blocks for outcome in ('hit', 'miss')
+    ])
+    report = []
+    for block in blocks:
+        hits = counters.get(f"usercache:stats:{block}:hit", 0)
+        misses = counters.get(f"usercache:stats:{block}:miss", 0)
+        total = hits + misses
+        report.append({
+            'block': block,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0,
+        })
+    return report
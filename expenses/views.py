@@ -1,98 +1,93 @@
-from django.views.generic import TemplateView, CreateView, UpdateView, DeleteView, View
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
-from django.db.models import Sum, F
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-from django.shortcuts import redirect
+from django.views.generic import TemplateView, CreateView, UpdateView, DeleteView, FormView, View
+from django.views.generic.base import ContextMixin, TemplateResponseMixin
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.urls import reverse, reverse_lazy
+from django.db.models import Sum
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
+from django.conf import settings
 from django.db import transaction
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
+import asyncio
+import csv
+import io
 import json
+import os
 
 from .models import (
-    Expense, MeterReading, Payment, Credit, ExpenseCategory, PaymentAllocation
+    Apartment, Credit, Expense, MeterReading, Payment, PDFExportJob
 )
-from .forms import ExpenseForm, MeterReadingForm, PaymentForm, RegisterForm
-from django.db.models import Sum, F, Min
+from .forms import (
+    ApartmentForm, ExpenseForm, MeterReadingForm, PaymentForm, RegisterForm, DataFilterForm, DataExportForm, ImportForm
+)
+from .services import (
+    acached_year_summary, alist, auser_apartment, cached_portfolio, cached_year_summary, date_range, filter_range,
+    month_expenses, month_payments, month_readings, open_credit_total, user_apartment
+)
+from .allocation import allocate_payment, apply_credits, load_open_debts, reverse_payments
+from .importers import IMPORT_COLUMNS, import_csv
+from . import aging, consumption, exports, pdf, perf, usercache
 
 
-class DashboardView(LoginRequiredMixin, TemplateView):
-    template_name = 'expenses/dashboard.html'
+class ApartmentMixin:
+    """
+    Текущая квартира пользователя — выбранная в сессии (SelectApartmentView)
+    или основная. Все данные страниц берутся только по ней.
+    """
+
+    @cached_property
+    def apartment(self):
+        apartment = user_apartment(self.request.user, self.request.session.get('apartment_id'))
+        if apartment is None:
+            # Пользователь без квартир (например, созданный вручную) — заводим основную
+            apartment = Apartment.objects.create(user=self.request.user)
+        return apartment
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        today = datetime.today()
+        context['apartment'] = self.apartment
+        return context
 
+
+class SelectedYearMixin:
+    def get_selected_year(self):
+        today = datetime.today()
         # Выбранный год из GET (по умолчанию текущий)
         selected_year_str = self.request.GET.get('year')
         try:
-            selected_year = int(selected_year_str) if selected_year_str else today.year
+            return int(selected_year_str) if selected_year_str else today.year
         except (ValueError, TypeError):
-            selected_year = today.year
+            return today.year
 
-        # Диапазон лет
-        agg = Expense.objects.filter(user=self.request.user).aggregate(
-            min_year=Min('date__year')
-        )
-        min_year = agg['min_year'] or today.year
-        max_year = today.year + 1
-        years = list(range(min_year, max_year + 1))
 
-        context['selected_year'] = selected_year
-        context['years'] = years
-
-        # Месяцы для выбранного года
-        months = []
-        for i in range(12):
-            month_date = datetime(selected_year, 1, 1) + relativedelta(months=i)
-            expenses = list(Expense.objects.filter(
-                user=self.request.user,
-                date__year=selected_year,
-                date__month=month_date.month
-            ))
-            total_debt = sum(e.debt for e in expenses)
-            status = 'future' if month_date > today else ('green' if total_debt <= 0 else 'red')
-
-            months.append({
-                'year': selected_year,
-                'month': month_date.month,
-                'name': month_date.strftime('%b'),
-                'status': status
-            })
-        context['months'] = months
-
-        # Сводка за выбранный год
-        year_expenses = list(Expense.objects.filter(
-            user=self.request.user,
-            date__year=selected_year
-        ))
-        total_amount = sum(e.amount for e in year_expenses)
-        total_paid = sum(e.paid_amount for e in year_expenses)
-        total_debt = total_amount - total_paid
-        credit = Credit.objects.filter(user=self.request.user).aggregate(
-            Sum('amount')
-        )['amount__sum'] or 0
-
-        context['year_summary'] = {
-            'total_amount': total_amount,
-            'total_paid': total_paid,
-            'total_debt': total_debt,
-            'credit': credit
-        }
+class YearSummaryMixin(ApartmentMixin, SelectedYearMixin):
+    """Выбранный год, статусы месяцев и сводка за год для dashboard и графиков"""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        selected_year = self.get_selected_year()
 
+        context['selected_year'] = selected_year
+        context.update(cached_year_summary(self.apartment, selected_year))
         return context
 
 
+class DashboardView(LoginRequiredMixin, YearSummaryMixin, TemplateView):
+    template_name = 'expenses/dashboard.html'
+
+
 class RegisterView(CreateView):
     form_class = RegisterForm
     template_name = 'registration/register.html'
     success_url = reverse_lazy('login')
 
 
-class AddExpenseView(LoginRequiredMixin, CreateView):
+class AddExpenseView(LoginRequiredMixin, ApartmentMixin, CreateView):
     model = Expense
     form_class = ExpenseForm
     template_name = 'expenses/add_expense.html'
@@ -101,11 +96,20 @@ class AddExpenseView(LoginRequiredMixin, CreateView):
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['user'] = self.request.user
+        kwargs['apartment'] = self.apartment
         return kwargs
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        form.instance.apartment = self.apartment
+        with transaction.atomic():
+            response = super().form_valid(form)
+            # Накопленная переплата сразу гасит новый долг
+            applications = apply_credits(self.apartment, [self.object])
+        if applications:
+            messages.info(self.request, _("Из переплаты зачтено {amount} € в счёт расхода.").format(
+                amount=sum(a.amount for a in applications)))
+        return response
 
     def get_success_url(self):
         # Берём year сначала из POST (из скрытого поля формы), если нет — из GET
@@ -148,7 +152,7 @@ class DeleteExpenseView(LoginRequiredMixin, DeleteView):
         return context
 
 
-class AddMeterReadingView(LoginRequiredMixin, CreateView):
+class AddMeterReadingView(LoginRequiredMixin, ApartmentMixin, CreateView):
     model = MeterReading
     form_class = MeterReadingForm
     template_name = 'expenses/add_meter_reading.html'
@@ -156,6 +160,7 @@ class AddMeterReadingView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
+        form.instance.apartment = self.apartment
         return super().form_valid(form)
 
     # Добавляем этот метод
@@ -167,7 +172,7 @@ class AddMeterReadingView(LoginRequiredMixin, CreateView):
         return url
 
 
-class AddPaymentView(LoginRequiredMixin, CreateView):
+class AddPaymentView(LoginRequiredMixin, ApartmentMixin, CreateView):
     model = Payment
     form_class = PaymentForm
     template_name = 'expenses/add_payment.html'
@@ -175,58 +180,17 @@ class AddPaymentView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        payment = form.save()
-
-        # Авто-распределение только если платёж "общий" (без категории)
-        if not getattr(payment, 'category', None):
-            remaining = payment.amount  # Сколько осталось распределить
-
-            # Получаем все долги на текущий момент (по приоритету категорий)
-            categories = ExpenseCategory.objects.filter(user=self.request.user).order_by('priority')
-
-            with transaction.atomic():
-                for category in categories:
-                    if remaining <= 0:
-                        break
-
-                    # Находим все расходы в этой категории с долгом (любой месяц!)
-                    expenses = Expense.objects.filter(
-                        user=self.request.user,
-                        category=category,
-                        paid_amount__lt=F('amount')
-                    ).order_by('date')
-
-                    for expense in expenses:
-                        if remaining <= 0:
-                            break
-
-                        current_debt = expense.debt  # Пересчитываем долг на момент
-                        if current_debt <= 0:
-                            continue
-
-                        pay_here = min(current_debt, remaining)
-
-                        # Погашаем
-                        expense.paid_amount = F('paid_amount') + pay_here
-                        expense.save(update_fields=['paid_amount'])
-
-                        PaymentAllocation.objects.create(
-                            payment=payment,
-                            expense=expense,
-                            amount=pay_here
-                        )
-
-                        remaining -= pay_here
-
-                # Если после всего остался остаток → создаём кредит
-                if remaining > 0:
-                    Credit.objects.create(
-                        user=self.request.user,
-                        amount=remaining,
-                        date=payment.date
-                    )
-                    messages.info(self.request,
-                        _("Часть платежа ({amount} €) зачислена как переплата (кредит) на будущие месяцы.").format(amount=remaining))
+        form.instance.apartment = self.apartment
+
+        with transaction.atomic():
+            payment = form.save()
+            # Авто-распределение по долгам (по приоритету категорий, любой месяц)
+            allocations, credit = allocate_payment(payment)
+
+        # Если после всего остался остаток → создан кредит
+        if credit:
+            messages.info(self.request,
+                _("Часть платежа ({amount} €) зачислена как переплата (кредит) на будущие месяцы.").format(amount=credit.amount))
 
         messages.success(self.request, _("Платёж успешно добавлен и распределён."))
         return redirect(self.success_url)
@@ -240,180 +204,354 @@ class AddPaymentView(LoginRequiredMixin, CreateView):
         return url
 
 
-class GraphsView(LoginRequiredMixin, TemplateView):
+class GraphsView(LoginRequiredMixin, YearSummaryMixin, TemplateView):
     template_name = 'expenses/graphs.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        today = datetime.today()
+        context.update(consumption.chart_context(self.apartment, context['selected_year']))
+        return context
 
-        # Выбранный год из GET-параметра (по умолчанию текущий)
-        selected_year_str = self.request.GET.get('year')
+
+class SelectedMonthMixin:
+    def get_selected_month(self):
+        # Месяц из URL; несуществующий (0, 13, …) — 404, а не ошибка сервера
         try:
-            selected_year = int(selected_year_str) if selected_year_str else today.year
-        except (ValueError, TypeError):
-            selected_year = today.year
+            return datetime(self.kwargs['year'], self.kwargs['month'], 1)
+        except ValueError:
+            raise Http404(_("Такого месяца нет."))
 
-        # Диапазон лет: от самого старого расхода до текущего +1
-        min_year = Expense.objects.filter(user=self.request.user).aggregate(
-            min_year=Min('date__year')
-        )['min_year'] or today.year
-        max_year = today.year + 1
-        years = list(range(min_year, max_year + 1))
 
-        context['selected_year'] = selected_year
-        context['years'] = years
-
-        # Месяцы для выбранного года
-        months = []
-        for i in range(12):
-            month_date = datetime(selected_year, 1, 1) + relativedelta(months=i)
-            expenses = list(Expense.objects.filter(
-                user=self.request.user,
-                date__year=selected_year,
-                date__month=month_date.month
-            ))
-            total_debt = sum(e.debt for e in expenses)
-            status = 'future' if month_date > today else ('green' if total_debt <= 0 else 'red')
-
-            months.append({
-                'year': selected_year,
-                'month': month_date.month,
-                'name': month_date.strftime('%b'),
-                'status': status
-            })
-        context['months'] = months
-
-        # Сводка за выбранный год
-        year_expenses = list(Expense.objects.filter(
-            user=self.request.user,
-            date__year=selected_year
-        ))
-        total_amount = sum(e.amount for e in year_expenses)
-        total_paid = sum(e.paid_amount for e in year_expenses)
-        total_debt = total_amount - total_paid
-        credit = Credit.objects.filter(user=self.request.user).aggregate(
-            Sum('amount')
-        )['amount__sum'] or 0
-
-        context['year_summary'] = {
-            'total_amount': total_amount,
-            'total_paid': total_paid,
-            'total_debt': total_debt,
-            'credit': credit
-        }
+class MonthDetailView(LoginRequiredMixin, SelectedMonthMixin, TemplateView):
+    """
+    Каркас страницы месяца: рендерится сразу, без запросов к данным.
+    Разделы подгружаются отдельно через MonthSectionView.
+    """
+    template_name = 'expenses/month_detail.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['month'] = self.get_selected_month()
         return context
 
 
-class MonthDetailView(LoginRequiredMixin, TemplateView):
-    template_name = 'expenses/month_detail.html'
+class MonthSectionView(LoginRequiredMixin, ApartmentMixin, SelectedMonthMixin, TemplateView):
+    """
+    Один раздел страницы месяца (HTML-фрагмент). ETag — от поколения данных
+    пользователя, поэтому неизменившийся раздел отдаётся как 304 без запросов к данным.
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.get_selected_month()
+        # Во фрагменте есть CSRF-токен — при смене cookie фрагмент должен обновиться
+        etag = usercache.etag(request.user.pk, request.get_full_path(),
+                              request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+                              request.session.get('apartment_id', ''))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['month'] = self.get_selected_month()
+        context.update(self.get_section(self.apartment, self.kwargs['year'], self.kwargs['month']))
+        return context
+
+    def get_section(self, apartment, year, month):
+        """Данные раздела для шаблона; разделы-наследники переопределяют"""
+        return {}
+
+
+class MonthExpensesView(MonthSectionView):
+    template_name = 'expenses/partials/month_expenses.html'
+
+    def get_section(self, apartment, year, month):
+        expenses = list(month_expenses(apartment, year, month))
+        return {'expenses': expenses, 'total_debt': sum(e.debt for e in expenses)}
+
+
+class MonthReadingsView(MonthSectionView):
+    template_name = 'expenses/partials/month_readings.html'
+
+    def get_section(self, apartment, year, month):
+        return {'meter_readings': list(month_readings(apartment, year, month))}
+
+
+class MonthPaymentsView(MonthSectionView):
+    template_name = 'expenses/partials/month_payments.html'
+
+    def get_section(self, apartment, year, month):
+        payments = list(month_payments(apartment, year, month))
+        return {
+            'payments': payments,
+            'total_payments': sum(p.amount for p in payments),
+            'credit': open_credit_total(apartment),
+        }
+
+
+# === Async-версии страниц только для чтения (ASGI, settings.ASYNC_VIEWS) ===
+
+class AsyncLoginRequiredMixin:
+    """LoginRequiredMixin для async-представлений: пользователь грузится через request.auser()"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user
+        # Текущая квартира, как у ApartmentMixin; сессия читается асинхронно
+        self.apartment = await auser_apartment(user, await request.session.aget('apartment_id'))
+        if self.apartment is None:
+            self.apartment = await Apartment.objects.acreate(user=user)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncTemplateView(TemplateResponseMixin, ContextMixin, View):
+    """TemplateView, который готовит контекст асинхронно (aget_context_data)"""
+
+    async def aget_context_data(self, **kwargs):
+        context = self.get_context_data(**kwargs)
+        context['apartment'] = getattr(self, 'apartment', None)
+        return context
+
+    async def get(self, request, *args, **kwargs):
+        context = await self.aget_context_data(**kwargs)
+        return self.render_to_response(context)
+
+
+class AsyncYearSummaryMixin(SelectedYearMixin):
+    async def aget_context_data(self, **kwargs):
+        context = await super().aget_context_data(**kwargs)
+        selected_year = self.get_selected_year()
+
+        context['selected_year'] = selected_year
+        context.update(await acached_year_summary(self.apartment, selected_year))
+        return context
+
+
+class AsyncDashboardView(AsyncLoginRequiredMixin, AsyncYearSummaryMixin, AsyncTemplateView):
+    template_name = 'expenses/dashboard.html'
+
+
+class AsyncGraphsView(AsyncLoginRequiredMixin, AsyncYearSummaryMixin, AsyncTemplateView):
+    template_name = 'expenses/graphs.html'
+
+    async def aget_context_data(self, **kwargs):
+        context = await super().aget_context_data(**kwargs)
+        context.update(await consumption.achart_context(self.apartment, context['selected_year']))
+        return context
+
+
+class AsyncMonthDetailView(AsyncLoginRequiredMixin, SelectedMonthMixin, AsyncTemplateView):
+    template_name = 'expenses/month_detail.html'
+
+    async def aget_context_data(self, **kwargs):
+        selected_month = self.get_selected_month()
+        context = await super().aget_context_data(**kwargs)
         year = self.kwargs['year']
         month = self.kwargs['month']
-
-        expenses = list(Expense.objects.filter(
-            user=self.request.user,
-            date__year=year,
-            date__month=month
-        ))
+        apartment = self.apartment
+
+        # Под ASGI разделы дешевле собрать сразу: независимые запросы запускаются вместе
+        expenses, meter_readings, payments, credit = await asyncio.gather(
+            alist(month_expenses(apartment, year, month)),
+            alist(month_readings(apartment, year, month)),
+            alist(month_payments(apartment, year, month)),
+            Credit.objects.filter(apartment=apartment, remaining__gt=0).aaggregate(total=Sum('remaining')),
+        )
 
         context.update({
+            'sections_loaded': True,
             'expenses': expenses,
-            'meter_readings': list(MeterReading.objects.filter(
-                user=self.request.user,
-                date__year=year,
-                date__month=month
-            )),
-            'total_payments': Payment.objects.filter(
-                user=self.request.user,
-                date__year=year,
-                date__month=month
-            ).aggregate(total=Sum('amount'))['total'] or 0,
+            'meter_readings': meter_readings,
+            'payments': payments,
+            'total_payments': sum(p.amount for p in payments),
+            'credit': credit['total'] or 0,
             'total_debt': sum(e.debt for e in expenses),
-            'month': datetime(year, month, 1)
+            'month': selected_month
         })
-
         return context
 
 
-class DataFilterView(LoginRequiredMixin, TemplateView):
+class DataFilterView(LoginRequiredMixin, ApartmentMixin, TemplateView):
     template_name = 'expenses/data_filter.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = DataFilterForm(self.request.GET or None)
+        context['form'] = form
+        context['export_kinds'] = DataExportForm.KIND_CHOICES
+
+        if form.is_valid():
+            context.update(filter_range(self.apartment, **form.cleaned_data))
+            # Ссылка на следующую страницу — те же параметры + новый курсор
+            if context['next_cursor']:
+                params = self.request.GET.copy()
+                params['after'] = context['next_cursor']
+                context['next_query'] = params.urlencode()
+        return context
+
+
+class DataExportView(LoginRequiredMixin, ApartmentMixin, View):
+    """Потоковая выгрузка выборки в CSV (или XLSX) без сборки файла в памяти"""
+
+    def get(self, request):
+        form = DataExportForm(request.GET)
+        if not form.is_valid():
+            messages.error(request, _("Укажите корректный период для выгрузки."))
+            return redirect('expenses:data_filter')
+
+        data = form.cleaned_data
+        rows = exports.export_rows(data['kind'], self.apartment, data['start_date'], data['end_date'])
+        filename = f"{data['kind']}_{data['start_date']:%Y%m%d}_{data['end_date']:%Y%m%d}"
+
+        if data['format'] == 'xlsx':
+            try:
+                output = exports.write_xlsx(rows, title=data['kind'])
+            except ImportError:
+                messages.error(request, _("Выгрузка в XLSX недоступна: не установлен openpyxl."))
+                return redirect('expenses:data_filter')
+            return FileResponse(output, as_attachment=True, filename=f"{filename}.xlsx")
+
+        response = StreamingHttpResponse(exports.stream_csv(rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+
+
+class ImportDataView(LoginRequiredMixin, ApartmentMixin, FormView):
+    form_class = ImportForm
+    template_name = 'expenses/import_data.html'
+    success_url = reverse_lazy('expenses:import_data')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['columns'] = IMPORT_COLUMNS
+        return context
+
+    def form_valid(self, form):
+        stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+        try:
+            result = import_csv(self.apartment, form.cleaned_data['kind'], stream)
+        except (UnicodeDecodeError, csv.Error):
+            messages.error(self.request, _("Не удалось прочитать файл: ожидается CSV в кодировке UTF-8."))
+            return redirect(self.success_url)
+
+        messages.success(self.request, _("Импорт завершён: создано {created}, пропущено дубликатов {skipped}.").format(
+            created=result['created'], skipped=result['skipped']))
+        for line, error in result['errors'][:20]:
+            messages.warning(self.request, _("Строка {line}: {error}").format(line=line, error=error))
+        if len(result['errors']) > 20:
+            messages.warning(self.request, _("…и ещё ошибок: {n}").format(n=len(result['errors']) - 20))
+        return redirect(self.success_url)
 
-class PDFExportView(LoginRequiredMixin, TemplateView):
-    template_name = 'expenses/pdf_export.html'
+
+class PDFExportView(LoginRequiredMixin, ApartmentMixin, TemplateView):
+    template_name = 'expenses/pdf_export_status.html'
 
     def get(self, request, *args, **kwargs):
         year, month = self.kwargs['year'], self.kwargs['month']
-        expenses = Expense.objects.filter(user=self.request.user, date__year=year, date__month=month)
+        return self.export((year, month), (year, month), pdf.FORMAT_PDF)
 
-        context = {
-            'month': datetime(year, month, 1),
-            'expenses': expenses,
-            'meter_readings': MeterReading.objects.filter(user=self.request.user, date__year=year, date__month=month),
-            'total_debt': sum(e.debt for e in expenses),
-            'total_payments': Payment.objects.filter(
-                user=self.request.user,
-                date__year=year,
-                date__month=month
-            ).aggregate(total=Sum('amount'))['total'] or 0
-        }
+    def export(self, start, end, fmt):
+        path, job = pdf.get_or_enqueue(self.apartment, start, end, fmt)
 
-        html = render_to_string(self.template_name, context)
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="report_{year}_{month}.pdf"'
+        # Данные не менялись с прошлого экспорта — отдаём готовый файл
+        if path:
+            return FileResponse(open(path, 'rb'), as_attachment=True,
+                                filename=pdf.report_filename(start, end, fmt))
+
+        return self.render_to_response(self.get_context_data(
+            job=job,
+            month=datetime(*start, 1),
+            end_month=datetime(*end, 1) if end != start else None,
+        ))
 
-        from weasyprint import HTML
-        HTML(string=html).write_pdf(response)
-        return response
 
+class PDFBatchExportView(PDFExportView):
+    """Отчёт за год или за период: один PDF на все месяцы или ZIP помесячных PDF"""
 
-class PayAllView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get('format', pdf.FORMAT_PDF)
+        try:
+            if request.GET.get('year'):
+                year = int(request.GET['year'])
+                start, end = (year, 1), (year, 12)
+            else:
+                # <input type="month"> присылает YYYY-MM
+                start = tuple(int(part) for part in request.GET['start'].split('-')[:2])
+                end = tuple(int(part) for part in request.GET['end'].split('-')[:2])
+            months = len(list(pdf.iter_months(start, end)))
+        except (KeyError, ValueError, TypeError):
+            months = 0
+
+        if fmt not in (pdf.FORMAT_PDF, pdf.FORMAT_ZIP) or not 0 < months <= pdf.MAX_BATCH_MONTHS:
+            messages.error(request, _("Укажите корректный период (не более {n} месяцев).").format(n=pdf.MAX_BATCH_MONTHS))
+            return redirect('expenses:dashboard')
+
+        return self.export(start, end, fmt)
+
+
+class PDFExportStatusView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job = pdf.fail_unclaimed(get_object_or_404(PDFExportJob, pk=pk, user=request.user))
+        data = {'status': job.status, 'error': job.error}
+        if job.status == PDFExportJob.STATUS_DONE:
+            data['download_url'] = reverse('expenses:export_pdf_download', args=[job.pk])
+        return JsonResponse(data)
+
+
+class PDFExportDownloadView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job = get_object_or_404(PDFExportJob, pk=pk, user=request.user, status=PDFExportJob.STATUS_DONE)
+        path = pdf.cache_path(job.content_hash, job.format)
+        if not os.path.exists(path):
+            raise Http404(_("Файл отчёта не найден, запросите экспорт заново."))
+        return FileResponse(open(path, 'rb'), as_attachment=True,
+                            filename=pdf.report_filename(job.start, job.end, job.format))
+
+
+class PayAllView(LoginRequiredMixin, ApartmentMixin, SelectedMonthMixin, View):
     def post(self, request, year, month):
-        expenses = Expense.objects.filter(
-            user=request.user,
-            date__year=year,
-            date__month=month,
-            paid_amount__lt=F('amount')
-        )
+        self.get_selected_month()
+        with transaction.atomic():
+            expenses = load_open_debts(
+                self.apartment,
+                **date_range(year, month)
+            )
 
-        total_debt = sum(e.debt for e in expenses)
-        if total_debt <= 0:
-            messages.warning(request, _("Долга нет."))
-            return redirect('expenses:month_detail', year=year, month=month)
+            total_debt = sum(e.debt for e in expenses)
+            if total_debt <= 0:
+                messages.warning(request, _("Долга нет."))
+                return redirect('expenses:month_detail', year=year, month=month)
 
-        with transaction.atomic():
             payment = Payment.objects.create(
                 user=request.user,
+                apartment=self.apartment,
                 amount=total_debt,
                 date=datetime(year, month, 1),
                 description=_("Оплата всего долга за {month}").format(
                     month=datetime(year, month, 1).strftime('%B %Y')
                 )
             )
-
-            remaining = total_debt
-            for expense in expenses:
-                if remaining <= 0:
-                    break
-                pay_here = min(expense.debt, remaining)
-
-                PaymentAllocation.objects.create(
-                    payment=payment,
-                    expense=expense,
-                    amount=pay_here
-                )
-                expense.paid_amount = F('paid_amount') + pay_here
-                expense.save(update_fields=['paid_amount'])
-                remaining -= pay_here
+            allocate_payment(payment, debts=expenses, create_credit=False)
 
         messages.success(request, _("Оплачено €{:.2f} одной суммой!").format(total_debt))
         return redirect('expenses:month_detail', year=year, month=month)
 
 
+class ReversePaymentView(LoginRequiredMixin, View):
+    """Удалить платёж, вернув долг расходам, которые он погасил"""
+
+    def post(self, request, pk):
+        payment = get_object_or_404(Payment.objects.select_related('apartment'), pk=pk, user=request.user)
+        reverse_payments(payment.apartment, [payment.pk])
+        messages.success(request, _("Платёж €{:.2f} отменён, долг восстановлен.").format(payment.amount))
+        return redirect('expenses:month_detail', year=payment.date.year, month=payment.date.month)
+
+
 class UpdateMeterReadingView(LoginRequiredMixin, UpdateView):
     model = MeterReading
     form_class = MeterReadingForm
@@ -451,4 +589,85 @@ class DeleteMeterReadingView(LoginRequiredMixin, DeleteView):
         url = reverse_lazy('expenses:dashboard')
         if year:
             url += f'?year={year}'
-        return url
\ No newline at end of file
+        return url
+
+
+class StaffRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class PerfStatsView(StaffRequiredMixin, TemplateView):
+    template_name = 'expenses/perf_stats.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['report'] = perf.summarize(perf.load_samples())
+        context['query_budget'] = settings.PERF_QUERY_BUDGET
+        context['cache_stats'] = usercache.stats()
+        return context
+
+
+class DebtAgingMixin:
+    def get_group_by(self):
+        # Разрез отчёта: по квартирам (по умолчанию) или по пользователям
+        by = self.request.GET.get('by')
+        return by if by in aging.AGING_GROUPS else 'apartment'
+
+
+class DebtAgingView(StaffRequiredMixin, DebtAgingMixin, TemplateView):
+    """Старение долгов по всем квартирам: корзины 0–30, 31–60, 61–90 и 90+ дней"""
+    template_name = 'expenses/debt_aging.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['group_by'] = self.get_group_by()
+        context.update(aging.aging_summary(by=context['group_by']))
+        return context
+
+
+class DebtAgingExportView(StaffRequiredMixin, DebtAgingMixin, View):
+    """Тот же отчёт в CSV с разбивкой по категориям, потоком"""
+
+    def get(self, request):
+        by = self.get_group_by()
+        rows = aging.aging_csv_rows(by)
+        response = StreamingHttpResponse(exports.stream_csv(rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="debt_aging_{by}_{datetime.today():%Y%m%d}.csv"'
+        return response
+
+
+class PortfolioView(LoginRequiredMixin, SelectedYearMixin, TemplateView):
+    """Сводка по всем квартирам пользователя за выбранный год"""
+    template_name = 'expenses/portfolio.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        selected_year = self.get_selected_year()
+        context['selected_year'] = selected_year
+        context.update(cached_portfolio(self.request.user, selected_year))
+        return context
+
+
+class SelectApartmentView(LoginRequiredMixin, View):
+    """Сделать квартиру текущей: её id запоминается в сессии"""
+
+    def post(self, request, pk):
+        apartment = get_object_or_404(Apartment, pk=pk, user=request.user)
+        request.session['apartment_id'] = apartment.pk
+        messages.success(request, _("Текущая квартира: {apartment}.").format(apartment=apartment))
+        return redirect('expenses:dashboard')
+
+
+class AddApartmentView(LoginRequiredMixin, CreateView):
+    model = Apartment
+    form_class = ApartmentForm
+    template_name = 'expenses/add_apartment.html'
+    success_url = reverse_lazy('expenses:portfolio')
+
+    def form_valid(self, form):
+        form.instance.user = self.request.user
+        response = super().form_valid(form)
+        usercache.bump(self.request.user.pk)
+        messages.success(self.request, _("Квартира добавлена."))
+        return response